@@ -0,0 +1,136 @@
+import math
+
+import numpy as np
+
+from pyofx import *
+
+
+def turning_points(time_history):
+    """the peaks and troughs of `time_history` (including the first and last points) with
+    repeated values and points on a monotonic slope removed"""
+    x = np.asarray(time_history, dtype=float)
+    if len(x) == 0:
+        return x.copy()
+    x = x[np.concatenate(([True], np.diff(x) != 0))]
+    if len(x) < 3:
+        return x
+    d = np.sign(np.diff(x))
+    turning = np.concatenate(([True], d[1:] != d[:-1], [True]))
+    return x[turning]
+
+
+def rainflow(time_history):
+    """(ranges, counts) arrays of the rainflow cycles in `time_history` by the ASTM E1049
+    four-point method. Counts are 1.0 for full cycles and 0.5 for the half cycles of the
+    residue.
+
+    Every inner range no larger than its neighbours is removed as a full cycle in one
+    pass over the turning points with numpy, and passes are repeated until only the
+    residue is left (the cycles found do not depend on the order they are removed in)."""
+    x = turning_points(time_history)
+    ranges = []
+    while len(x) >= 4:
+        r = np.abs(np.diff(x))
+        inner = (r[1:-1] <= r[:-2]) & (r[1:-1] <= r[2:])
+        if not inner.any():
+            break
+        # the first of each run of inner ranges, so the points removed do not overlap
+        first = inner.copy()
+        first[1:] &= ~inner[:-1]
+        ranges.append(r[1:-1][first])
+        keep = np.ones(len(x), dtype=bool)
+        removed = np.nonzero(first)[0] + 1
+        keep[removed] = False
+        keep[removed + 1] = False
+        x = x[keep]
+    ranges = np.concatenate(ranges) if ranges else np.zeros(0)
+    residue = np.abs(np.diff(x))
+    return (np.concatenate((ranges, residue)),
+            np.concatenate((np.ones(len(ranges)), np.full(len(residue), 0.5))))
+
+
+class SNCurve(object):
+
+    """ SNCurve - a one or two slope S-N curve, N = a * S ** -m
+
+    log_a1, m1 - the curve for stress ranges above the switch point.
+    log_a2, m2 - the curve below the switch point, if not given the curve is linear.
+    switch_cycles - the number of cycles at the switch point (1e7 as in DNV-RP-C203).
+
+    Stress ranges must be in the units of the curve, e.g. MPa for DNV-RP-C203.
+    """
+
+    def __init__(self, log_a1, m1, log_a2=None, m2=None, switch_cycles=1e7):
+        self.log_a1 = log_a1
+        self.m1 = m1
+        self.log_a2 = log_a1 if log_a2 is None else log_a2
+        self.m2 = m1 if m2 is None else m2
+        self.switch_stress = 10 ** ((log_a1 - math.log10(switch_cycles)) / m1)
+
+    def cycles(self, stress_range):
+        """number of cycles to failure for each stress range"""
+        log_s = np.log10(np.maximum(np.asarray(stress_range, dtype=float), 1e-300))
+        high = log_s >= math.log10(self.switch_stress)
+        log_n = np.where(high, self.log_a1 - self.m1 * log_s, self.log_a2 - self.m2 * log_s)
+        return 10 ** log_n
+
+    def damage(self, ranges, counts=1.0):
+        """Miner's sum of `counts` cycles of each stress range"""
+        ranges = np.asarray(ranges, dtype=float)
+        if len(ranges) == 0:
+            return 0.0
+        return float((np.asarray(counts) / self.cycles(ranges)).sum())
+
+
+def fatigue_damage(stress, sn_curve, scf=1.0):
+    """Miner's damage of each column of the (samples, locations) `stress` array, or of a
+    single time history, with a stress concentration factor `scf` applied."""
+    stress = np.asarray(stress, dtype=float)
+    if stress.ndim == 1:
+        return sn_curve.damage(*rainflow(scf * stress))
+    return np.array([sn_curve.damage(*rainflow(scf * column)) for column in stress.T])
+
+
+def line_stress(model, line_name, variable="Max von Mises Stress", period=None):
+    """(arc lengths, stress) of `variable` at every node of a line, stress is a
+    (samples, nodes) array fetched in a single batch."""
+    if period is None:
+        period = Period(1)
+    line = model[line_name]
+    arc_lengths = np.asarray(line.NodeArclengths)
+    specifications = [TimeHistorySpecification(line, variable, oeNodeNum(n + 1))
+                      for n in range(len(arc_lengths))]
+    return arc_lengths, GetMultipleTimeHistories(specifications, period)
+
+
+def sim_damage(path, line_name, sn_curve, variable="Max von Mises Stress", scf=1.0):
+    """(arc lengths, damage) for the simulation at `path`, damage is the fatigue damage at
+    each node of the line for the duration of the simulation. Raises OFXError if the
+    simulation is not complete."""
+    arc_lengths, stress = line_stress(complete_sim(path), line_name, variable)
+    return arc_lengths, fatigue_damage(stress, sn_curve, scf)
+
+
+def process_fls_folder(directory, line_name, sn_curve, variable="Max von Mises Stress",
+                       scf=1.0, processes=1):
+    """
+    fatigue damage along a line for every sim in `directory`.
+
+    Returns (paths, arc lengths, damage) where damage is a (sims, nodes) array of the
+    damage in each sim, to be weighted by the probability of occurrence of each sim.
+    With processes > 1 (or None for one per cpu) the sims are processed in a pool of
+    worker processes. Sims that are not complete or fail to load are reported and skipped.
+
+    e.g. process_fls_folder(directory, 'Riser', SNCurve(12.164, 3, 15.606, 5))
+    """
+    paths = Models(directory, filetype='sim').paths()
+    jobs = ((path, line_name, sn_curve, variable, scf) for path in paths)
+    done, arc_lengths, damage = [], None, []
+    for job, result, error in process_sims(sim_damage, jobs, processes):
+        if error:
+            print(error)
+            continue
+        done.append(job[0])
+        arc_lengths = result[0]
+        damage.append(result[1])
+    return done, arc_lengths, np.array(damage)
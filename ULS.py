@@ -1,38 +1,346 @@
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from pyofx import *
+
+EULER_GAMMA = 0.5772156649
+
+
+def peaks(time_history, extreme='Max'):
+    """the extreme of each cycle between successive upcrossings of the mean level.
+
+    One peak per cycle declusters the time history so the peaks are (near) independent.
+    For extreme='Min' the troughs are returned. Incomplete cycles at either end are ignored.
+    """
+    sign = _sign(extreme)
+    y = sign * np.asarray(time_history, dtype=float)
+    if len(y) < 3:
+        return np.empty(0)
+    level = y.mean()
+    up = np.flatnonzero((y[:-1] < level) & (y[1:] >= level)) + 1
+    if len(up) < 2:
+        return np.empty(0)
+    return sign * np.maximum.reduceat(y[up[0]:up[-1]], up[:-1] - up[0])
+
+
+def fit_weibull(excess):
+    """(shape, scale) of a 2 parameter Weibull distribution fitted to `excess` (all > 0)
+    by least squares on the Weibull probability plot."""
+    x = np.sort(np.asarray(excess, dtype=float))
+    if len(x) < 2:
+        raise OFXError("At least 2 peaks above the threshold are needed for a Weibull fit.")
+    n = len(x)
+    f = np.arange(1, n + 1) / (n + 1.0)
+    shape, intercept = np.polyfit(np.log(x), np.log(-np.log(1 - f)), 1)
+    return shape, math.exp(-intercept / shape)
+
+
+def fit_gumbel(maxima):
+    """(location, scale) of a Gumbel distribution fitted to `maxima` by the method of
+    moments"""
+    x = np.asarray(maxima, dtype=float)
+    if len(x) < 2:
+        raise OFXError("At least 2 maxima are needed for a Gumbel fit.")
+    return _gumbel(x.mean(), x.std(ddof=1))
+
+
+def _gumbel(mean, std):
+    scale = std * math.sqrt(6) / math.pi
+    return mean - EULER_GAMMA * scale, scale
+
+
+SimSummary = namedtuple('SimSummary', 'peaks samples mean m2 extreme duration')
+
+
+def summarise(time_history, sample_interval, extreme='Max'):
+    """the SimSummary of one simulation's time history needed by ExtremeAccumulator:
+    its peaks, number of samples, mean, sum of squared deviations, extreme and duration."""
+    x = np.asarray(time_history, dtype=float)
+    if len(x) == 0:
+        raise OFXError("Can't summarise an empty time history.")
+    mean = x.mean()
+    sign = _sign(extreme)
+    return SimSummary(peaks(x, extreme), len(x), mean, ((x - mean) ** 2).sum(),
+                      sign * (sign * x).max(), len(x) * sample_interval)
+
+
+class ExtremeAccumulator(object):
+
+    """Peaks and summary moments of any number of simulations in bounded memory.
+
+    Each simulation is added with `add` (or `add_summary` for a precomputed SimSummary) and
+    then discarded. Only the largest `max_peaks` peaks are kept, the smallest of them acting
+    as a running threshold; `excess` raises an OFXError if a discarded peak would have been
+    above the final threshold so the statistics are always the same as keeping every peak.
+    The maxima of each simulation (for Gumbel fits) and the sample moments are kept as
+    running means and sums of squared deviations.
+    """
+
+    def __init__(self, extreme='Max', max_peaks=100000):
+        self.extreme = extreme
+        self.sign = _sign(extreme)
+        self.max_peaks = max_peaks
+        self.sims = 0
+        self.samples = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.duration = 0.0
+        self.extreme_value = None
+        self.maxima_mean = 0.0
+        self.maxima_m2 = 0.0
+        self._peaks = np.empty(0)
+        self._pending = []
+        self._pending_count = 0
+        self._floor = -np.inf
+
+    def add(self, time_history, sample_interval):
+        """add one simulation's time history"""
+        self.add_summary(summarise(time_history, sample_interval, self.extreme))
+
+    def add_summary(self, summary):
+        """add one simulation's SimSummary"""
+        n = self.samples + summary.samples
+        delta = summary.mean - self.mean
+        self.mean += delta * summary.samples / n
+        self.m2 += summary.m2 + delta ** 2 * self.samples * summary.samples / n
+        self.samples = n
+
+        y = self.sign * summary.extreme
+        self.sims += 1
+        delta = y - self.maxima_mean
+        self.maxima_mean += delta / self.sims
+        self.maxima_m2 += delta * (y - self.maxima_mean)
+        if self.extreme_value is None or y > self.sign * self.extreme_value:
+            self.extreme_value = summary.extreme
+        self.duration += summary.duration
+
+        self._pending.append(self.sign * summary.peaks)
+        self._pending_count += len(summary.peaks)
+        if self._pending_count > self.max_peaks:
+            self._compact()
+
+    def _compact(self):
+        y = np.concatenate([self._peaks] + self._pending)
+        self._pending = []
+        self._pending_count = 0
+        if len(y) > self.max_peaks:
+            y = np.partition(y, len(y) - self.max_peaks)
+            self._floor = max(self._floor, y[:len(y) - self.max_peaks].max())
+            y = y[len(y) - self.max_peaks:]
+        self._peaks = y
+
+    @property
+    def std(self):
+        """standard deviation of all the samples"""
+        return math.sqrt(self.m2 / (self.samples - 1)) if self.samples > 1 else 0.0
+
+    @property
+    def running_threshold(self):
+        """peaks at or below this value have been discarded"""
+        return self.sign * self._floor
+
+    def threshold(self, threshold_factor):
+        """the exceedence threshold: threshold_factor applied to the extreme value measured
+        from the mean"""
+        return self.mean + threshold_factor * (self.extreme_value - self.mean)
+
+    def excess(self, threshold):
+        """array of the (positive) amounts each peak exceeds `threshold` by"""
+        self._compact()
+        y_threshold = self.sign * threshold
+        if self._floor > y_threshold:
+            raise OFXError("Peaks above the threshold {} were discarded, increase max_peaks"
+                           " (currently {}).".format(threshold, self.max_peaks))
+        y = self._peaks[self._peaks > y_threshold]
+        return np.sort(y - y_threshold)
+
+    def gumbel(self):
+        """(location, scale) of a Gumbel distribution fitted to the maximum (or negated
+        minimum) of each simulation"""
+        if self.sims < 2:
+            raise OFXError("At least 2 maxima are needed for a Gumbel fit.")
+        return _gumbel(self.maxima_mean, math.sqrt(self.maxima_m2 / (self.sims - 1)))
+
+
+def _sign(extreme):
+    if extreme == 'Max':
+        return 1.0
+    elif extreme == 'Min':
+        return -1.0
+    raise OFXError("extreme needs to be 'Max' or 'Min' not '{}'.".format(extreme))
+
+
+def response_spectrum(time_history, sample_interval, segment_length=None):
+    """(frequencies, density) one sided power spectral density by Welch's method.
+
+    `time_history` is a (samples,) array or a (samples, responses) array of many responses
+    at once. The mean is removed and Hann windowed segments of `segment_length` samples
+    overlapping by 50% are averaged, the default of 2/9 of the record gives 8 segments.
+    Frequencies are in Hz and density is (frequencies,) or (frequencies, responses) in
+    units^2/Hz.
+    """
+    x = np.asarray(time_history, dtype=float)
+    x = x - x.mean(axis=0)
+    n = len(x)
+    if segment_length is None:
+        segment_length = max(2 * n // 9, 2)
+    segment_length = min(segment_length, n)
+    step = max(segment_length // 2, 1)
+    window = np.hanning(segment_length)
+    if x.ndim == 2:
+        window = window[:, None]
+    density = 0.0
+    starts = range(0, n - segment_length + 1, step)
+    for start in starts:
+        segment = x[start:start + segment_length] * window
+        density = density + np.abs(np.fft.rfft(segment, axis=0)) ** 2
+    density = density * sample_interval / ((window ** 2).sum() * len(starts))
+    density[1:] *= 2
+    if segment_length % 2 == 0:
+        density[-1] /= 2
+    return np.fft.rfftfreq(segment_length, sample_interval), density
+
+
+def spectral_moments(frequencies, density, orders=(0, 1, 2, 4)):
+    """list of the spectral moments m_n = integral f^n S(f) df (f in Hz) for n in `orders`,
+    each an array over responses if density is 2D."""
+    df = frequencies[1] - frequencies[0]
+    if np.ndim(density) == 2:
+        frequencies = frequencies[:, None]
+    return [(frequencies ** n * density).sum(axis=0) * df for n in orders]
+
+
+SpectralExtremes = namedtuple('SpectralExtremes', 'mean std tz bandwidth mpm')
+
+
+def spectral_extremes(time_history, sample_interval, duration=10800.0, extreme='Max',
+                      segment_length=None):
+    """short term extreme estimates from the response spectrum, for screening.
+
+    Returns SpectralExtremes(mean, std, tz, bandwidth, mpm), each an array over responses
+    if `time_history` is a (samples, responses) array. tz is the mean zero upcrossing
+    period, bandwidth the spectral bandwidth parameter epsilon and mpm the most probable
+    maximum (or minimum) in `duration` seconds for a Gaussian response, from the Rice
+    distribution of peaks (Rayleigh for a narrow banded response) after Ochi.
+    """
+    sign = _sign(extreme)
+    x = np.asarray(time_history, dtype=float)
+    frequencies, density = response_spectrum(x, sample_interval, segment_length)
+    m0, m2, m4 = spectral_moments(frequencies, density, (0, 2, 4))
+    tz = np.sqrt(m0 / m2)
+    bandwidth = np.sqrt(np.clip(1 - m2 ** 2 / (m0 * m4), 0, 1))
+    root = np.sqrt(1 - bandwidth ** 2)
+    # Ochi: the number of peaks, duration / (tz * root), times 2 root / (1 + root)
+    n_peaks = np.maximum(2 / (1 + root) * duration / tz, 1.0)
+    mean = x.mean(axis=0)
+    std = np.sqrt(m0)
+    return SpectralExtremes(mean, std, tz, bandwidth,
+                            mean + sign * std * np.sqrt(2 * np.log(n_peaks)))
+
+
+# where a ULSResult's time history comes from, all that worker processes need of it
+Extraction = namedtuple('Extraction', 'ofxobject variable extreme node section arc_length')
+
+
 class ULSResult(object):
 
-    def __init__(self, ):
-        """ ULSResult - extreme value statistics. 
+    def __init__(self, ofxobject, variable, extreme='Max', node=None, section=None,
+                 arc_length=None, threshold_factor=0.8, storm_duration=10800.0,
+                 distribution='weibull', max_peaks=100000):
+        """ ULSResult - extreme value statistics.
         arguments:
-        time_history - The TimeHistory to process with Extreme statistics.
+        ofxobject - name of the OrcaFlex object.
+        variable - the result variable e.g. 'Effective Tension'.
         extreme - "Max" or "Min" for extrema to analyse.
+        node, section, arc_length - location on a line, if none are given the worst
+                arc length from the range graph is used.
+        threshold_factor - factor applied to the maximum value (measured from the mean)
+                to obtain the exceedence threshold.
+        storm_duration - duration in seconds the most probable value is for (3hrs).
+        distribution - "weibull" to fit peaks over the threshold or "gumbel" to fit the
+                maximum of each time history (one per seed).
+        max_peaks - the number of peaks kept in memory, see ExtremeAccumulator.
 
         Methods:
-                Result.extreme_stats() - runs extreme stats on a Result object which has a valid time_history attribute
+                Result.add(time_history, sample_interval) - add one simulation's time history
+                Result.extreme_stats() - runs extreme stats on the time histories added
 
         Output:
-                Result.time_history = values from ULS.extract.
+                Result.accumulator = ExtremeAccumulator of the peaks and moments.
                 Result.threshold_factor = factor applied to maximum value to obtain exceedence threshold.
                 Result.exeecdence_threshold = value fo exceedence threshold used.
                 Result.maximum_most_probable_level = Most probable value.
 
         """
-        self.time_history = time_history
-        self.sample_interval = sample_interval
+        _sign(extreme)
+        if distribution not in ('weibull', 'gumbel'):
+            raise OFXError(
+                "distribution must be 'weibull' or 'gumbel' not '{}'".format(distribution))
+        self.ofxobject = ofxobject
+        self.variable = variable
+        self.extreme = extreme
+        self.node = node
+        self.section = section
+        self.arc_length = arc_length
+        self.threshold_factor = threshold_factor
+        self.storm_duration = storm_duration
+        self.distribution = distribution
+        self.accumulator = ExtremeAccumulator(extreme, max_peaks)
+        self.time_history = []
+        self.sample_interval = None
+        self.exeecdence_threshold = None
+        self.maximum_most_probable_level = None
+        self.parameters = None
+
+    @property
+    def extraction(self):
+        return Extraction(self.ofxobject, self.variable, self.extreme, self.node,
+                          self.section, self.arc_length)
 
+    def add(self, time_history, sample_interval):
+        """add one simulation's time history to the statistics, it is not stored"""
+        self.accumulator.add(time_history, sample_interval)
 
-    
+    def extreme_stats(self):
+        """fit the extreme value distribution to the simulations added and set the most
+        probable value for a storm of `storm_duration`. Returns self."""
+        acc = self.accumulator
+        for th in self.time_history:
+            acc.add(th, self.sample_interval)
+        self.time_history = []
+        if acc.sims == 0:
+            raise OFXError("{} has no time history to process.".format(self))
+        sign = acc.sign
+        self.exeecdence_threshold = acc.threshold(self.threshold_factor)
+
+        if self.distribution == 'weibull':
+            excess = acc.excess(self.exeecdence_threshold)
+            shape, scale = fit_weibull(excess)
+            n_storm = len(excess) * self.storm_duration / acc.duration
+            mpm = scale * math.log(n_storm) ** (1.0 / shape) if n_storm > 1 else 0.0
+            self.parameters = (shape, scale)
+        else:
+            location, scale = acc.gumbel()
+            mpm = (location + scale * math.log(self.storm_duration * acc.sims / acc.duration) -
+                   sign * self.exeecdence_threshold)
+            self.parameters = (location, scale)
+        self.maximum_most_probable_level = self.exeecdence_threshold + sign * mpm
+        return self
 
     def __str__(self):
 
         header = """\n<--- %s %s for %s --->\n""" % (
             self.variable, self.extreme, self.ofxobject)
-        region = filter(lambda a: a[0] != None,
-                        zip([self.node, self.section, self.arc_length],
-                            ['Node', 'Section', 'Arc Length(m)']))
+        region = [r for r in zip([self.node, self.section, self.arc_length],
+                                 ['Node', 'Section', 'Arc Length(m)']) if r[0] is not None]
         if region:
             text_region = """[%s = %s]""" % (region[0][1], str(region[0][0]))
         else:
             text_region = ""
+        if self.maximum_most_probable_level is None:
+            return header + text_region
         final_values = """
         with a %1.1f threshold factor applied to yield %f exceedance threshold,
 the most probable 3hr return value is:\n\n%f\n""" % (self.threshold_factor,
@@ -41,84 +349,91 @@ the most probable 3hr return value is:\n\n%f\n""" % (self.threshold_factor,
         return header + text_region + final_values
 
 
-def process_uls_folder(direcetory, data_to_extract):
-    """ 
-    data_to_extract should be a list of ULSResult objects 
-    e.g. data_to_extract = [ULSResult('Line1','Curvature', 'Max')] 
-
-    """
-    models = Models(direcetory, filetype='sim')
-    g = models[0]['General']
-    log_interval = g.ActualLogSampleInterval
+def plan_extraction(model, data_to_extract, period=None):
+    """Plan the time histories needed for each ULSResult in `data_to_extract` from `model`.
 
-    def time_histories(obj, result):
-
-        def end_or_mid(node, range):
-            if node == 0:
-                obj_extra = oeEndA
-            elif node == len(range):
-                obj_extra = oeEndB
-            else:
-                obj_extra = oeNodeNum(node)
-            return obj_extra
+    Results are grouped by object so each range graph (per object, variable and section)
+    is only fetched once to find the governing arc length, whatever the number of results
+    that use it, and identical time histories are only requested once.
 
+    Returns (specifications, columns), a list of TimeHistorySpecification and for each
+    result the index of the specification its time history comes from.
+    """
+    if period is None:
+        period = Period(1)
+    range_graphs = {}
+    specifications = []
+    keys = {}
+    columns = []
+    for result in data_to_extract:
+        obj = model[result.ofxobject]
         if result.node:
-            time_history = obj.TimeHistory(
-                result.variable, Period(1), oeNodeNum(result.node))
+            key, extra = ('node', result.node), oeNodeNum(result.node)
         elif result.arc_length:
-            time_history = obj.TimeHistory(result.variable, Period(1),
-                                           oeArcLength(result.arc_length))
-        elif result.section:
+            key, extra = ('arc', result.arc_length), oeArcLength(result.arc_length)
+        elif result.section or obj.typeName == 'Line':
+            range_key = (result.ofxobject, result.variable, result.section)
+            if range_key not in range_graphs:
+                if result.section:
+                    range_graphs[range_key] = obj.RangeGraph(
+                        result.variable, period,
+                        arclengthRange=arSpecifiedSections(result.section, result.section))
+                else:
+                    range_graphs[range_key] = obj.RangeGraph(result.variable, period)
+            rg = range_graphs[range_key]
             if result.extreme == 'Max':
-                range = obj.RangeGraph(result.variable, Period(1),
-                                       arclengthRange=arSpecifiedSections(result.section,
-                                                                          result.section))
-                max_range = range.Max
-                arc_range = range.X
-                max_var = max_range.max()
-                max_var_node = max_range.argmax()
-                time_history = obj.TimeHistory(result.variable, Period(1),
-                                               oeArcLength(arc_range[max_var_node]))
-
-            elif result.extreme == 'Min':
-                range = obj.RangeGraph(result.variable, Period(1),
-                                       arclengthRange=arSpecifiedSections(result.section,
-                                                                          result.section))
-                min_range = range.Min
-                arc_range = range.X
-                min_var = min_range.min()
-                min_var_node = min_range.argmin()
-                time_history = obj.TimeHistory(result.variable, Period(1),
-                                               oeArcLength(arc_range[min_var_node]))
+                arc_length = rg.X[np.argmax(rg.Max)]
             else:
-                raise IOError("Needs to be 'Max' or 'Min'.")
+                arc_length = rg.X[np.argmin(rg.Min)]
+            key, extra = ('arc', arc_length), oeArcLength(arc_length)
         else:
+            key, extra = None, None
+        key = (result.ofxobject, result.variable, key)
+        if key not in keys:
+            keys[key] = len(specifications)
+            specifications.append(TimeHistorySpecification(obj, result.variable, extra))
+        columns.append(keys[key])
+    return specifications, columns
 
-            if result.extreme == 'Max':
-                max_range = obj.RangeGraph(result.variable, Period(1)).Min
-                max_var = max_range.max()
-                max_var_node = max_range.argmax()
-                obj_extra = end_or_mid(max_var_node, max_range)
-                time_history = obj.TimeHistory(
-                    result.variable, Period(1), obj_extra)
-            elif result.extreme == 'Min':
-                min_range = obj.RangeGraph(result.variable, Period(1)).Min
-                min_var = min_range.min()
-                min_var_node = min_range.argmin()
-                obj_extra = end_or_mid(min_var_node, min_range)
-                time_history = obj.TimeHistory(
-                    result.variable, Period(1), obj_extra)
-        return time_history
-
-    for m in models:
-        if m.simulationComplete:
-            for result in data_to_extract:
-
-                obj = m[result.ofxobject]
-                result.time_history += list(time_histories(obj, result))
-                result.log_interval = log_interval
-        else:
-            print "NOT COMPLETE:\n{}\n{}".format(m.path, m.status)
+
+def extract(model, data_to_extract, period=None):
+    """list of time history arrays from `model`, one for each ULSResult (or Extraction) in
+    `data_to_extract`, fetched in a single batch (see plan_extraction)."""
+    if period is None:
+        period = Period(1)
+    specifications, columns = plan_extraction(model, data_to_extract, period)
+    values = GetMultipleTimeHistories(specifications, period)
+    return [values[:, column] for column in columns]
+
+
+def summarise_sim(path, data_to_extract):
+    """a SimSummary of the simulation at `path` for each ULSResult (or its Extraction) in
+    `data_to_extract`, raises OFXError if the simulation is not complete"""
+    m = complete_sim(path)
+    sample_interval = m.general.ActualLogSampleInterval
+    return [summarise(th, sample_interval, result.extreme)
+            for result, th in zip(data_to_extract, extract(m, data_to_extract))]
+
+
+def process_uls_folder(direcetory, data_to_extract, processes=1):
+    """ 
+    data_to_extract should be a list of ULSResult objects 
+    e.g. data_to_extract = [ULSResult('Line1','Curvature', 'Max')] 
+
+    With processes > 1 (or None for one per cpu) the sims are summarised in a pool of
+    worker processes. The summaries are merged in the same order as the serial run so the
+    results are identical. Sims that are not complete or fail to load are reported and
+    skipped.
+    """
+    paths = Models(direcetory, filetype='sim').paths()
+    extractions = [result.extraction for result in data_to_extract]
+    jobs = ((path, extractions) for path in paths)
+    for _, summaries, error in process_sims(summarise_sim, jobs, processes):
+        if error:
+            print(error)
+            continue
+        for result, summary in zip(data_to_extract, summaries):
+            result.accumulator.add_summary(summary)
 
     results = [result.extreme_stats() for result in data_to_extract]
     return results
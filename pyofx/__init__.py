@@ -1,20 +1,52 @@
-try:
-    from tkinter import Tk
-except ImportError:
-    # python 2 then
-    from Tkinter import Tk
-import time
 import os
-import tempfile
-import ctypes
-import csv
-from subprocess import Popen, PIPE, STDOUT, check_output, CalledProcessError
-import io
-import inspect
 import math
+import stat
+
+# Names from pyofx.model and OrcFxAPI are loaded on first use (see __getattr__) so that
+# importing pyofx is quick and gamma_dnv, pyofx.geom etc. work without OrcFxAPI.
+_LAZY_MODULE = 'pyofx.model'
+
+
+def __getattr__(name):
+    """import pyofx.model (and OrcFxAPI) the first time one of their names is used"""
+    if (name.startswith('__') and name != '__all__') or _is_submodule(name):
+        raise AttributeError("module 'pyofx' has no attribute '{}'".format(name))
+    import importlib
+    model = importlib.import_module(_LAZY_MODULE)
+    from pyofx import profiling
+    profiling.enable_from_environment()
+    names = [n for n in vars(model) if not n.startswith('_')]
+    module_globals = globals()
+    for n in names:
+        module_globals.setdefault(n, getattr(model, n))
+    module_globals['__all__'] = sorted(set(
+        names + [n for n in module_globals if not n.startswith('_')]))
+    if name not in module_globals:
+        raise AttributeError("module 'pyofx' has no attribute '{}'".format(name))
+    return module_globals[name]
+
+
+def __dir__():
+    try:
+        return sorted(set(globals()) | set(__getattr__('__all__')))
+    except ImportError:
+        return sorted(globals())
+
+
+def use_api(module_name):
+    """use `module_name` in place of OrcFxAPI, e.g. 'pyofx.fake' to run without OrcaFlex.
+
+    Must be called before Model etc. are first used. Sets the PYOFX_API environment
+    variable so worker processes use it too."""
+    import sys
+    model = sys.modules.get(_LAZY_MODULE)
+    if model is not None and model._api.__name__ != module_name:
+        raise OFXError("pyofx is already using {}.".format(model._api.__name__))
+    os.environ['PYOFX_API'] = module_name
 
-from OrcFxAPI import *
-_is64bit = ct.sizeof(ct.c_voidp) == 8
+
+def _is_submodule(name):
+    return os.path.exists(os.path.join(os.path.dirname(__file__), name + '.py'))
 
 
 class OFXError(Exception):
@@ -35,34 +67,13 @@ def gamma_dnv(h_s, t_p):
         return math.exp(5.75 - (1.15 * (t_p / math.sqrt(h_s))))
 
 
-def check_licence():
-    """true if a licence can be found
-
-    Useful for polling to wait for a free licence.
-    See examples.py"""
-    try:
-        _m = Model()
-        return True
-    except DLLError:
-        return False
-
-
-def get_modes(model, line, from_mode=-1, to_mode=100):
-    """List of (Mode Number, Modal Period, Modal Frequency) tuples for modal analysis of
-    lines. Check specific range of modes with from_mode and to_mode."""
-    if model.state is not ModelState.InStaticState:
-        model.CalculateStatics()
-    modes = Modes(line, ModalAnalysisSpecification(True, from_mode, to_mode))
-    return [(mode + 1, modes.modeDetails(mode).period,
-             1 / modes.modeDetails(mode).period) for mode in range(modes.modeCount)]
-
-
 def get_unc_path(local_name):
     """the UNC path of a mapped drive. 
 
     Useful because some distributed OrcaFlex versions
     want only networked filepaths. Returns None if the drive is not mapped (e.g. C:\)
     """
+    import ctypes
     WNetGetConnection = ctypes.windll.mpr.WNetGetConnectionA
     ERROR_MORE_DATA = 234
     mapped_name = local_name.upper() + ":"
@@ -90,350 +101,72 @@ def dat_sim_paths(directory, name, yml=False):
         return os.path.join(directory, name + '.dat'), os.path.join(directory, name + '.sim')
 
 
-def _xyz_to_clipboard(x,y,z):
-    """ place string for xyz arrary on the clipbaord to paste in drawing form"""
-    _xyz = list(zip([str(_x) for _x in x], [str(_y)
-               for _y in y], [str(_z) for _z in z]))
-    s = ""
-    for xyz in _xyz:
-        s += "\t".join(xyz) + "\n"
-    r = Tk()
-    r.withdraw()
-    r.clipboard_clear()
-    r.clipboard_append(s)
-    r.destroy()
-
-def vessel_drawing(length, depth, beam, bow_scale=(0.9, 0.95), vessel_type=None):
-    """scale the default OrcaFlex vessel type drawing
-
-    Given a vessel of specifed length, depth and beam. Bow shape determined by the bow_scale
-    parameter.
-
-    if an `OrcaFlexObject` with `typeName=otVesselType` is passed as the vessel_type parameter then
-    the drawing will be applied otherwise the correct array is copied to the clipboard to paste 
-    into the vessel type drawing table.  
-    """
-
-
-    l = length / 2.0
-    d = depth / 2.0
-    b = beam / 2.0
-    x = [l, l, -l, -l, l, l, l, -l, -l, l]
-    y = [0, b, b, -b, -b, 0, b, b, -b, -b]
-    z = [d] * 5 + [-d] * 5
-
-    bow_scaling = [1, bow_scale[0], 1, 1, bow_scale[0],
-                   bow_scale[1], bow_scale[0], 1, 1, bow_scale[0]]
-
-    x = [s * _x for s, _x in zip(bow_scaling, x)]
-
-    if vessel_type and vessel_type.type == otVesselType:
-        vessel_type.VertexX = x
-        vessel_type.VertexY = y
-        vessel_type.VertexZ = z
-    else:
-        _xyz_to_clipboard(x,y,z)
+class _NotComplete(OFXError):
+    pass
 
 
-def buoy_drawing(size, ofx_object=None):
-    """scale the standard 6D buoy cuboid to width and height of `size` 
-    (the default size is 6m)
+def complete_sim(path):
+    """the Model of the simulation at `path`, raises OFXError if it did not complete"""
+    from pyofx.model import Model
+    m = Model(path)
+    if not m.simulationComplete:
+        raise _NotComplete("NOT COMPLETE:\n{}\n{}".format(path, m.status))
+    return m
 
-    If ofx_object is provided then the object drawing will be changed
-    otherwise the correct array is copied to the clipboard to paste 
-    into the 6D Buoy drawing table.  
 
+def _call_job(args):
+    function, job = args
+    try:
+        return function(*job), None
+    except _NotComplete as e:
+        return None, str(e)
+    except Exception as e:
+        return None, "FAILED:\n{}\n{}".format(job[0], e)
+
+
+def process_sims(function, jobs, processes=1):
+    """Generator of (job, result, error) for function(*job) of each tuple of arguments in
+    `jobs`, in order. The first argument of each job names it (e.g. the sim path) in
+    errors.
+
+    With processes > 1 (or None for one per cpu) the jobs run in a pool of worker
+    processes, so `function` must be importable. A job that raises does not stop the
+    others: its result is None and error says why (NOT COMPLETE if complete_sim found an
+    unfinished simulation, otherwise FAILED), error is None for the jobs that succeed.
     """
-    _x = [1, -1, -1, 1, 1, -1, -1, 1]
-    _y = [1, 1, -1, -1, 1, 1, -1, -1]
-    _z = [1, 1, 1, 1, -1, -1, -1, -1]
-    _sx = [float(size)/2 * x for x in _x]
-    _sy = [float(size)/2 * y for y in _y]
-    _sz = [float(size)/2 * z for z in _z]
-    if ofx_object and ofx_object.type == ot6DBuoy:
-        ofx_object.VertexX = _sx
-        ofx_object.VertexY = _sy
-        ofx_object.VertexZ = _sz
+    jobs = list(jobs)
+    tasks = ((function, job) for job in jobs)
+    if processes == 1:
+        pool = None
+        results = map(_call_job, tasks)
     else:
-        _xyz_to_clipboard(_sx,_sy,_sz)
-
-
-class Model(Model):
-
-    """Wrapper around OrcFxAPI.Model to add extra functionality.
-
-    1. added path attribute so the location of the model on the disc can be found from:
-
-    >>> model = Model(r"C:\path\to\data_file.dat")
-    >>> model.path
-    "C:\path\to\data_file.dat"
-
-    2. added a model_name attribute (added in v0.0.9) of the file name without path or
-    extensions:
-
-    >>> model = Model(r"C:\path\to\data_file.dat")
-    >>> model.model_name
-    "data_file"
-
-    3. added the open method. This will open the model in the OrcaFlex GUI, if the model
-    does not exist on disc then a windows temp file will be created. Won't return until 
-    the OrcaFlex.exe instance is closed.
-
-    >>> model = Model()
-    >>> model.open() # Opens a temp file in OrcaFlex.exe
-
-    4. added `objects_of_type()` to return a list of objects in the model of a certain types/
-    e.g. model.objects_of_type('Line')
-
-    >>> model = Model()
-    >>> model.CreateObject(otVessel, 'Bigger Boat')
-    >>> for v in model.objects_of_type('Vessel'):
-    ...     print v.name
-    "Bigger Boat"
-
-
-    5. added attribute `lines`, shortcut to objects_of_type('Line')
-
-    6. added attribute `vessels`, shortcut to objects_of_type('Vessel')
-
-    7. added attribute `six_d_buoys`, shortcut to objects_of_type('6DBuoy')
-
-
-    """
-
-    def __init__(self, *args, **kwargs):
-        super(Model, self).__init__(*args, **kwargs)
-        if kwargs.get('filename', False):
-            self.path = kwargs.get('filename')
-        elif len(args) > 0:
-            if os.path.exists(args[0]):
-                self.path = args[0]
-            else:
-                raise OFXError("\n Can't locate file {}.".format(self.path))
-        else:
-            self.path = None
-
-    def open(self):
-        if not self.path:
-            fd, self.path = tempfile.mkstemp(suffix=".dat")
-            os.close(fd)
-            self.SaveData(self.path)
-        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE,
-                            'Software\\Orcina\\OrcaFlex\\Installation Directory',
-                            0, winreg.KEY_READ | winreg.KEY_WOW64_32KEY) as key:
-            installation_directory = winreg.QueryValueEx(key, 'Normal')[0]
-        if _is64bit:
-            cmd_line = ['OrcaFlex64.exe', self.path]
-        else:
-            cmd_line = ['OrcaFlex.exe', self.path]
-        try:
-            assert os.path.isdir(installation_directory)
-        except AssertionError as error:
-            raise OFXError(
-                "{} might not be a directory".format(installation_directory))
-        os.chdir(installation_directory)
-        try:
-            print("{} has been opened in the OrcaFlex GUI.".format(self.path))
-            p = check_output(cmd_line, universal_newlines=True)
-            print("{} has been closed.".format(self.path))
-        except CalledProcessError as cpe:
-            raise OFXError(
-                "Error opening {} in OrcaFlex:\n{}".format(self.path, cpe.output))
-
-    def SaveData(self, filename):
-        super(Model, self).SaveData(filename)
-        self.path = filename
-
-    def LoadData(self, filename):
-        super(Model, self).LoadData(filename)
-        self.path = filename
-
-    def LoadSimulation(self, filename):
-        super(Model, self).LoadSimulation(filename)
-        self.path = filename
-
-    def SaveSimulation(self, filename):
-        super(Model, self).SaveSimulation(filename)
-        self.path = filename
-
-    @property
-    def model_name(self):
-        return os.path.splitext(os.path.split(self.path)[1])[0]
-
-    def objects_of_type(self, type_name, test=None):
-        """list of all objects in model with `typeName` equal to `type_name`
-
-        option to add a test function to further filter the list
-        """
-        typed_objects = [o for o in self.objects if (o.typeName == type_name)]
-        if isinstance(test, str):
-            return [o for o in typed_objects if test in o.Name]
-        elif inspect.isfunction(test):
-            return list(filter(test, typed_objects))
-        elif test is None:
-            return typed_objects
-        else:
-            raise OFXError(
-                ("The test must be for a string in the object name or a filter function. ",
-                 "Was passed an {}".format(type(test))))
-
-    @property
-    def lines(self):
-        """ all the objects of type otLine """
-
-        return self.objects_of_type('Line')
-
-    @property
-    def vessels(self):
-        """ all the objects of type otLine """
-
-        return self.objects_of_type('Vessel')
-
-    @property
-    def six_d_buoys(self):
-        """ all the objects of type ot6DBuoy """
-
-        return self.objects_of_type('6D Buoy')
-
-
-class Models(object):
-    r"""a generator which yields OrcaFlex files in directories.
-
-    Suppose we have saved some simulations in C:\Users\User\Project\OrcaFlex, to iterate over all
-    those simulations we can use:
-
-    >>> for model in Models(r"C:\Users\User\Project\OrcaFlex"):
-    ...    print model
-    <pyofx.Model object at 0x00000000031B6DD8>
-    <pyofx.Model object at 0x00000000031B6E80>
-
-    Note that in the above example the generator yields Model objects of the .dat files. To return
-    the path to the file rather than the Model object we can pass return_model=False and to return
-    .sim file filetype="sim"
-
-
-    There are various other options as detailed in the api_docs_:
-
-    .. autofunction:: pyofx.Models.__init__
-
-
-    """
-
-    def __init__(self, directories, filetype="dat",
-                 subdirectories=False, return_model=True,
-                 filter_function=None, failed_function=None,
-                 virtual_logging=False):
-        """
-        create a generator for Model objects.
-
-        Requires a directory as a string or a list of directories as strings. Other arguments are:
-
-        filetype         str    "dat", "yml" or "sim" to yield data files or simulations (default="dat")
-        subdirectories   bool   if True then subdirectories will be included (default=False)
-        return_model     bool   if True then yield pyofx.Model objects, if False yield a string
-                                of the full path to the file. (default=True)
-        virtual_logging  bool   if True all returned Model instances will have virtual logging
-                                enabled. Makes post processing of large sim files mmmuch quicker.
-                                (default=False)
-        filter_function  func   function that returns True or False when passed the full filename.
-                                only models that pass the test will be returned.
-        failed_function  func   function to be performed on failed simulation file loads [TODO]
-        """
-        self._dirs = []
-        self.filetype = filetype
-        if self.filetype not in ['sim', 'dat', 'yml']:
-            raise OFXError(
-                "filetype must be 'sim', 'dat' or 'yml' not '{}'".format(self.filetype))
-        self.sub = subdirectories
-        self.return_model = return_model
-        self.virtual_logging = virtual_logging
-        if filter_function is None:
-            self.filter_function = lambda _: True
-        else:
-            self.filter_function = filter_function
-
-        # TODO: Fix so that return_model=False cannot be checked for failed
-        # simulation.
-
-        if return_model and failed_function and filetype == "sim":
-            self.failed_function = failed_function
-        elif failed_function:
-            raise OFXError(
-                "Failed failed_function needs to be called on .sim files")
-
-        if isinstance(directories, str):
-            self._dirs.append(directories)
-        else:
-            for _dir in directories:
-                if not isinstance(_dir, str):
-                    raise OFXError("""Directory arguments need to be strings.
-                     {} is a {}.""".format(_dir, type(_dir)))
-                else:
-                    if os.path.isdir(_dir):
-                        self._dirs.append(_dir)
-                    else:
-                        raise OFXError(r"""{} does not appear to be a vaild directory.
-                         hint:put an 'r' before the string e.g. r'c:\temp'.
-                         """.format(_dir, type(_dir)))
-
-    def __iter__(self):
-        extension = ".{}".format(self.filetype)
-
-        def model_or_path(root, filename):
-            model_path = os.path.join(root, filename)
-            if self.return_model:
-                if self.virtual_logging:
-                    _model = Model()
-                    _model.UseVirtualLogging()
-                    if self.filetype == "sim":
-                        _model.LoadSimulation(model_path)
-                    else:
-                        _model.LoadData(model_path)
-                    return _model
-                else:
-                    return Model(model_path)
-            else:
-                return model_path
-
-        test_fun = lambda _rf: self.filter_function(
-            os.path.join(_rf[0], _rf[1])) and _rf[1].endswith(extension)
-        for d in self._dirs:
-            if self.sub:
-                paths = [(r, f) for r, d, f in os.walk(d)]
-            else:
-                paths = [(d, f) for f in os.listdir(d)]
-            for root, file_ in filter(test_fun, paths):
-                yield model_or_path(root, file_)
-
-
-class Jobs():
-
-    r""" Python interface to Distributed OrcaFlex
-
-        >>> from pyofx import Jobs
-        >>> j = Jobs(r"\\network\path\to\OrcFxAPI.dll")
-
-        Methods:
+        from multiprocessing import Pool
+        pool = Pool(processes)
+        results = pool.imap(_call_job, tasks)
+    try:
+        for job, (result, error) in zip(jobs, results):
+            yield job, result, error
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
 
-        add(filepath, variables=None)
 
-        Adds an orcaflex file to the list of jobs with optional variables object.
+class DistributedBackend(object):
 
-        >>> j.add(r"\\network\folder\Hs=2.2m_model.dat", {'Hs':'2.2m'})
-
-        run(wait=False)
-
-        Submits jobs to Distributed Orcaflex. If wait is True it will not
-        return unitll all jobs have completed.
-
-        >>> j.run(True)
-        >>> print "All jobs finished" # This won't print unitll the simulations are complete.
+    """Jobs backend that submits to Distributed OrcaFlex with dofcmd.exe (Windows only).
 
+    The installation directory is read from the registry and so is the location of
+    OrcFxAPI.dll if `dllname` is not given.
     """
 
     def __init__(self, dllname=None):
-
-        self.jobs = []
+        import tempfile
+        try:
+            import winreg
+        except ImportError:
+            # python 2 then
+            import _winreg as winreg
         try:
             with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE,
                                 'Software\\Orcina\\Distributed OrcaFlex\\Installation Directory',
@@ -464,46 +197,40 @@ class Jobs():
         else:
             self.dllname = dllname
 
+        self._unc_paths = {}
         self.batch_fd, self.batch_path = tempfile.mkstemp(suffix=".bat")
         self.batch_file = open(self.batch_path, 'wb')
         self.batch_file.write(
-            """echo off\r\ncd "%s"\r\n""" % self.installation_directory)
+            """echo off\r\ncd "{}"\r\n""".format(self.installation_directory).encode())
         self.file_list_fd, self.file_list_path = tempfile.mkstemp(
             suffix=".txt")
         self.file_list_file = open(self.file_list_path, 'wb')
 
-    def __iter__(self):
-
-        for job in self.jobs:
-            yield job
-
-    def add_file(self, filepath, variables=None):
-        """
-        Adds a filepath (must be network path or a mapped drive) to the list of jobs to run.
-        Optionally takes a variables object to represent information about the job.
-        """
+    def check_file(self, filepath):
+        """the UNC path of `filepath`, it must be a network path or a mapped drive"""
         if filepath[:2] != r"\\":
-            if get_unc_path(filepath[0]):
-                filepath = get_unc_path(filepath[0]) + filepath[2:]
+            drive = filepath[0].upper()
+            if drive not in self._unc_paths:
+                self._unc_paths[drive] = get_unc_path(drive)
+            if self._unc_paths[drive]:
+                filepath = self._unc_paths[drive] + filepath[2:]
             else:
                 raise OFXError(
                     "{} must be a network filepath (or mapped drive).".format(filepath))
         try:
-            a = open(filepath)
-            a.close()
-            del a
-        except IOError:
+            is_file = stat.S_ISREG(os.stat(filepath).st_mode)
+        except OSError:
+            is_file = False
+        if not is_file:
             raise OFXError("{} not a vaild file.".format(filepath))
-        self.jobs.append((filepath, variables))
-        self.file_list_file.write("""{}\r\n""".format(filepath))
+        return filepath
 
-    def run(self, wait=False, statics=False):
-        """
-        Submit the jobslist to Distributed Orcaflex.
-        If wait=True then wait until the jobs complete to return.
-        To run statics only use statics=True
-        """
+    def add(self, filepath):
+        pass
 
+    def run(self, filepaths, wait=False, statics=False):
+        self.file_list_file.write("".join(
+            """{}\r\n""".format(filepath) for filepath in filepaths).encode())
         cmdline_template = '"{}" -add {}{}-dllname="{}" "{}"\r\n'
         cmdline = cmdline_template.format(
             os.path.join(self.installation_directory,
@@ -511,64 +238,229 @@ class Jobs():
             "-wait " if wait else "",
             "-statics " if statics else "",
             self.dllname, self.file_list_path)
+        from subprocess import check_output, CalledProcessError
 
-        self.batch_file.write(cmdline)
+        self.batch_file.write(cmdline.encode())
         os.close(self.batch_fd)
         os.close(self.file_list_fd)
         self.batch_file.close()
         self.file_list_file.close()
-        batch = self.batch_path.split('\\')
         try:
             p = check_output(self.batch_path)
-            print("Submitted {} jobs.".format(len(self.jobs)))
         except CalledProcessError as cpe:
             raise OFXError(
                 "Error sumbitting to Distributed OrcaFlex:\n" + cpe.output)
 
+    def status(self):
+        """dictionary of filepath: status string for the jobs on the server"""
+        return dict((job['File'], job['Status']) for job in self.list())
+
     def __del__(self):
         """ ensure we have closed the files when the object is destroyed """
-        self.batch_file.close()
-        self.file_list_file.close()
+        if hasattr(self, 'batch_file'):
+            self.batch_file.close()
+            self.file_list_file.close()
 
-    def list(self):
-        """list()
-        a generator for all the jobs on the Distributed Orcaflex Server. Each job will be returned
-        as a dictionary with the following keys: Job ID, Simulation file name including full path,
-        Owner, Status, Start Time, Completed Time, Name of machine last run on,
-        IP address of machine last run on, AutoSave interval, OrcFxAPI DLL version and
-        Status string.
-        """
+    def list_output(self):
+        """the raw output of dofcmd -list"""
         cwd = self.installation_directory
+        from subprocess import Popen, PIPE, STDOUT
         cmd2 = ['dofcmd.exe', '-list']
         assert os.path.isdir(cwd)
         os.chdir(cwd)
         p = Popen(cmd2, cwd=cwd, stdout=PIPE,
                   universal_newlines=True, stderr=STDOUT, shell=True)
         stdout, stderr = p.communicate()
-        if stdout is not None:
-            whole_list = ''.join(stdout.split('\n\n'))
-            head = ['ID',
-                    'File',
-                    'Owner',
-                    'Status',
-                    'Start Time',
-                    'Completed Time',
-                    'Name of machine',
-                    'IP address of machine',
-                    'AutoSave interval',
-                    'DLL version',
-                    'Status string']
-            jobs = whole_list.split('\n')
-            jobs.reverse()
-            header = ','.join(head)
-            jobs_list = csv.DictReader(
-                io.StringIO(header + '\n' + '\n'.join(jobs)))
-
-            for job in jobs_list:
-                yield job
-        else:
+        if stdout is None:
             raise OFXError(
                 "\n Error communicating with the distrubuted OrcaFlex server:\n" + stderr)
+        return stdout
+
+    def list(self):
+        """a generator for all the jobs on the Distributed Orcaflex Server, see Jobs.list"""
+        jobs = list(parse_job_list(self.list_output()))
+        jobs.reverse()
+        for job in jobs:
+            yield job
+
+
+DOF_LIST_HEADER = ['ID',
+                   'File',
+                   'Owner',
+                   'Status',
+                   'Start Time',
+                   'Completed Time',
+                   'Name of machine',
+                   'IP address of machine',
+                   'AutoSave interval',
+                   'DLL version',
+                   'Status string']
+
+
+def parse_job_list(text):
+    """generator of a dictionary (keys DOF_LIST_HEADER) for each job in the output of
+    dofcmd -list, in the order listed"""
+    import csv
+    for row in csv.reader(line for line in text.splitlines() if line.strip()):
+        yield dict(zip(DOF_LIST_HEADER, row))
+
+
+class Jobs():
+
+    r""" Python interface to Distributed OrcaFlex
+
+        >>> from pyofx import Jobs
+        >>> j = Jobs(r"\\network\path\to\OrcFxAPI.dll")
+
+        Methods:
+
+        add_file(filepath, variables=None)
+
+        Adds an orcaflex file to the list of jobs with optional variables object.
+
+        >>> j.add_file(r"\\network\folder\Hs=2.2m_model.dat", {'Hs':'2.2m'})
+
+        add_files(filepaths, variables=None)
+
+        Adds many files at once, checking them in parallel and ignoring duplicates.
+
+        run(wait=False)
+
+        Submits jobs to Distributed Orcaflex. If wait is True it will not
+        return unitll all jobs have completed.
+
+        >>> j.run(True)
+        >>> print "All jobs finished" # This won't print unitll the simulations are complete.
+
+        status()
+
+        Dictionary of filepath: status string of each job.
+
+        Jobs can also be run by another backend, e.g. on this machine with a pool of
+        processes (see pyofx.jobs.LocalBackend):
+
+        >>> from pyofx.jobs import LocalBackend
+        >>> j = Jobs(backend=LocalBackend(processes=4))
+
+        Pass a telemetry (see pyofx.jobs.JobTelemetry) to record queue and run times.
+
+        Pass a cache to skip jobs whose inputs have not changed since their .sim was made:
+
+        >>> from pyofx.jobs import JobCache
+        >>> j = Jobs(cache=JobCache(r"\\network\folder\job_cache.json"))
+
+    """
+
+    def __init__(self, dllname=None, backend=None, cache=None, verbose=True, telemetry=None):
+
+        self.jobs = []
+        if backend is None:
+            self.backend = DistributedBackend(dllname)
+        else:
+            self.backend = backend
+        self.cache = cache
+        self.verbose = verbose
+        self.telemetry = telemetry
+        self._added = set()
+        self.submitted = []
+        self.skipped = []
+
+    def __iter__(self):
+
+        for job in self.jobs:
+            yield job
+
+    def add_file(self, filepath, variables=None):
+        """
+        Adds a filepath (for Distributed OrcaFlex must be network path or a mapped drive) to
+        the list of jobs to run.
+        Optionally takes a variables object to represent information about the job.
+        """
+        self._append(self.backend.check_file(filepath), variables)
+
+    def add_files(self, filepaths, variables=None, threads=16):
+        """
+        Adds many filepaths at once, optionally with a list of variables objects (one for
+        each filepath). The files are checked in a pool of `threads` threads, which is much
+        quicker than add_file for thousands of files on a network share.
+        All the files are checked before any are added, an OFXError lists those that failed.
+        Files that are already in the list of jobs are ignored.
+        """
+        filepaths = list(filepaths)
+        if variables is None:
+            variables = [None] * len(filepaths)
+        elif len(variables) != len(filepaths):
+            raise OFXError("There must be one variables object for each filepath.")
+
+        def check(filepath):
+            try:
+                return self.backend.check_file(filepath), None
+            except OFXError as e:
+                return None, str(e)
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(threads)
+        try:
+            checked = pool.map(check, filepaths)
+        finally:
+            pool.close()
+            pool.join()
+        errors = [error for _, error in checked if error]
+        if errors:
+            raise OFXError("{} files could not be added:\n{}".format(
+                len(errors), "\n".join(errors)))
+        for (filepath, _), job_variables in zip(checked, variables):
+            self._append(filepath, job_variables)
+
+    def _append(self, filepath, variables):
+        key = os.path.normcase(os.path.normpath(filepath))
+        if key in self._added:
+            return
+        self._added.add(key)
+        self.jobs.append((filepath, variables))
+        self.backend.add(filepath)
+
+    def run(self, wait=False, statics=False):
+        """
+        Submit the jobslist to Distributed Orcaflex (or the backend).
+        If wait=True then wait until the jobs complete to return.
+        To run statics only use statics=True
+        If the Jobs has a cache (see pyofx.jobs.JobCache) then jobs with an up to date
+        .sim are skipped, the submitted and skipped attributes list the filepaths.
+        """
+        filepaths = [filepath for filepath, _ in self.jobs]
+        if self.cache is None:
+            self.submitted, self.skipped = filepaths, []
+        else:
+            self.submitted, self.skipped = self.cache.split(filepaths, statics)
+        if self.telemetry is not None:
+            self.telemetry.submitted(self.submitted,
+                                     before=[job['ID'] for job in self.backend.list()],
+                                     backend=self.backend)
+        self.backend.run(self.submitted, wait, statics)
+        if self.telemetry is not None and wait:
+            self.telemetry.update(self.backend.list())
+        if not self.verbose:
+            return
+        if self.skipped:
+            print("Submitted {} jobs, skipped {} up to date.".format(
+                len(self.submitted), len(self.skipped)))
+        else:
+            print("Submitted {} jobs.".format(len(self.submitted)))
+
+    def status(self):
+        """dictionary of filepath: status string for each job known to the backend"""
+        return self.backend.status()
+
+    def list(self):
+        """list()
+        a generator for all the jobs on the Distributed Orcaflex Server. Each job will be returned
+        as a dictionary with the following keys: Job ID, Simulation file name including full path,
+        Owner, Status, Start Time, Completed Time, Name of machine last run on,
+        IP address of machine last run on, AutoSave interval, OrcFxAPI DLL version and
+        Status string.
+        """
+        return self.backend.list()
 
 if __name__ == "__main__":
     pass
@@ -0,0 +1,267 @@
+"""
+Cases
+
+Generate load case files from one base model and a grid of parameters.
+
+    parameter_grid   every combination of the values of each parameter
+    CaseGenerator    writes a data file for each case and a manifest of the parameters
+
+A .yml base model is patched as text, so no Model is built and thousands of cases take
+seconds. Otherwise (a .dat base, or an override that is a function) each worker process
+loads the base once and edits it for each case, saving it beside the case file to compare.
+Files whose contents have not changed are not rewritten, so their .sim files stay up to
+date for pyofx.jobs.JobCache.
+
+Usage:
+    from pyofx.cases import CaseGenerator, parameter_grid
+    generator = CaseGenerator(r"C:\\project\\base.yml",
+                              {'Hs': 'WaveHs', 'Tp': 'WaveTp', 'gamma': 'WaveGamma',
+                               'heading': 'WaveDirection',
+                               'offset': ('Vessel1', 'InitialPosition[0]')},
+                              name="Hs={Hs}_Tp={Tp}_dir={heading}_x={offset}")
+    manifest = generator.generate(r"C:\\project\\cases",
+                                  parameter_grid(Hs=[2, 3], Tp=[8, 10, 12],
+                                                 heading=[0, 45, 90], offset=[-10, 10]))
+
+"""
+
+import filecmp
+import json
+import os
+import re
+import tempfile
+from collections import OrderedDict
+from itertools import product
+from multiprocessing import Pool
+
+from pyofx import OFXError, gamma_dnv, dat_sim_paths
+
+_INDEXED = re.compile(r'^(.*)\[(\d+)\]$')
+
+
+def parameter_grid(**values):
+    """list of a dictionary for every combination of the values of each parameter, e.g.
+    parameter_grid(Hs=[2, 3], Tp=[8, 10]) gives 4 cases"""
+    names = list(values)
+    return [OrderedDict(zip(names, combination))
+            for combination in product(*(values[name] for name in names))]
+
+
+def _yml_value(value):
+    if isinstance(value, (list, tuple)):
+        return "[{}]".format(", ".join(_yml_value(v) for v in value))
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _block(lines, object_name):
+    """(start, end) lines of the data of `object_name`, a '- Name: ' list item or a
+    'Name:' section"""
+    item = re.compile(r'^(\s*-\s+)Name:\s*{}\s*$'.format(re.escape(object_name)))
+    section = re.compile(r'^(\s*){}:\s*$'.format(re.escape(object_name)))
+    for start, line in enumerate(lines):
+        match = item.match(line)
+        if match:
+            indent = len(match.group(1))
+            break
+        match = section.match(line)
+        if match:
+            indent = len(match.group(1)) + 1
+            break
+    else:
+        raise OFXError("No object {} in the base model.".format(object_name))
+    end = start + 1
+    while end < len(lines):
+        line = lines[end]
+        if line.strip() and len(line) - len(line.lstrip()) < indent:
+            break
+        end += 1
+    return start, end
+
+
+def patch_yml(text, key, value, object_name=None):
+    """`text` of an OrcaFlex .yml file with the data item `key` (of `object_name`, the
+    first anywhere if None) set to `value`. key can index a list, e.g. InitialPosition[0].
+    """
+    lines = text.splitlines(True)
+    start, end = (0, len(lines)) if object_name is None else _block(lines, object_name)
+    indexed = _INDEXED.match(key)
+    name = indexed.group(1) if indexed else key
+    pattern = re.compile(r'^(\s*(?:-\s+)?{}:\s*)(.*?)(\s*)$'.format(re.escape(name)))
+    for n in range(start, end):
+        match = pattern.match(lines[n])
+        if match is None:
+            continue
+        if indexed:
+            items = [item.strip() for item in match.group(2).strip('[]').split(',')]
+            items[int(indexed.group(2))] = _yml_value(value)
+            new_value = "[{}]".format(", ".join(items))
+        else:
+            new_value = _yml_value(value)
+        lines[n] = match.group(1) + new_value + match.group(3)
+        return "".join(lines)
+    raise OFXError("No data item {} in {}.".format(key, object_name or "the base model"))
+
+
+def _set_data(model, object_name, key, value):
+    obj = model[object_name or 'Environment']
+    indexed = _INDEXED.match(key)
+    if indexed:
+        items = list(getattr(obj, indexed.group(1)))
+        items[int(indexed.group(2))] = value
+        setattr(obj, indexed.group(1), items)
+    else:
+        setattr(obj, key, value)
+
+
+class CaseGenerator(object):
+
+    """Makes a data file for each case (a dictionary of parameter: value) from the base
+    model at `base_path`.
+
+    `overrides` maps each parameter to where it goes in the model, one of:
+        'WaveHs'                             a data item (the first found in a .yml,
+                                             of the Environment when editing a Model)
+        ('Vessel1', 'InitialPosition[0]')    a data item of an object, optionally one
+                                             element of a list
+        function(model, value)               edits the Model, all the cases must set
+                                             the same data as the base is not reloaded
+
+    If 'gamma' is overridden but is not a parameter it is calculated with gamma_dnv from
+    the parameters named by `wave` (Hs, Tp), if the case has them. Files are named by the `name` format string of the parameters and `index`
+    (the position of the case), which is also the case ID in the manifest.
+    """
+
+    def __init__(self, base_path, overrides, name="case_{index:04d}", wave=('Hs', 'Tp')):
+        if not os.path.isfile(base_path):
+            raise OFXError("{} not a vaild file.".format(base_path))
+        self.base_path = base_path
+        self.overrides = overrides
+        self.name = name
+        self.wave = wave
+        self.yml = base_path.lower().endswith('.yml')
+        self.text_patching = self.yml and not any(
+            callable(target) for target in overrides.values())
+        self.written = []
+        self.unchanged = []
+        self._base = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_base'] = None
+        return state
+
+    def parameters(self, case):
+        """the case with gamma added if needed"""
+        case = OrderedDict(case)
+        hs, tp = self.wave
+        if ('gamma' in self.overrides and 'gamma' not in case and
+                hs in case and tp in case):
+            case['gamma'] = gamma_dnv(case[hs], case[tp])
+        return case
+
+    def _targets(self, parameters):
+        for parameter, target in self.overrides.items():
+            if parameter not in parameters:
+                continue
+            if isinstance(target, str):
+                target = (None, target)
+            yield target, parameters[parameter]
+
+    def patch(self, parameters):
+        """text of the .yml file for a case"""
+        if self._base is None:
+            with open(self.base_path) as f:
+                self._base = f.read()
+        text = self._base
+        for (object_name, key), value in self._targets(parameters):
+            text = patch_yml(text, key, value, object_name)
+        return text
+
+    def edit(self, parameters):
+        """the base Model, loaded once per process, edited for a case"""
+        if self._base is None:
+            from pyofx import Model
+            self._base = Model(self.base_path)
+        for target, value in self._targets(parameters):
+            if callable(target):
+                target(self._base, value)
+            else:
+                _set_data(self._base, target[0], target[1], value)
+        return self._base
+
+    def write(self, path, parameters):
+        """write the case to `path`, False if the file already had the same contents"""
+        if not self.text_patching:
+            return self._save(path, self.edit(parameters))
+        text = self.patch(parameters)
+        if os.path.isfile(path):
+            with open(path) as f:
+                if f.read() == text:
+                    return False
+        with open(path, 'w') as f:
+            f.write(text)
+        return True
+
+    def _save(self, path, model):
+        """save `model` beside `path` and replace it if the contents differ"""
+        handle, temp_path = tempfile.mkstemp(os.path.splitext(path)[1],
+                                             dir=os.path.dirname(path) or None)
+        os.close(handle)
+        try:
+            model.SaveData(temp_path)
+            if os.path.isfile(path) and filecmp.cmp(temp_path, path, shallow=False):
+                return False
+            os.replace(temp_path, path)
+            return True
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def generate(self, directory, cases, processes=None, manifest="manifest.json"):
+        """write a data file to `directory` for each case (e.g. from parameter_grid) in a
+        pool of `processes` worker processes (defaults to the number of cpus, 1 to run in
+        this process) and a json `manifest` file (if not None) of case ID: path and
+        parameters, which is also returned."""
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        entries = OrderedDict()
+        for index, case in enumerate(cases):
+            parameters = self.parameters(case)
+            case_id = self.name.format(index=index, **parameters)
+            if case_id in entries:
+                raise OFXError("Case ID {} is not unique, add parameters to the name."
+                               .format(case_id))
+            path = dat_sim_paths(directory, case_id, self.yml)[0]
+            entries[case_id] = OrderedDict([('path', path), ('parameters', parameters)])
+        jobs = [(entry['path'], entry['parameters']) for entry in entries.values()]
+        if processes == 1:
+            written = [_write_case(job, self) for job in jobs]
+        else:
+            pool = Pool(processes, _init_worker, (self,))
+            try:
+                written = pool.map(_write_case, jobs, chunksize=max(1, len(jobs) // 64))
+            finally:
+                pool.close()
+                pool.join()
+        self.written = [path for (path, _), w in zip(jobs, written) if w]
+        self.unchanged = [path for (path, _), w in zip(jobs, written) if not w]
+        if manifest is not None:
+            from pyofx.jobs import _write_atomic
+            _write_atomic(os.path.join(directory, manifest), json.dumps(entries, indent=1))
+        return entries
+
+
+_worker_generator = None
+
+
+def _init_worker(generator):
+    global _worker_generator
+    _worker_generator = generator
+
+
+def _write_case(job, generator=None):
+    generator = generator or _worker_generator
+    path, parameters = job
+    return generator.write(path, parameters)
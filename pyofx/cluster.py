@@ -0,0 +1,334 @@
+"""
+Cluster
+
+Run `pyofx.Jobs` on your own machines: a coordinator backend hands out jobs over TCP to
+workers on any number of nodes.
+
+    ClusterBackend   Jobs backend that queues the jobs and leases them to workers
+    ClusterWorker    leases jobs from a coordinator, runs them and reports the result
+
+Workers hold a lease on each job they run and renew it with heartbeats, if a node crashes
+its lease expires and the job is requeued for another worker (up to max_attempts times).
+The data files must be on a filesystem shared by the coordinator and workers. There is no
+authentication so the coordinator only listens on localhost unless it is given the
+interface to listen on, only do that on a trusted network.
+
+Usage, on the coordinator:
+    from pyofx import Jobs
+    from pyofx.cluster import ClusterBackend
+    j = Jobs(backend=ClusterBackend(host='10.0.0.1', port=5125))
+    j.add_file(r"/shared/case_1.dat")
+    j.run(wait=True)
+
+and on each node (one worker per licence/core):
+    python -m pyofx.cluster coordinator-host 5125
+
+"""
+
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, wait as wait_for
+
+try:
+    import socketserver
+except ImportError:
+    # python 2 then
+    import SocketServer as socketserver
+
+from pyofx import OFXError
+from pyofx.jobs import run_simulation, _time_string
+
+
+def _request(address, message, timeout=30.0):
+    """send one json message to the coordinator and return its reply"""
+    connection = socket.create_connection(address, timeout)
+    try:
+        connection.sendall((json.dumps(message) + '\n').encode('utf-8'))
+        reply = connection.makefile('rb').readline()
+    finally:
+        connection.close()
+    if not reply:
+        raise OFXError("No reply from the coordinator at {}:{}.".format(*address))
+    return json.loads(reply.decode('utf-8'))
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            reply = self.server.backend.handle(json.loads(line.decode('utf-8')))
+        except Exception as e:
+            reply = {'ok': False, 'error': str(e)}
+        self.wfile.write((json.dumps(reply) + '\n').encode('utf-8'))
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ClusterBackend(object):
+
+    """Jobs backend that leases jobs to ClusterWorkers connecting over TCP.
+
+    The coordinator listens on (host, port), port 0 picks a free port (see address).
+    The default host only accepts workers on the same machine, pass the address of the
+    interface the nodes reach (or '0.0.0.0' for all of them) to run across machines.
+    A worker's lease on a job lasts `lease_time` seconds and is renewed by its heartbeats,
+    the server checks for expired leases every lease_time / 3 seconds and requeues them,
+    a job fails after `max_attempts` expired leases.
+
+    Like LocalBackend, run(wait=False) returns straight away, wait() blocks until the jobs
+    finish and future(filepath) gives a concurrent.futures.Future for each job so it works
+    with run_async and Pipeline. stop() closes the server.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, lease_time=60.0, max_attempts=3):
+        self.host = host
+        self.port = port
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.jobs = OrderedDict()
+        self._last_run = {}  # filepath: ID of its last job
+        self._queue = deque()
+        self._leases = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._stopped = threading.Event()
+
+    @property
+    def address(self):
+        """(host, port) the coordinator is listening on"""
+        if self._server is None:
+            return self.host, self.port
+        return self._server.server_address[:2]
+
+    def start(self):
+        """start listening for workers (run does this)"""
+        if self._server is not None:
+            return
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.backend = self
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self._stopped.clear()
+        reaper = threading.Thread(target=self._reap)
+        reaper.daemon = True
+        reaper.start()
+
+    def _reap(self):
+        """requeue expired leases until stop() is called"""
+        while not self._stopped.wait(self.lease_time / 3.0):
+            with self._lock:
+                self._requeue_expired()
+
+    def stop(self):
+        self._stopped.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def check_file(self, filepath):
+        """the absolute path of `filepath`, which must exist"""
+        if not os.path.isfile(filepath):
+            raise OFXError("{} not a vaild file.".format(filepath))
+        return os.path.abspath(filepath)
+
+    def add(self, filepath):
+        pass
+
+    def run(self, filepaths, wait=False, statics=False):
+        self.start()
+        with self._lock:
+            for filepath in filepaths:
+                job = {'ID': str(len(self.jobs) + 1), 'File': filepath, 'Status': 'Pending',
+                       'Start Time': '', 'Completed Time': '', 'Name of machine': '',
+                       'Status string': '', 'Attempts': 0, 'statics': statics}
+                self.jobs[job['ID']] = job
+                self._last_run[filepath] = job['ID']
+                self._futures[job['ID']] = Future()
+                self._queue.append(job['ID'])
+        if wait:
+            self.wait()
+
+    def wait(self):
+        """block until all the jobs submitted so far have finished"""
+        wait_for(list(self._futures.values()))
+
+    def last_job(self, filepath):
+        """the job dictionary of the last run of `filepath`"""
+        if filepath not in self._last_run:
+            raise OFXError("{} has not been run.".format(filepath))
+        return self.jobs[self._last_run[filepath]]
+
+    def future(self, filepath):
+        """the concurrent.futures.Future of the last run of the job for `filepath`"""
+        return self._futures[self.last_job(filepath)['ID']]
+
+    def status(self):
+        """dictionary of filepath: 'Pending', 'Running', 'Completed' or 'Failed'"""
+        with self._lock:
+            return dict((job['File'], job['Status']) for job in self.jobs.values())
+
+    def list(self):
+        """a generator of a dictionary for each job, as LocalBackend.list"""
+        self.status()
+        for job in list(self.jobs.values()):
+            yield dict(job)
+
+    def _requeue_expired(self):
+        now = time.time()
+        for job_id, (worker, expires) in list(self._leases.items()):
+            if expires > now:
+                continue
+            del self._leases[job_id]
+            job = self.jobs[job_id]
+            if job['Attempts'] >= self.max_attempts:
+                self._finish(job, False, "lease expired {} times, last on {}".format(
+                    job['Attempts'], worker))
+            else:
+                job['Status'] = 'Pending'
+                job['Status string'] = "lease on {} expired".format(worker)
+                self._queue.appendleft(job_id)
+
+    def _finish(self, job, ok, error=None, start=None, end=None):
+        job.update({'Status': 'Completed' if ok else 'Failed',
+                    'Completed Time': _time_string(end or time.time()),
+                    'Status string': error or ''})
+        if start:
+            job['Start Time'] = _time_string(start)
+        future = self._futures[job['ID']]
+        if ok:
+            future.set_result((start, end, job['Name of machine']))
+        else:
+            future.set_exception(OFXError(error))
+
+    def handle(self, message):
+        """the reply to a worker's message, called by the server"""
+        with self._lock:
+            op = message.get('op')
+            worker = message.get('worker', '')
+            if op == 'lease':
+                if not self._queue:
+                    return {'ok': True, 'job': None}
+                job = self.jobs[self._queue.popleft()]
+                job.update({'Status': 'Running', 'Name of machine': worker,
+                            'Start Time': _time_string(time.time())})
+                job['Attempts'] += 1
+                self._leases[job['ID']] = (worker, time.time() + self.lease_time)
+                return {'ok': True, 'lease': self.lease_time,
+                        'job': {'id': job['ID'], 'file': job['File'],
+                                'statics': job['statics']}}
+            lease = self._leases.get(message.get('id'))
+            if lease is None or lease[0] != worker:
+                return {'ok': False, 'error': 'lease lost'}
+            if op == 'heartbeat':
+                self._leases[message['id']] = (worker, time.time() + self.lease_time)
+                return {'ok': True}
+            if op == 'result':
+                del self._leases[message['id']]
+                self._finish(self.jobs[message['id']], message['success'],
+                             message.get('error'), message.get('start'), message.get('end'))
+                return {'ok': True}
+            return {'ok': False, 'error': "unknown op {}".format(op)}
+
+
+class ClusterWorker(object):
+
+    """Leases jobs from the coordinator at `address` (host, port) and runs them one at a time
+    with `runner(filepath, statics)` (run_simulation by default), sending heartbeats while a
+    job runs. A job fails if the runner raises.
+
+    run() works until stop() is called, or with stop_when_idle=True until there are no
+    jobs left. If the coordinator can't be reached it tries again every `poll_interval`
+    seconds.
+    """
+
+    def __init__(self, address, runner=run_simulation, name=None, poll_interval=5.0):
+        self.address = tuple(address)
+        self.runner = runner
+        self.name = name or "{}:{}".format(socket.gethostname(), os.getpid())
+        self.poll_interval = poll_interval
+        self.completed = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run(self, stop_when_idle=False):
+        self._stop.clear()
+        while not self._stop.is_set():
+            try:
+                reply = _request(self.address, {'op': 'lease', 'worker': self.name})
+            except (socket.error, OFXError):
+                if stop_when_idle:
+                    return
+                self._stop.wait(self.poll_interval)
+                continue
+            if reply.get('job') is None:
+                if stop_when_idle:
+                    return
+                self._stop.wait(self.poll_interval)
+                continue
+            self._run_job(reply['job'], reply['lease'])
+
+    def _run_job(self, job, lease):
+        done = threading.Event()
+
+        def heartbeat():
+            while not done.wait(lease / 3.0):
+                try:
+                    _request(self.address, {'op': 'heartbeat', 'worker': self.name,
+                                            'id': job['id']})
+                except (socket.error, OFXError):
+                    pass
+
+        beats = threading.Thread(target=heartbeat)
+        beats.daemon = True
+        beats.start()
+        start = time.time()
+        try:
+            self.runner(job['file'], job['statics'])
+            success, error = True, None
+        except Exception as e:
+            success, error = False, str(e)
+        done.set()
+        beats.join()
+        try:
+            _request(self.address, {'op': 'result', 'worker': self.name, 'id': job['id'],
+                                    'success': success, 'error': error,
+                                    'start': start, 'end': time.time()})
+            self.completed += 1
+        except (socket.error, OFXError):
+            pass
+
+    def start(self, stop_when_idle=False):
+        """run in a background thread"""
+        self._thread = threading.Thread(target=self.run, args=(stop_when_idle,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """stop after the current job"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a pyofx cluster worker.")
+    parser.add_argument("host", help="the coordinator host")
+    parser.add_argument("port", type=int, help="the coordinator port")
+    parser.add_argument("--name", help="worker name (default host:pid)")
+    args = parser.parse_args()
+    ClusterWorker((args.host, args.port), name=args.name).run()
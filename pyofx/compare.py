@@ -0,0 +1,157 @@
+"""
+Compare
+
+Regression comparison of two campaigns of simulations, e.g. before and after an OrcaFlex
+upgrade or a model change.
+
+    compare_models   pairs the sims in two folder trees by their relative path and compares
+                     the requested results of each pair
+    Comparison       the differences of each result, ranked by how far out of tolerance
+                     they are, with a csv report
+
+The results of each sim are fetched in one batch and all the results of a pair compared
+at once with numpy, in a pool of worker processes if asked.
+
+Usage:
+    from pyofx.compare import compare_models
+    comparison = compare_models(r"C:\\project\\v10", r"C:\\project\\v11",
+                                [("Line1", "Effective Tension", 0.0),
+                                 ("Vessel1", "X")], rtol=0.01, processes=4)
+    comparison.write_report(r"C:\\project\\differences.csv")
+    comparison.summary()
+
+"""
+
+import csv
+import os
+
+import numpy as np
+
+from pyofx import complete_sim, process_sims
+from pyofx.stats import request_time_histories
+
+METRICS = ('ratio', 'max_abs', 'rms', 'max_rel', 'delta_max', 'delta_min')
+
+
+def pair_paths(tree_a, tree_b, filetype="sim"):
+    """(pairs, only_in_a, only_in_b) of the files in two folder trees matched by their path
+    relative to each tree, pairs is a sorted list of (relative path, path a, path b)"""
+    from pyofx import Models
+
+    def relative(tree):
+        paths = Models(tree, filetype=filetype, subdirectories=True,
+                       return_model=False).paths()
+        return dict((os.path.normcase(os.path.relpath(p, tree)), p) for p in paths)
+
+    a, b = relative(tree_a), relative(tree_b)
+    pairs = [(key, a[key], b[key]) for key in sorted(set(a) & set(b))]
+    return pairs, sorted(set(a) - set(b)), sorted(set(b) - set(a))
+
+
+def differences(a, b, rtol=1e-3, atol=1e-6):
+    """dictionary of metric: array (one value per column) comparing the (samples, results)
+    arrays `a` (the reference) and `b`.
+
+    ratio       max over the samples of |b - a| / (atol + rtol * |a|), > 1 is out of
+                tolerance (as numpy.allclose)
+    max_abs     max |b - a|
+    rms         root mean square of b - a
+    max_rel     max_abs relative to max |a|
+    delta_max   change in the maximum
+    delta_min   change in the minimum
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    diff = b - a
+    max_abs = np.abs(diff).max(axis=0)
+    scale = np.abs(a).max(axis=0)
+    return {'ratio': (np.abs(diff) / (atol + rtol * np.abs(a))).max(axis=0),
+            'max_abs': max_abs,
+            'rms': np.sqrt((diff ** 2).mean(axis=0)),
+            'max_rel': max_abs / np.where(scale > 0, scale, 1.0),
+            'delta_max': b.max(axis=0) - a.max(axis=0),
+            'delta_min': b.min(axis=0) - a.min(axis=0)}
+
+
+def _results(path, requests):
+    from pyofx import Period
+    m = complete_sim(path)
+    period = Period(1)
+    return m.SampleTimes(period), request_time_histories(m, requests, period)
+
+
+def compare_pair(relative_path, path_a, path_b, requests, rtol=1e-3, atol=1e-6):
+    """differences of one pair of sims (`relative_path` names the pair in errors), if their
+    sample times differ the results of b are interpolated onto the times of a. Raises
+    OFXError if either is not complete."""
+    times_a, a = _results(path_a, requests)
+    times_b, b = _results(path_b, requests)
+    if len(times_a) != len(times_b) or not np.allclose(times_a, times_b):
+        b = np.column_stack([np.interp(times_a, times_b, column) for column in b.T])
+    return differences(a, b, rtol, atol)
+
+
+class Comparison(object):
+
+    """The differences between two campaigns.
+
+    rows is a list of a dictionary for each result of each pair of sims (case, object,
+    variable, arc_length, the METRICS and passed) sorted by ratio, largest first.
+    only_in_a and only_in_b list the unpaired sims and errors the pairs that could not be
+    compared.
+    """
+
+    def __init__(self, rows, only_in_a, only_in_b, errors):
+        self.rows = sorted(rows, key=lambda row: row['ratio'], reverse=True)
+        self.only_in_a = only_in_a
+        self.only_in_b = only_in_b
+        self.errors = errors
+
+    @property
+    def failed(self):
+        """the rows out of tolerance"""
+        return [row for row in self.rows if not row['passed']]
+
+    def summary(self):
+        cases = set(row['case'] for row in self.rows)
+        failed_cases = set(row['case'] for row in self.failed)
+        return {'cases': len(cases), 'results': len(self.rows),
+                'failed cases': len(failed_cases), 'failed results': len(self.failed),
+                'errors': len(self.errors), 'only in a': len(self.only_in_a),
+                'only in b': len(self.only_in_b)}
+
+    def write_report(self, path, limit=None):
+        """csv of the `limit` (default all) largest differences, ranked"""
+        columns = ['case', 'object', 'variable', 'arc_length'] + list(METRICS) + ['passed']
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['rank'] + columns)
+            for rank, row in enumerate(self.rows[:limit], 1):
+                writer.writerow([rank] + [row[c] for c in columns])
+
+
+def compare_models(tree_a, tree_b, requests, rtol=1e-3, atol=1e-6, processes=1,
+                   filetype="sim"):
+    """Comparison of the results of every pair of sims in the folder trees `tree_a` (the
+    reference) and `tree_b`, paired by relative path.
+
+    requests are (object name, variable, arc length) as pyofx.stats.sim_stats, each is
+    compared over stage 1 with numpy.allclose style tolerances `rtol` and `atol`. With
+    processes > 1 (or None for one per cpu) the pairs are compared in a pool of worker
+    processes.
+    """
+    pairs, only_in_a, only_in_b = pair_paths(tree_a, tree_b, filetype)
+    jobs = ((relative_path, path_a, path_b, requests, rtol, atol)
+            for relative_path, path_a, path_b in pairs)
+    rows, errors = [], []
+    for job, metrics, error in process_sims(compare_pair, jobs, processes):
+        if error:
+            errors.append(error)
+            continue
+        for n, request in enumerate(requests):
+            row = {'case': job[0], 'object': request[0], 'variable': request[1],
+                   'arc_length': request[2] if len(request) > 2 else None}
+            row.update((metric, float(metrics[metric][n])) for metric in METRICS)
+            row['passed'] = row['ratio'] <= 1.0
+            rows.append(row)
+    return Comparison(rows, only_in_a, only_in_b, errors)
@@ -0,0 +1,458 @@
+"""
+Fake
+
+An in-memory stand in for OrcFxAPI so pyofx (Model, Models, ULS.py, FLS.py, the stats and
+jobs modules) can be tested and benchmarked without OrcaFlex or a licence, e.g. on Linux.
+
+    Model                       objects, CreateObject, LoadData/SaveData/SaveDataMem,
+                                LoadSimulation/SaveSimulation, CalculateStatics,
+                                RunSimulation, SampleTimes
+    OrcaFlexObject              data items, TimeHistory, RangeGraph, NodeArclengths
+    GetMultipleTimeHistories    and the other module level functions pyofx uses
+    configure                   sample interval, seed and artificial latency
+
+Results are synthetic: every time history is a few sinusoids plus noise, seeded by the
+model data and the object, variable and position, so the same case always gives the same
+results and different cases give different ones. Files are saved as json.
+
+Usage, select the fake before Model etc. are first used:
+    import pyofx
+    pyofx.use_api('pyofx.fake')
+    from pyofx import fake
+    fake.configure(latency={'LoadSimulation': 0.05, 'TimeHistory': 0.001})
+
+or set the environment variable PYOFX_API=pyofx.fake (which worker processes inherit),
+e.g. to run the tests without OrcaFlex:
+    PYOFX_API=pyofx.fake python -m pytest tests.py
+
+"""
+
+import ctypes as ct
+import json
+import math
+import os
+import time
+import zlib
+
+import numpy as np
+
+__all__ = ['ct', 'DLLError', 'DLLVersion', 'ModelState', 'Model', 'OrcaFlexObject',
+           'Period', 'SpecifiedPeriod', 'TimeHistorySpecification', 'GetMultipleTimeHistories',
+           'ModalAnalysisSpecification', 'Modes', 'oeNodeNum', 'oeArcLength', 'oeEndA',
+           'oeEndB', 'arSpecifiedSections', 'arEntireLine', 'pnBuildUp', 'pnWholeSimulation',
+           'pnLatestWave', 'pnStaticState', 'pnSpecifiedPeriod',
+           'otGeneral', 'otEnvironment', 'otVessel', 'otLine', 'ot6DBuoy', 'ot3DBuoy',
+           'otWinch', 'otLink', 'otShape', 'otVesselType', 'otLineType']
+
+otGeneral, otEnvironment, otVessel, otLine, ot6DBuoy, ot3DBuoy = 1, 3, 5, 6, 7, 8
+otWinch, otLink, otShape, otVesselType, otLineType = 9, 10, 11, 13, 14
+
+_TYPE_NAMES = {otGeneral: 'General', otEnvironment: 'Environment', otVessel: 'Vessel',
+               otLine: 'Line', ot6DBuoy: '6D Buoy', ot3DBuoy: '3D Buoy', otWinch: 'Winch',
+               otLink: 'Link', otShape: 'Shape', otVesselType: 'Vessel Type',
+               otLineType: 'Line Type'}
+
+_DEFAULT_DATA = {otGeneral: {'StageDuration': [8.0, 16.0], 'ImplicitConstantTimeStep': 0.1},
+                 otEnvironment: {'WaveHs': 2.0, 'WaveTp': 8.0, 'WaveDirection': 180.0},
+                 otLine: {'Length': [100.0], 'TargetSegmentLength': [10.0]}}
+
+pnBuildUp, pnWholeSimulation, pnLatestWave = 0, 32001, 32002
+pnStaticState, pnSpecifiedPeriod = 32003, 32004
+
+# change with configure()
+settings = {'sample_interval': 0.1, 'seed': 0, 'latency': 0.0}
+
+
+def configure(sample_interval=None, seed=None, latency=None):
+    """change the synthetic results: the log `sample_interval` (s), a `seed` mixed into all
+    of them and the artificial `latency` (s) of every API call, either a number for all
+    calls or a dictionary of method name: seconds (e.g. {'LoadSimulation': 0.05})."""
+    for key, value in (('sample_interval', sample_interval), ('seed', seed),
+                       ('latency', latency)):
+        if value is not None:
+            settings[key] = value
+
+
+def _delay(name):
+    latency = settings['latency']
+    if isinstance(latency, dict):
+        latency = latency.get(name, 0.0)
+    if latency:
+        time.sleep(latency)
+
+
+def _crc(*parts):
+    return zlib.crc32(repr(parts).encode('utf-8')) & 0xffffffff
+
+
+class DLLError(Exception):
+    pass
+
+
+def DLLVersion():
+    return "pyofx fake"
+
+
+class ModelState(object):
+    Reset = 0
+    CalculatingStatics = 1
+    InStaticState = 2
+    RunningSimulation = 3
+    SimulationPaused = 4
+    SimulationStopped = 5
+    SimulationStoppedUnstable = 6
+
+
+class Period(object):
+
+    def __init__(self, period_number, fromTime=None, toTime=None):
+        self.period_number = period_number
+        self.fromTime = fromTime
+        self.toTime = toTime
+
+    def __repr__(self):
+        return "Period({}, {}, {})".format(self.period_number, self.fromTime, self.toTime)
+
+
+def SpecifiedPeriod(fromTime, toTime):
+    return Period(pnSpecifiedPeriod, fromTime, toTime)
+
+
+class _ObjectExtra(object):
+
+    def __init__(self, kind, value=None):
+        self.kind = kind
+        self.value = value
+
+    def __repr__(self):
+        return "{}({})".format(self.kind, self.value)
+
+
+def oeNodeNum(node_number):
+    return _ObjectExtra('NodeNum', node_number)
+
+
+def oeArcLength(arc_length):
+    return _ObjectExtra('ArcLength', float(arc_length))
+
+
+oeEndA = _ObjectExtra('EndA')
+oeEndB = _ObjectExtra('EndB')
+
+
+class _ArclengthRange(object):
+
+    def __init__(self, from_arc_length=None, to_arc_length=None):
+        self.from_arc_length = from_arc_length
+        self.to_arc_length = to_arc_length
+
+
+def arSpecifiedSections(from_section, to_section):
+    return _ArclengthRange(from_section, to_section)
+
+
+arEntireLine = _ArclengthRange()
+
+
+class TimeHistorySpecification(object):
+
+    def __init__(self, obj, varName, objectExtra=None):
+        self.obj = obj
+        self.varName = varName
+        self.objectExtra = objectExtra
+
+
+class ModalAnalysisSpecification(object):
+
+    def __init__(self, calculateShapes=True, firstMode=-1, lastMode=-1):
+        self.calculateShapes = calculateShapes
+        self.firstMode = firstMode
+        self.lastMode = lastMode
+
+
+class _ModeDetails(object):
+
+    def __init__(self, modeNumber, period):
+        self.modeNumber = modeNumber
+        self.period = period
+        self.frequency = 1.0 / period
+
+
+class Modes(object):
+
+    """string modes of a line, period 2L/nc for a wave speed c of 50m/s"""
+
+    def __init__(self, obj, specification=None):
+        _delay('Modes')
+        specification = specification or ModalAnalysisSpecification()
+        if obj.model.state != ModelState.InStaticState:
+            raise DLLError("Statics must be calculated for modal analysis.")
+        first = max(specification.firstMode, 1)
+        last = specification.lastMode if specification.lastMode > 0 else 20
+        self._length = sum(obj.Length)
+        self._numbers = range(first, last + 1)
+        self.modeCount = len(self._numbers)
+
+    def modeDetails(self, index):
+        number = self._numbers[index]
+        return _ModeDetails(number, 2.0 * self._length / (number * 50.0))
+
+
+class _RangeGraph(object):
+
+    def __init__(self, X, Min, Max, Mean, StdDev):
+        self.X = X
+        self.Min = Min
+        self.Max = Max
+        self.Mean = Mean
+        self.StdDev = StdDev
+
+
+def _signal(seed, times):
+    """a few sinusoids plus noise"""
+    rng = np.random.RandomState(seed)
+    mean = rng.uniform(-10.0, 10.0)
+    amplitudes = rng.uniform(0.5, 2.0, 3)
+    frequencies = 2 * math.pi / rng.uniform(4.0, 20.0, 3)
+    phases = rng.uniform(0.0, 2 * math.pi, 3)
+    waves = np.sin(np.outer(times, frequencies) + phases).dot(amplitudes)
+    return mean + waves + 0.1 * rng.standard_normal(len(times))
+
+
+class OrcaFlexObject(object):
+
+    """an object in a fake Model, data items are attributes starting with a capital"""
+
+    def __init__(self, model, type, name, data=None):
+        object.__setattr__(self, 'model', model)
+        object.__setattr__(self, 'type', type)
+        object.__setattr__(self, 'typeName', _TYPE_NAMES.get(type, 'Unknown'))
+        object.__setattr__(self, '_data', dict(_DEFAULT_DATA.get(type, {})))
+        self._data['Name'] = name
+        self._data.update(data or {})
+
+    def __getattr__(self, name):
+        data = object.__getattribute__(self, '_data')
+        if name in data:
+            return data[name]
+        if name == 'name':
+            return data['Name']
+        raise AttributeError("{} has no data item {}".format(data['Name'], name))
+
+    def __setattr__(self, name, value):
+        if not name[:1].isupper():
+            return object.__setattr__(self, name, value)
+        self._data[name] = value
+        self.model.Reset()
+
+    def __repr__(self):
+        return "<fake {}: {}>".format(self.typeName, self.Name)
+
+    @property
+    def NodeArclengths(self):
+        length = sum(self.Length)
+        segments = max(1, int(math.ceil(length / self.TargetSegmentLength[0])))
+        return np.linspace(0.0, length, segments + 1)
+
+    def _seed(self, varName, objectExtra):
+        return _crc(self.model._seed(), self.Name, varName, repr(objectExtra))
+
+    def TimeHistory(self, varName, period=None, objectExtra=None):
+        _delay('TimeHistory')
+        return _signal(self._seed(varName, objectExtra), self.model._times(period))
+
+    def RangeGraph(self, varName, period=None, objectExtra=None, arclengthRange=None):
+        _delay('RangeGraph')
+        self.model._times(period)
+        X = self.NodeArclengths
+        if arclengthRange is not None and arclengthRange.from_arc_length is not None:
+            start = (arclengthRange.from_arc_length - 1) * len(X) // len(self.Length)
+            stop = arclengthRange.to_arc_length * len(X) // len(self.Length)
+            X = X[start:stop]
+        rng = np.random.RandomState(self._seed(varName, 'RangeGraph'))
+        shape = np.sin(math.pi * X / X.max()) if X.max() > 0 else np.ones_like(X)
+        mean = rng.uniform(-10.0, 10.0) + rng.uniform(-5.0, 5.0) * shape
+        std = rng.uniform(0.5, 2.0) * (1.0 + shape)
+        return _RangeGraph(X, mean - 3 * std, mean + 3 * std, mean, std)
+
+
+class Model(object):
+
+    """a fake OrcFxAPI.Model"""
+
+    def __init__(self, filename=None, threadCount=None):
+        _delay('Model')
+        self.state = ModelState.Reset
+        self.simulationComplete = False
+        self._virtual_logging = False
+        self._text = ''
+        self._objects = []
+        self._default_objects()
+        if filename is not None:
+            if os.path.splitext(filename)[1].lower() == '.sim':
+                self.LoadSimulation(filename)
+            else:
+                self.LoadData(filename)
+
+    def _default_objects(self):
+        self._objects = [OrcaFlexObject(self, otGeneral, 'General'),
+                         OrcaFlexObject(self, otEnvironment, 'Environment'),
+                         OrcaFlexObject(self, otVesselType, 'Vessel Type1'),
+                         OrcaFlexObject(self, otLineType, 'Line Type1')]
+
+    @property
+    def objects(self):
+        return list(self._objects)
+
+    @property
+    def status(self):
+        return [name for name, value in vars(ModelState).items() if value == self.state][0]
+
+    @property
+    def general(self):
+        return self['General']
+
+    @property
+    def environment(self):
+        return self['Environment']
+
+    def __getitem__(self, name):
+        _delay('__getitem__')
+        for obj in self._objects:
+            if obj.Name == name:
+                return obj
+        raise DLLError("No object called {}".format(name))
+
+    def CreateObject(self, type, name=None):
+        _delay('CreateObject')
+        if name is None:
+            names = set(obj.Name for obj in self._objects)
+            n = 1
+            while "{}{}".format(_TYPE_NAMES[type], n) in names:
+                n += 1
+            name = "{}{}".format(_TYPE_NAMES[type], n)
+        obj = OrcaFlexObject(self, type, name)
+        self._objects.append(obj)
+        self.Reset()
+        return obj
+
+    def DestroyObject(self, obj):
+        self._objects.remove(obj)
+        self.Reset()
+
+    def Reset(self):
+        self.state = ModelState.Reset
+        self.simulationComplete = False
+
+    def _seed(self):
+        return _crc(settings['seed'], self._text, self._dump_objects())
+
+    def _dump_objects(self):
+        return [{'type': obj.type, 'data': obj._data} for obj in self._objects]
+
+    def _load_objects(self, objects):
+        self._objects = [OrcaFlexObject(self, o['type'], o['data']['Name'], o['data'])
+                         for o in objects]
+
+    def _save(self, filename, simulation):
+        content = {'pyofx_fake': 1, 'objects': self._dump_objects(), 'text': self._text,
+                   'state': self.state if simulation else ModelState.Reset,
+                   'complete': simulation and self.simulationComplete,
+                   'sample_interval': settings['sample_interval']}
+        with open(filename, 'w') as f:
+            json.dump(content, f)
+
+    def _load(self, filename):
+        with open(filename) as f:
+            text = f.read()
+        try:
+            content = json.loads(text)
+        except ValueError:
+            content = None
+        if not isinstance(content, dict) or 'pyofx_fake' not in content:
+            # e.g. a real OrcaFlex text data file, seed the results from its contents
+            self._default_objects()
+            self._text = text
+            return {}
+        self._load_objects(content['objects'])
+        self._text = content['text']
+        return content
+
+    def LoadData(self, filename):
+        _delay('LoadData')
+        self._load(filename)
+        self.Reset()
+
+    def SaveData(self, filename):
+        _delay('SaveData')
+        self._save(filename, False)
+
+    def SaveDataMem(self):
+        _delay('SaveDataMem')
+        return json.dumps({'objects': self._dump_objects(), 'text': self._text},
+                          sort_keys=True).encode()
+
+    def LoadSimulation(self, filename):
+        _delay('LoadSimulation')
+        content = self._load(filename)
+        self.state = content.get('state', ModelState.Reset)
+        self.simulationComplete = content.get('complete', False)
+        self.general._data['ActualLogSampleInterval'] = content.get(
+            'sample_interval', settings['sample_interval'])
+
+    def SaveSimulation(self, filename):
+        _delay('SaveSimulation')
+        self._save(filename, True)
+
+    def UseVirtualLogging(self):
+        self._virtual_logging = True
+
+    def CalculateStatics(self):
+        _delay('CalculateStatics')
+        self.state = ModelState.InStaticState
+
+    def RunSimulation(self):
+        _delay('RunSimulation')
+        if self._virtual_logging:
+            raise DLLError("Cannot run a simulation with virtual logging.")
+        self.general._data['ActualLogSampleInterval'] = settings['sample_interval']
+        self.state = ModelState.SimulationStopped
+        self.simulationComplete = True
+
+    def _times(self, period=None):
+        if self.state not in (ModelState.SimulationStopped,
+                              ModelState.SimulationStoppedUnstable):
+            raise DLLError("No simulation results.")
+        stages = self.general.StageDuration
+        ends = np.cumsum([-stages[0]] + list(stages))
+        if period is None:
+            period = Period(pnWholeSimulation)
+        elif not isinstance(period, Period):
+            period = Period(period)
+        if period.period_number == pnWholeSimulation:
+            start, end = ends[0], ends[-1]
+        elif period.period_number == pnSpecifiedPeriod:
+            start, end = period.fromTime, period.toTime
+        elif period.period_number == pnLatestWave:
+            start, end = max(ends[0], ends[-1] - self.environment.WaveTp), ends[-1]
+        elif 0 <= period.period_number < len(stages):
+            start, end = ends[period.period_number], ends[period.period_number + 1]
+        else:
+            raise DLLError("Invalid period {}".format(period))
+        dt = self.general.ActualLogSampleInterval
+        return np.arange(start, end + dt / 2.0, dt)
+
+    def SampleTimes(self, period=None):
+        _delay('SampleTimes')
+        return self._times(period)
+
+
+def GetMultipleTimeHistories(specifications, period=None):
+    """(samples, specifications) array of all the time histories in one call"""
+    _delay('GetMultipleTimeHistories')
+    if not specifications:
+        return np.empty((0, 0))
+    times = specifications[0].obj.model._times(period)
+    return np.column_stack([
+        _signal(spec.obj._seed(spec.varName, spec.objectExtra), times)
+        for spec in specifications])
@@ -15,8 +15,13 @@ Usage:
 Prompts user to enter Azimuth, Declination and Gamma, then copies Orcaflex Rotations 1-2-3
 to clipboard
 
+    geom.best_fit_frames(reference, points, sequence='xyz')
+
+Fits the rotation and translation of a rigid body at every time step from tracked points
+(e.g. node positions), giving Orcaflex Rotations 1-2-3 for a whole time history
+
 Dependencies:
-    pyperclip
+    pyperclip (only for convert_angles, imported when it is called)
 
 written by davehankin on 20-Mar-2015
 
@@ -24,7 +29,6 @@ written by davehankin on 20-Mar-2015
 
 import math
 import numpy as np
-import pyperclip
 
 class Ucs:
     
@@ -176,6 +180,62 @@ def euler_angles(rot, sequence):
             math.degrees(r3)]
 
 
+def euler_angles_batch(rot, sequence):
+    """
+    euler_angles for a (T,3,3) array of rotation matrices, returns a (T,3) array of angles
+    in degrees
+    """
+    rot = np.asarray(rot, dtype=float)
+    if sequence == 'xyz':
+        r1 = -np.arctan2(rot[:,1,2], rot[:,2,2])
+        r2 = np.arcsin(np.clip(rot[:,0,2], -1, 1))
+        r3 = -np.arctan2(rot[:,0,1], rot[:,0,0])
+    elif sequence == 'zyz':
+        r1 = np.arctan2(rot[:,1,2], rot[:,0,2])
+        r2 = np.arccos(np.clip(rot[:,2,2], -1, 1))
+        r3 = np.arctan2(rot[:,2,1], -rot[:,2,0])
+    else:
+        raise ValueError("sequence must be 'xyz' or 'zyz' not {}".format(sequence))
+    return np.degrees(np.stack((r1, r2, r3), axis=-1))
+
+
+def best_fit_frames(reference, points, weights=None, sequence=None):
+    """
+    Best fit (least squares) rotation and translation of a rigid body at each time step by
+    the Kabsch algorithm, with one batched SVD for the whole time history.
+
+    reference is a (N,3) array of N >= 3 points (not in a line) on the body in its own
+    axes and points a (T,N,3) array of their positions at each of T time steps, optionally
+    weighted by the (N,) weights. Returns (R, t) where points[i] ~ R[i].dot(reference[j])
+    + t[i], R is a (T,3,3) array of rotation matrices (columns are the body axes as in
+    Ucs) and t a (T,3) array. If sequence is given ('xyz' or 'zyz') the euler angles
+    (T,3) in degrees are returned in place of R.
+    """
+    reference = np.asarray(reference, dtype=float)
+    points = np.asarray(points, dtype=float)
+    if points.ndim == 2:
+        points = points[None]
+    if weights is None:
+        weights = np.ones(len(reference))
+    weights = np.asarray(weights, dtype=float) / np.sum(weights)
+
+    ref_centre = weights.dot(reference)
+    centres = np.einsum('n,tni->ti', weights, points)
+    # cross covariance of each time step
+    H = np.einsum('n,ni,tnj->tij', weights, reference - ref_centre,
+                  points - centres[:,None,:])
+    U, _, Vt = np.linalg.svd(H)
+    V = np.swapaxes(Vt, 1, 2)
+    # flip the smallest axis of any reflection to make a proper rotation
+    d = np.sign(np.linalg.det(np.matmul(V, np.swapaxes(U, 1, 2))))
+    V[:,:,2] *= d[:,None]
+    R = np.matmul(V, np.swapaxes(U, 1, 2))
+    t = centres - np.einsum('tij,j->ti', R, ref_centre)
+    if sequence is not None:
+        return euler_angles_batch(R, sequence), t
+    return R, t
+
+
 def convert_angles():
     """
     Converts Orcaflex azi-dec-gamma to Rotation 1-2-3
@@ -190,5 +250,6 @@ def convert_angles():
     r123 = ucs.get_euler_angles('xyz')
 
     s = '\t'.join(['{0:.4f}'.format(x) for x in r123])
+    import pyperclip
     pyperclip.copy(s)
     
\ No newline at end of file
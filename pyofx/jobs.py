@@ -0,0 +1,741 @@
+"""
+Jobs
+
+Backends for running `pyofx.Jobs` somewhere other than Distributed OrcaFlex.
+
+    LocalBackend    runs the jobs in a pool of processes on this machine
+    JobCache        skips jobs whose inputs are unchanged since their .sim was made
+    JobMonitor      polls job status and calls back only for the jobs that changed
+    run_async       runs the jobs and returns an asyncio future for each
+    Pipeline        takes each case through statics, dynamics and post-processing
+    JobTelemetry    queue latency, run time and throughput by machine as json/Prometheus
+
+Usage:
+    from pyofx import Jobs
+    from pyofx.jobs import LocalBackend
+    j = Jobs(backend=LocalBackend(processes=4))
+    j.add_file(r"/data/case_1.dat")
+    j.run(wait=True)
+    j.status()
+
+A backend provides check_file(filepath) returning the path to use (or raising OFXError),
+add(filepath), run(filepaths, wait, statics), status() and list().
+
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import socket
+import threading
+import time
+from collections import OrderedDict, Counter
+from concurrent.futures import ProcessPoolExecutor, wait as wait_for
+from datetime import datetime
+
+import numpy as np
+
+from pyofx import OFXError, Jobs, parse_job_list
+
+
+def run_simulation(filepath, statics=False):
+    """the default LocalBackend runner: load the data file, calculate statics or run the
+    simulation and save the .sim file alongside it."""
+    from pyofx import Model
+    m = Model(filepath)
+    if statics:
+        m.CalculateStatics()
+    else:
+        m.RunSimulation()
+    m.SaveSimulation(os.path.splitext(filepath)[0] + '.sim')
+
+
+def _run_job(runner, filepath, statics):
+    start = time.time()
+    runner(filepath, statics)
+    return start, time.time(), socket.gethostname()
+
+
+def _time_string(t):
+    return datetime.fromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def _write_atomic(path, text):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+class LocalBackend(object):
+
+    """Jobs backend that runs each job in a pool of `processes` worker processes on this
+    machine (defaults to the number of cpus).
+
+    `runner(filepath, statics)` is called in the worker for each job, it defaults to
+    run_simulation. Any picklable function can be used, e.g. a stub that writes a file to
+    test without OrcaFlex. A job fails if the runner raises.
+
+    run(wait=False) returns straight away, call wait() to block until the jobs finish.
+    """
+
+    def __init__(self, runner=run_simulation, processes=None):
+        self.runner = runner
+        self.processes = processes
+        self.jobs = OrderedDict()
+        self._last_run = {}  # filepath: ID of its last job
+        self._executor = None
+        self._futures = {}
+
+    def check_file(self, filepath):
+        """the absolute path of `filepath`, which must exist"""
+        if not os.path.isfile(filepath):
+            raise OFXError("{} not a vaild file.".format(filepath))
+        return os.path.abspath(filepath)
+
+    def add(self, filepath):
+        pass
+
+    def run(self, filepaths, wait=False, statics=False):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.processes)
+        for filepath in filepaths:
+            job = {'ID': str(len(self.jobs) + 1), 'File': filepath, 'Status': 'Pending',
+                   'Start Time': '', 'Completed Time': '', 'Name of machine': '',
+                   'Status string': ''}
+            self.jobs[job['ID']] = job
+            self._last_run[filepath] = job['ID']
+            future = self._executor.submit(_run_job, self.runner, filepath, statics)
+            future.add_done_callback(lambda f, job=job: self._finished(job, f))
+            self._futures[job['ID']] = future
+        if wait:
+            self.wait()
+
+    def last_job(self, filepath):
+        """the job dictionary of the last run of `filepath`"""
+        if filepath not in self._last_run:
+            raise OFXError("{} has not been run.".format(filepath))
+        return self.jobs[self._last_run[filepath]]
+
+    def future(self, filepath):
+        """the concurrent.futures.Future of the last run of the job for `filepath`, its
+        job dictionary is up to date by the time the future's callbacks are called"""
+        future = self._futures.get(self._last_run.get(filepath))
+        if future is None:
+            raise OFXError("{} has not been run.".format(filepath))
+        return future
+
+    def _finished(self, job, future):
+        error = future.exception()
+        if error is None:
+            start, end, machine = future.result()
+            job.update({'Status': 'Completed', 'Start Time': _time_string(start),
+                        'Completed Time': _time_string(end), 'Name of machine': machine})
+        else:
+            job.update({'Status': 'Failed', 'Completed Time': _time_string(time.time()),
+                        'Status string': str(error)})
+
+    def wait(self):
+        """block until all the jobs submitted so far have finished"""
+        if self._executor is None:
+            return
+        wait_for(list(self._futures.values()))
+        self._executor.shutdown(wait=True)
+        self._executor = None
+        self._futures = {}
+
+    def status(self):
+        """dictionary of filepath: 'Pending', 'Running', 'Completed' or 'Failed'"""
+        for job_id, future in list(self._futures.items()):
+            job = self.jobs[job_id]
+            if job['Status'] == 'Pending' and future.running():
+                job['Status'] = 'Running'
+        return dict((job['File'], job['Status']) for job in self.jobs.values())
+
+    def list(self):
+        """a generator of a dictionary for each job with the same keys as Jobs.list (those
+        that apply to local jobs)"""
+        self.status()
+        for job in list(self.jobs.values()):
+            yield dict(job)
+
+
+# file names in data files, .yml is text and .dat stores them as plain strings. Each name
+# is found from its extension back over the characters a file name can have (at most
+# _MAX_NAME of them) so the search is linear in the size of the file.
+_EXTENSION = re.compile(br"\.(?:txt|csv|dat|yml|yaml|owr|wav|xls|xlsx|xlsm)", re.IGNORECASE)
+_NOT_NAME = frozenset(range(0x20)) | frozenset(b"\"'<>|*?:")
+_MAX_NAME = 260
+
+
+def _file_names(data):
+    """the candidate file names in the bytes `data`"""
+    end = 0
+    for match in _EXTENSION.finditer(data):
+        start = match.start()
+        limit = max(end, start - _MAX_NAME)
+        while start > limit:
+            if data[start - 1] not in _NOT_NAME:
+                start -= 1
+            elif (data[start - 1] == ord(':') and start - 1 > limit and
+                  data[start:start + 1] in (b'\\', b'/') and
+                  data[start - 2] not in _NOT_NAME):
+                # a drive, e.g. C:\
+                start -= 1
+            else:
+                break
+        if start < match.start():
+            end = match.end()
+            yield data[start:end].decode('latin-1').strip()
+
+
+def referenced_files(filepath):
+    """sorted list of the existing files that the data file at `filepath` refers to (e.g.
+    wave time histories or vessel data), names are relative to its directory."""
+    directory = os.path.dirname(os.path.abspath(filepath))
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    found = set()
+    for name in _file_names(data):
+        candidate = os.path.normpath(os.path.join(directory, name))
+        if os.path.isfile(candidate) and candidate != os.path.abspath(filepath):
+            found.add(candidate)
+    return sorted(found)
+
+
+def _solver_version():
+    try:
+        from pyofx import DLLVersion
+        return DLLVersion()
+    except Exception:
+        return ''
+
+
+class JobCache(object):
+
+    """A record of the inputs of each job, saved as json at `path`.
+
+    A job's key is a hash of its data file, the files it refers to (see
+    referenced_files), the solver `version` (the OrcFxAPI DLL version if None) and whether
+    it is statics only. A job is up to date if its .sim exists, was written after the job
+    was last submitted and the key has not changed since then.
+    """
+
+    def __init__(self, path="pyofx_job_cache.json", version=None):
+        self.path = path
+        self.version = _solver_version() if version is None else version
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+        else:
+            self.entries = {}
+
+    def key(self, filepath, statics=False):
+        """hex digest of the inputs of the job"""
+        h = hashlib.sha256()
+        for name in [filepath] + referenced_files(filepath):
+            with open(name, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+            h.update(os.path.basename(name).encode('utf-8'))
+        h.update(str(self.version).encode('utf-8'))
+        h.update(b'statics' if statics else b'dynamics')
+        return h.hexdigest()
+
+    def is_current(self, filepath, statics=False, key=None):
+        """True if the .sim of the job is up to date"""
+        entry = self.entries.get(os.path.normcase(os.path.abspath(filepath)))
+        sim = os.path.splitext(filepath)[0] + '.sim'
+        if entry is None or not os.path.exists(sim):
+            return False
+        if os.path.getmtime(sim) < entry['submitted']:
+            return False
+        return entry['key'] == (key or self.key(filepath, statics))
+
+    def split(self, filepaths, statics=False):
+        """(filepaths to submit, filepaths skipped as up to date), records the keys of the
+        jobs to submit and saves the cache"""
+        submit, skip = [], []
+        now = time.time()
+        for filepath in filepaths:
+            key = self.key(filepath, statics)
+            if self.is_current(filepath, statics, key):
+                skip.append(filepath)
+            else:
+                submit.append(filepath)
+                self.entries[os.path.normcase(os.path.abspath(filepath))] = {
+                    'key': key, 'submitted': now}
+        self.save()
+        return submit, skip
+
+    def save(self):
+        with open(self.path, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+
+
+FINISHED = ('Completed', 'Failed', 'Cancelled')
+
+
+class JobMonitor(object):
+
+    """Polls the jobs of a `Jobs` (or backend) and keeps a table of them by ID.
+
+    Each callback registered with on_change is called as callback(job, old_status) only
+    for the jobs whose status has changed since the last poll (old_status is None for new
+    jobs). Jobs that are no longer listed are dropped from the table.
+
+    >>> monitor = JobMonitor(jobs, interval=30)
+    >>> monitor.on_change(lambda job, old: print(job['File'], job['Status']))
+    >>> monitor.poll()  # until all the jobs have finished
+    >>> monitor.counts
+    Counter({'Completed': 98, 'Failed': 2})
+
+    For testing update() can be passed canned dofcmd -list output or job dictionaries.
+    """
+
+    def __init__(self, jobs=None, interval=10.0, finished=FINISHED):
+        self.jobs = jobs
+        self.interval = interval
+        self.finished = finished
+        self.table = OrderedDict()
+        self.callbacks = []
+        self._thread = None
+        self._stop = threading.Event()
+
+    def on_change(self, callback):
+        """register callback(job, old_status)"""
+        self.callbacks.append(callback)
+        return callback
+
+    def update(self, listing=None):
+        """refresh the table from `listing` (dofcmd -list output text or an iterable of job
+        dictionaries, if None then jobs.list()), returns the list of jobs that changed"""
+        if listing is None:
+            listing = self.jobs.list()
+        elif isinstance(listing, str):
+            listing = parse_job_list(listing)
+        seen = set()
+        changed = []
+        for job in listing:
+            job_id = job['ID']
+            seen.add(job_id)
+            old = self.table.get(job_id)
+            self.table[job_id] = job
+            old_status = None if old is None else old['Status']
+            if old_status != job['Status']:
+                changed.append((job, old_status))
+        for job_id in [job_id for job_id in self.table if job_id not in seen]:
+            del self.table[job_id]
+        for job, old_status in changed:
+            for callback in self.callbacks:
+                callback(job, old_status)
+        return [job for job, _ in changed]
+
+    @property
+    def counts(self):
+        """Counter of the number of jobs with each status"""
+        return Counter(job['Status'] for job in self.table.values())
+
+    @property
+    def done(self):
+        """True if every job in the table has finished"""
+        return all(job['Status'] in self.finished for job in self.table.values())
+
+    def poll(self, until_done=True):
+        """update every `interval` seconds until all the jobs have finished (or stop() is
+        called)"""
+        self._stop.clear()
+        while not self._stop.is_set():
+            self.update()
+            if until_done and self.done:
+                break
+            self._stop.wait(self.interval)
+
+    def start(self, until_done=True):
+        """poll in a background thread"""
+        self._thread = threading.Thread(target=self.poll, args=(until_done,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def run_async(jobs, statics=False, interval=10.0):
+    """Run `jobs` (a pyofx.Jobs) and return a list of asyncio futures, one for each job in
+    the order they were added. Must be called with an event loop running.
+
+    A future's result is the job dictionary (as from Jobs.list) once the job completes;
+    if it fails or is cancelled (or polling the backend fails) the future raises OFXError.
+    Jobs skipped by the cache are resolved straight away with the status 'Up to date'.
+    Jobs run by a LocalBackend resolve as soon as they finish, other backends are polled
+    every `interval` seconds.
+
+    >>> async def main():
+    ...     for future in asyncio.as_completed(run_async(jobs)):
+    ...         job = await future
+    ...         post_process(job['File'])
+    """
+    loop = asyncio.get_running_loop()
+    backend = jobs.backend
+    before = set() if hasattr(backend, 'future') else set(j['ID'] for j in backend.list())
+    jobs.run(wait=False, statics=statics)
+    futures = OrderedDict((filepath, loop.create_future()) for filepath, _ in jobs)
+    for filepath in jobs.skipped:
+        futures[filepath].set_result({'File': filepath, 'Status': 'Up to date'})
+
+    def resolve(filepath, job):
+        future = futures[filepath]
+        if future.done():
+            return
+        if job['Status'] == 'Completed':
+            future.set_result(job)
+        else:
+            future.set_exception(OFXError("{} {}: {}".format(
+                filepath, job['Status'], job.get('Status string', ''))))
+
+    if hasattr(backend, 'future'):
+        for filepath in jobs.submitted:
+            job = backend.last_job(filepath)
+            backend.future(filepath).add_done_callback(
+                lambda _, filepath=filepath, job=job:
+                loop.call_soon_threadsafe(resolve, filepath, dict(job)))
+    else:
+        monitor = JobMonitor(jobs, interval)
+        keys = dict((os.path.normcase(filepath), filepath) for filepath in jobs.submitted)
+        finished = []
+
+        def changed(job, old_status):
+            filepath = keys.get(os.path.normcase(job['File']))
+            if (filepath is not None and job['ID'] not in before and
+                    job['Status'] in monitor.finished):
+                finished.append((filepath, job))
+
+        monitor.on_change(changed)
+
+        async def poll():
+            # resolve in this task so it has finished by the time the last future is awaited
+            while True:
+                try:
+                    await loop.run_in_executor(None, monitor.update)
+                except Exception as e:
+                    # e.g. dofcmd or the server is down, fail the jobs rather than hang
+                    for future in futures.values():
+                        if not future.done():
+                            future.set_exception(OFXError(
+                                "Polling the jobs failed: {}".format(e)))
+                    break
+                while finished:
+                    resolve(*finished.pop(0))
+                if all(f.done() for f in futures.values()):
+                    break
+                await asyncio.sleep(interval)
+
+        asyncio.ensure_future(poll())
+    return list(futures.values())
+
+
+STAGES = ('statics', 'dynamics', 'post')
+
+
+class Pipeline(object):
+
+    """Takes each case through statics, dynamics and post-processing independently.
+
+    A case's dynamics are submitted as soon as its statics pass and it is post-processed
+    as soon as its .sim exists, a case that fails a stage goes no further. At most
+    limits[stage] cases are in each stage at once (default 4 each).
+
+    statics_backend and dynamics_backend are the Jobs backends used (a LocalBackend for
+    each by default). A backend instance must accept repeated run calls, pass a class
+    (e.g. DistributedBackend) to make a new backend for each job. post_process(sim_path)
+    is called in a pool of processes so it must be picklable.
+
+    Progress is saved to the json file at `state_path` and a Pipeline created with the same
+    file resumes where it left off; failed cases are only retried with run(retry=True).
+
+    >>> pipeline = Pipeline("campaign.json", post_process=extract_results)
+    >>> for dat in Models(r"/data/campaign", return_model=False):
+    ...     pipeline.add_file(dat)
+    >>> pipeline.run()
+    Counter({'post': 180, 'failed statics': 12, 'failed dynamics': 3})
+    """
+
+    def __init__(self, state_path, post_process=None, statics_backend=None,
+                 dynamics_backend=None, limits=None, interval=10.0, save_interval=5.0):
+        self.state_path = state_path
+        self.post_process = post_process
+        self.limits = {'statics': 4, 'dynamics': 4, 'post': 4}
+        self.limits.update(limits or {})
+        self.backends = {
+            'statics': statics_backend or LocalBackend(processes=self.limits['statics']),
+            'dynamics': dynamics_backend or LocalBackend(processes=self.limits['dynamics'])}
+        self.interval = interval
+        self.save_interval = save_interval
+        self._saved = 0
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                self.state = json.load(f, object_pairs_hook=OrderedDict)
+        else:
+            self.state = OrderedDict()
+
+    def add_file(self, filepath):
+        """add a data file as a case, cases already in the state file are left as they are"""
+        if not os.path.isfile(filepath):
+            raise OFXError("{} not a vaild file.".format(filepath))
+        self.state.setdefault(os.path.abspath(filepath), {'stage': None, 'error': None})
+
+    def save(self):
+        """write the state file (via a temporary file so it is never left half written)"""
+        _write_atomic(self.state_path, json.dumps(self.state, indent=1))
+        self._saved = time.time()
+
+    def _stage_done(self, record, stage=None, error=None):
+        record['stage'] = stage or record['stage']
+        record['error'] = error
+        if time.time() - self._saved > self.save_interval:
+            self.save()
+
+    @property
+    def summary(self):
+        """Counter of the number of cases that have completed each stage or failed one"""
+        def status(record):
+            if record['error']:
+                return 'failed ' + record['error'].split()[0]
+            return record['stage'] or 'not started'
+
+        return Counter(status(record) for record in self.state.values())
+
+    def run(self, retry=False):
+        """run the pipeline to completion, returns the summary"""
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.run_async(retry))
+        finally:
+            loop.close()
+
+    async def run_async(self, retry=False):
+        """the coroutine behind run"""
+        if retry:
+            for record in self.state.values():
+                record['error'] = None
+        self._semaphores = dict((stage, asyncio.Semaphore(self.limits[stage]))
+                                for stage in STAGES)
+        self._post_executor = (ProcessPoolExecutor(self.limits['post'])
+                               if self.post_process else None)
+        try:
+            await asyncio.gather(*[self._case(filepath, record)
+                                   for filepath, record in self.state.items()
+                                   if not record['error']])
+        finally:
+            for backend in self.backends.values():
+                if hasattr(backend, 'wait'):
+                    backend.wait()
+            if self._post_executor is not None:
+                self._post_executor.shutdown(wait=True)
+            self.save()
+        return self.summary
+
+    async def _case(self, filepath, record):
+        stage = None
+        try:
+            if record['stage'] is None:
+                stage = 'statics'
+                await self._job(filepath, stage)
+                self._stage_done(record, stage)
+            if record['stage'] == 'statics':
+                stage = 'dynamics'
+                await self._job(filepath, stage)
+                self._stage_done(record, stage)
+            if record['stage'] == 'dynamics' and self.post_process:
+                stage = 'post'
+                sim_path = os.path.splitext(filepath)[0] + '.sim'
+                async with self._semaphores[stage]:
+                    await asyncio.get_running_loop().run_in_executor(
+                        self._post_executor, self.post_process, sim_path)
+                self._stage_done(record, stage)
+        except Exception as e:
+            self._stage_done(record, error="{} failed: {}".format(stage, e))
+
+    async def _job(self, filepath, stage):
+        backend = self.backends[stage]
+        if isinstance(backend, type):
+            backend = backend()
+        async with self._semaphores[stage]:
+            jobs = Jobs(backend=backend, verbose=False)
+            jobs.add_file(filepath)
+            await run_async(jobs, stage == 'statics', self.interval)[0]
+
+
+# formats tried for the Start Time and Completed Time of listed jobs
+TIME_FORMATS = ['%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S', '%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M',
+                '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %I:%M:%S %p', '%d-%b-%Y %H:%M:%S']
+
+
+def _parse_time(text):
+    for time_format in TIME_FORMATS:
+        try:
+            t = datetime.strptime(text.strip(), time_format)
+            return time.mktime(t.timetuple()) + t.microsecond / 1e6
+        except ValueError:
+            pass
+    return None
+
+
+def _distribution(values):
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return {'count': 0}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {'count': len(values), 'mean': float(values.mean()), 'min': float(values.min()),
+            'p50': float(p50), 'p90': float(p90), 'p99': float(p99),
+            'max': float(values.max()), 'sum': float(values.sum())}
+
+
+class JobTelemetry(object):
+
+    """Submit, start and finish times and machine of each job.
+
+    Jobs(telemetry=JobTelemetry()) records the submission times, the rest comes from job
+    listings passed to update() (Jobs.run(wait=True) does this) or from a JobMonitor after
+    watch(monitor). Times in the listing are used if they can be parsed (see TIME_FORMATS)
+    otherwise the time the change was seen.
+
+    Records are keyed by job ID. A submitted file is matched to the first job for it in a
+    listing that the backend did not already have when it was submitted, so reruns of a
+    file (or the other jobs on a Distributed OrcaFlex server) are kept apart.
+
+    summary() gives the queue latency and run time distributions and jobs per hour by
+    machine, write_json() and write_prometheus() export them.
+    """
+
+    def __init__(self):
+        self.jobs = OrderedDict()  # job ID: record of the jobs of the current backend
+        self._retired = []
+        self._waiting = OrderedDict()  # file: record of a submission not yet listed
+        self._ignored = set()
+        self._backend = None
+
+    def records(self):
+        """list of the record of every job, including those submitted but not listed yet"""
+        return self._retired + list(self.jobs.values()) + list(self._waiting.values())
+
+    def submitted(self, filepaths, at=None, before=(), backend=None):
+        """record the submission of `filepaths` to `backend`. `before` are the IDs of the
+        jobs the backend already had, which are not part of this submission. IDs are only
+        unique within one backend so the records of another are kept but no longer
+        updated."""
+        at = time.time() if at is None else at
+        if backend is not None and backend is not self._backend:
+            self._retired.extend(self.jobs.values())
+            self.jobs.clear()
+            self._ignored = set()
+            self._backend = backend
+        self._ignored.update(job_id for job_id in before if job_id not in self.jobs)
+        for filepath in filepaths:
+            self._waiting[os.path.normcase(filepath)] = {
+                'id': None, 'file': filepath, 'submitted': at, 'started': None,
+                'finished': None, 'machine': None, 'status': 'Pending'}
+
+    def update(self, listing):
+        """record the times of each job dictionary in `listing` (as Jobs.list())"""
+        for job in listing:
+            self.job_changed(job)
+
+    def job_changed(self, job, old_status=None):
+        """record the state of one job dictionary, suitable for JobMonitor.on_change"""
+        job_id = job.get('ID')
+        record = self.jobs.get(job_id)
+        if record is None:
+            key = os.path.normcase(job['File'])
+            if job_id is None or job_id in self._ignored or key not in self._waiting:
+                return
+            record = self.jobs[job_id] = self._waiting.pop(key)
+            record['id'] = job_id
+        now = time.time()
+        status = job['Status']
+        started = _parse_time(job.get('Start Time') or '')
+        finished = _parse_time(job.get('Completed Time') or '')
+        if status == 'Running' and record['started'] is None:
+            record['started'] = started or now
+        if status in FINISHED:
+            record['started'] = started or record['started']
+            if record['finished'] is None or record['status'] != status:
+                record['finished'] = finished or now
+        record['machine'] = job.get('Name of machine') or record['machine']
+        record['status'] = status
+
+    def watch(self, monitor):
+        """record every change seen by a JobMonitor"""
+        monitor.on_change(self.job_changed)
+
+    def summary(self):
+        """dictionary of queue latency and run time distributions (seconds) overall and
+        the number of jobs, run time distribution and jobs per hour by machine"""
+        records = self.records()
+        queue = [r['started'] - r['submitted'] for r in records
+                 if r['started'] is not None and r['submitted'] is not None]
+        finished = [r for r in records
+                    if r['started'] is not None and r['finished'] is not None]
+        machines = OrderedDict()
+        for r in finished:
+            machines.setdefault(r['machine'] or 'unknown', []).append(r)
+        by_machine = OrderedDict()
+        for machine, rs in machines.items():
+            hours = (max(r['finished'] for r in rs) - min(r['started'] for r in rs)) / 3600.0
+            by_machine[machine] = {
+                'jobs': len(rs),
+                'failed': sum(1 for r in rs if r['status'] != 'Completed'),
+                'run_time': _distribution([r['finished'] - r['started'] for r in rs]),
+                'jobs_per_hour': len(rs) / hours if hours > 0 else None}
+        return {'jobs': len(records),
+                'statuses': dict(Counter(r['status'] for r in records)),
+                'queue_latency': _distribution(queue),
+                'run_time': _distribution([r['finished'] - r['started'] for r in finished]),
+                'machines': by_machine}
+
+    def write_json(self, path):
+        """write the summary and every job's times to `path` as json"""
+        data = {'summary': self.summary(), 'jobs': self.records()}
+        _write_atomic(path, json.dumps(data, indent=1))
+
+    def write_prometheus(self, path):
+        """write the summary to `path` in the Prometheus text format (e.g. for the
+        node_exporter textfile collector)"""
+        summary = self.summary()
+        lines = []
+
+        def metric(name, kind, description):
+            lines.append('# HELP pyofx_{} {}'.format(name, description))
+            lines.append('# TYPE pyofx_{} {}'.format(name, kind))
+
+        def quantiles(name, distribution, labels=''):
+            if not distribution['count']:
+                return
+            for q, key in [('0.5', 'p50'), ('0.9', 'p90'), ('0.99', 'p99')]:
+                lines.append('pyofx_{}{{{}quantile="{}"}} {}'.format(
+                    name, labels, q, distribution[key]))
+            braces = '{' + labels.rstrip(',') + '}' if labels else ''
+            lines.append('pyofx_{}_sum{} {}'.format(name, braces, distribution['sum']))
+            lines.append('pyofx_{}_count{} {}'.format(name, braces, distribution['count']))
+
+        metric('job_queue_seconds', 'summary', 'Time from submission to a job starting.')
+        quantiles('job_queue_seconds', summary['queue_latency'])
+        metric('job_run_seconds', 'summary', 'Time from a job starting to finishing.')
+        for machine, m in summary['machines'].items():
+            quantiles('job_run_seconds', m['run_time'], 'machine="{}",'.format(machine))
+        metric('jobs', 'gauge', 'Number of jobs with each status.')
+        for status, count in sorted(summary['statuses'].items(), key=str):
+            lines.append('pyofx_jobs{{status="{}"}} {}'.format(status, count))
+        metric('jobs_per_hour', 'gauge', 'Jobs finished per hour by machine.')
+        for machine, m in summary['machines'].items():
+            if m['jobs_per_hour'] is not None:
+                lines.append('pyofx_jobs_per_hour{{machine="{}"}} {}'.format(
+                    machine, m['jobs_per_hour']))
+        _write_atomic(path, '\n'.join(lines) + '\n')
+
@@ -0,0 +1,555 @@
+"""
+Model
+
+The parts of pyofx that need OrcFxAPI: the Model and Models wrappers, modal analysis and
+the drawing helpers. Everything here (and everything in OrcFxAPI) is available from the
+pyofx package but this module, and so OrcFxAPI, is only imported the first time one of
+them is used.
+
+The API module is OrcFxAPI unless the PYOFX_API environment variable (see pyofx.use_api)
+names another with the same interface, e.g. pyofx.fake.
+
+"""
+
+import os
+import hashlib
+import importlib
+import tempfile
+import inspect
+import weakref
+from subprocess import check_output, CalledProcessError
+from multiprocessing import Pool
+
+import numpy as np
+
+from pyofx import OFXError
+
+# from OrcFxAPI import *
+_api = importlib.import_module(os.environ.get('PYOFX_API', 'OrcFxAPI'))
+globals().update((name, getattr(_api, name)) for name in getattr(
+    _api, '__all__', [name for name in vars(_api) if not name.startswith('_')]))
+_is64bit = ct.sizeof(ct.c_voidp) == 8
+
+
+def check_licence():
+    """true if a licence can be found
+
+    Useful for polling to wait for a free licence.
+    See examples.py"""
+    try:
+        _m = Model()
+        return True
+    except DLLError:
+        return False
+
+
+def get_modes(model, line, from_mode=-1, to_mode=100):
+    """List of (Mode Number, Modal Period, Modal Frequency) tuples for modal analysis of
+    lines. Check specific range of modes with from_mode and to_mode."""
+    if model.state is not ModelState.InStaticState:
+        model.CalculateStatics()
+    modes = Modes(line, ModalAnalysisSpecification(True, from_mode, to_mode))
+    periods = [modes.modeDetails(mode).period for mode in range(modes.modeCount)]
+    return [(mode + 1, period, 1 / period) for mode, period in enumerate(periods)]
+
+
+# (state token, modal results) per model, the results are only valid for that state
+_modes_cache = weakref.WeakKeyDictionary()
+
+
+def _state_token(model):
+    """changes whenever `model` may have reached a different static state. A pyofx Model
+    counts its statics runs and loads (editing data always leaves the static state so
+    statics has to be run again), for a bare API model the data is hashed."""
+    count = getattr(model, '_state_count', None)
+    if count is not None:
+        return count
+    return hashlib.sha1(model.SaveDataMem()).digest()
+
+
+def get_modes_batch(model, lines=None, from_mode=-1, to_mode=100):
+    """Dictionary of line name: (mode numbers, periods, frequencies) numpy arrays for modal
+    analysis of many lines.
+
+    `lines` can be a list of line objects or names, all the lines in the model are used if
+    it is None. Statics is run if needed and the results are cached against the model's
+    static state, so repeated queries are free until the data is edited. For a pyofx
+    Model a cache hit costs a counter lookup, an OrcFxAPI.Model passed directly is hashed
+    (SaveDataMem) on every call. Mode shapes are not calculated.
+    """
+    if model.state is not ModelState.InStaticState:
+        model.CalculateStatics()
+    token = _state_token(model)
+    cached_token, cache = _modes_cache.get(model, (None, None))
+    if cached_token != token:
+        cache = {}
+        _modes_cache[model] = (token, cache)
+    if lines is None:
+        lines = [o for o in model.objects if o.typeName == 'Line']
+    results = {}
+    for line in lines:
+        if isinstance(line, str):
+            line = model[line]
+        key = (line.Name, from_mode, to_mode)
+        if key not in cache:
+            modes = Modes(line, ModalAnalysisSpecification(False, from_mode, to_mode))
+            details = [modes.modeDetails(mode) for mode in range(modes.modeCount)]
+            numbers = np.array([d.modeNumber for d in details], dtype=int)
+            periods = np.array([d.period for d in details], dtype=float)
+            cache[key] = (numbers, periods, 1.0 / periods)
+        results[line.Name] = cache[key]
+    return results
+
+
+def _path_modes(args):
+    """worker for get_models_modes, loads one model and returns its modal results"""
+    path, lines, from_mode, to_mode = args
+    return path, get_modes_batch(Model(path), lines, from_mode, to_mode)
+
+
+def get_models_modes(models, lines=None, from_mode=-1, to_mode=100, processes=None):
+    """Dictionary of model path: get_modes_batch results for every model in `models`.
+
+    `models` is a `Models` instance or a list of paths to .dat/.yml/.sim files and `lines`
+    a list of line names (all lines if None). Each model is loaded and analysed in a pool
+    of `processes` worker processes (defaults to the number of cpus), pass processes=1 to
+    run in this process.
+    """
+    if isinstance(models, Models):
+        paths = list(models.paths())
+    else:
+        paths = list(models)
+    jobs = [(path, lines, from_mode, to_mode) for path in paths]
+    if processes == 1:
+        return dict(map(_path_modes, jobs))
+    pool = Pool(processes)
+    try:
+        return dict(pool.map(_path_modes, jobs))
+    finally:
+        pool.close()
+        pool.join()
+
+
+# unit vertices of the default OrcaFlex vessel type and 6D buoy drawings
+_VESSEL_X = np.array([1, 1, -1, -1, 1, 1, 1, -1, -1, 1], dtype=float)
+_VESSEL_Y = np.array([0, 1, 1, -1, -1, 0, 1, 1, -1, -1], dtype=float)
+_VESSEL_Z = np.array([1] * 5 + [-1] * 5, dtype=float)
+_BOW = np.array([0, 1, 0, 0, 1, 2, 1, 0, 0, 1])
+_BUOY = np.array([[1, 1, 1], [-1, 1, 1], [-1, -1, 1], [1, -1, 1],
+                  [1, 1, -1], [-1, 1, -1], [-1, -1, -1], [1, -1, -1]], dtype=float)
+
+
+def drawing_table(vertices):
+    """tab separated x, y, z table of a (vertices, 3) array, as pasted into a drawing"""
+    return "".join("\t".join(str(v) for v in vertex) + "\n"
+                   for vertex in np.asarray(vertices, dtype=float).tolist())
+
+
+def write_drawings(drawings, output):
+    """write the table of each (vertices, 3) array in `drawings` to `output`, a file path
+    or a file-like object (e.g. io.StringIO), separated by blank lines"""
+    text = "\n".join(drawing_table(vertices) for vertices in drawings)
+    if hasattr(output, 'write'):
+        output.write(text)
+    else:
+        with open(output, 'w') as f:
+            f.write(text)
+
+
+def _xyz_to_clipboard(x,y,z):
+    """ place string for xyz arrary on the clipbaord to paste in drawing form"""
+    try:
+        from tkinter import Tk
+    except ImportError:
+        # python 2 then
+        from Tkinter import Tk
+    r = Tk()
+    r.withdraw()
+    r.clipboard_clear()
+    r.clipboard_append(drawing_table(np.column_stack((x, y, z))))
+    r.destroy()
+
+
+def _set_drawings(ofx_objects, drawings, object_type):
+    ofx_objects = list(ofx_objects)
+    if len(ofx_objects) != len(drawings):
+        raise OFXError("There must be one object for each drawing.")
+    for ofx_object, vertices in zip(ofx_objects, drawings):
+        if ofx_object.type != object_type:
+            raise OFXError("{} is the wrong type of object.".format(ofx_object.Name))
+        set_drawing(ofx_object, vertices)
+
+
+def set_drawing(ofx_object, vertices, edges=None):
+    """set the drawing of a vessel type, buoy etc. to the (vertices, 3) array `vertices`
+    and if given the (edges, 2) array of vertex numbers `edges` (e.g. from hull_vertices)
+    """
+    vertices = np.asarray(vertices, dtype=float)
+    ofx_object.VertexX = vertices[:, 0].tolist()
+    ofx_object.VertexY = vertices[:, 1].tolist()
+    ofx_object.VertexZ = vertices[:, 2].tolist()
+    if edges is not None:
+        edges = np.asarray(edges, dtype=int)
+        ofx_object.EdgeFrom = edges[:, 0].tolist()
+        ofx_object.EdgeTo = edges[:, 1].tolist()
+
+
+def vessel_vertices(length, depth, beam, bow_scale=(0.9, 0.95)):
+    """(vessels, 10, 3) array of the default vessel type drawing scaled to each length,
+    depth and beam (numbers or arrays), see vessel_drawing"""
+    length, depth, beam = [np.atleast_1d(np.asarray(a, dtype=float)) / 2.0
+                           for a in (length, depth, beam)]
+    length, depth, beam = np.broadcast_arrays(length, depth, beam)
+    scale = np.array([1.0, bow_scale[0], bow_scale[1]])[_BOW]
+    return np.stack((length[:, None] * _VESSEL_X * scale, beam[:, None] * _VESSEL_Y,
+                     depth[:, None] * _VESSEL_Z), axis=-1)
+
+
+def hull_vertices(length, depth, beam, stations=21, points=7, bow_fraction=0.3,
+                  stern_fraction=0.1, transom=0.8):
+    """(vertices, edges) of a more detailed parametric hull for a vessel type drawing.
+
+    The hull has `stations` cross sections along its length, each with `points` vertices
+    from the keel to the deck on each side. The half breadth is constant over the parallel
+    mid body and tapers to zero at the bow over bow_fraction of the length and to transom
+    times the beam at the stern over stern_fraction. vertices is a (vertices, 3) array
+    centred on the origin like the default drawing and edges a (edges, 2) array of the
+    (1 based) vertex numbers joined by each edge.
+    """
+    x = np.linspace(-length / 2.0, length / 2.0, stations)
+    t = (x + length / 2.0) / length
+    bow = np.clip((t - (1 - bow_fraction)) / bow_fraction, 0, 1) if bow_fraction else 0 * t
+    stern = np.clip(1 - t / stern_fraction, 0, 1) if stern_fraction else 0 * t
+    half_breadth = beam / 2.0 * (1 - bow ** 2) * (1 - (1 - transom) * stern ** 2)
+    s = np.linspace(0, 1, points)
+    # keel to deck on the port side, across the deck and back down the starboard side
+    side = np.concatenate((s, s[::-1][:-1]))
+    sign = np.concatenate((np.ones(points), -np.ones(points - 1)))
+    section_y = sign * side ** 0.25
+    section_z = depth * (side - 0.5)
+    per_section = len(side)
+    vertices = np.stack((np.repeat(x, per_section),
+                         (half_breadth[:, None] * section_y).ravel(),
+                         np.tile(section_z, stations)), axis=-1)
+    first = np.arange(stations)[:, None, None] * per_section
+    ring = np.arange(per_section)
+    around = (first + np.stack((ring, np.roll(ring, -1)), axis=-1)[None]).reshape(-1, 2)
+    along = np.stack((np.arange(per_section * (stations - 1)),
+                      np.arange(per_section, per_section * stations)), axis=-1)
+    return vertices, np.concatenate((around, along)) + 1
+
+
+def vessel_drawing(length, depth, beam, bow_scale=(0.9, 0.95), vessel_type=None,
+                   output=None):
+    """scale the default OrcaFlex vessel type drawing
+
+    Given a vessel of specifed length, depth and beam. Bow shape determined by the bow_scale
+    parameter.
+
+    if an `OrcaFlexObject` with `typeName=otVesselType` is passed as the vessel_type parameter then
+    the drawing will be applied otherwise the correct array is copied to the clipboard to paste 
+    into the vessel type drawing table.  
+
+    For many vessels pass arrays of length, depth and beam and a list of vessel types, and/or
+    a file path or file-like `output` to write the tables to instead of the clipboard (for
+    servers without a display). Returns the (vessels, 10, 3) vertices if either is used.
+    """
+    drawings = vessel_vertices(length, depth, beam, bow_scale)
+    if isinstance(vessel_type, (list, tuple)):
+        _set_drawings(vessel_type, drawings, otVesselType)
+    elif vessel_type and vessel_type.type == otVesselType:
+        _set_drawings([vessel_type], drawings, otVesselType)
+    elif output is None:
+        _xyz_to_clipboard(*drawings[0].T)
+        return
+    if output is not None:
+        write_drawings(drawings, output)
+    return drawings
+
+
+def buoy_drawing(size, ofx_object=None, output=None):
+    """scale the standard 6D buoy cuboid to width and height of `size` 
+    (the default size is 6m)
+
+    If ofx_object is provided then the object drawing will be changed
+    otherwise the correct array is copied to the clipboard to paste 
+    into the 6D Buoy drawing table.  
+
+    As vessel_drawing, size can be an array with a list of buoys in ofx_object, and the
+    tables written to `output`. Returns the (buoys, 8, 3) vertices if either is used.
+    """
+    sizes = np.atleast_1d(np.asarray(size, dtype=float)) / 2.0
+    drawings = sizes[:, None, None] * _BUOY
+    if isinstance(ofx_object, (list, tuple)):
+        _set_drawings(ofx_object, drawings, ot6DBuoy)
+    elif ofx_object and ofx_object.type == ot6DBuoy:
+        _set_drawings([ofx_object], drawings, ot6DBuoy)
+    elif output is None:
+        _xyz_to_clipboard(*drawings[0].T)
+        return
+    if output is not None:
+        write_drawings(drawings, output)
+    return drawings
+
+
+class Model(Model):
+
+    """Wrapper around OrcFxAPI.Model to add extra functionality.
+
+    1. added path attribute so the location of the model on the disc can be found from:
+
+    >>> model = Model(r"C:\path\to\data_file.dat")
+    >>> model.path
+    "C:\path\to\data_file.dat"
+
+    2. added a model_name attribute (added in v0.0.9) of the file name without path or
+    extensions:
+
+    >>> model = Model(r"C:\path\to\data_file.dat")
+    >>> model.model_name
+    "data_file"
+
+    3. added the open method. This will open the model in the OrcaFlex GUI, if the model
+    does not exist on disc then a windows temp file will be created. Won't return until 
+    the OrcaFlex.exe instance is closed.
+
+    >>> model = Model()
+    >>> model.open() # Opens a temp file in OrcaFlex.exe
+
+    4. added `objects_of_type()` to return a list of objects in the model of a certain types/
+    e.g. model.objects_of_type('Line')
+
+    >>> model = Model()
+    >>> model.CreateObject(otVessel, 'Bigger Boat')
+    >>> for v in model.objects_of_type('Vessel'):
+    ...     print v.name
+    "Bigger Boat"
+
+
+    5. added attribute `lines`, shortcut to objects_of_type('Line')
+
+    6. added attribute `vessels`, shortcut to objects_of_type('Vessel')
+
+    7. added attribute `six_d_buoys`, shortcut to objects_of_type('6DBuoy')
+
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(Model, self).__init__(*args, **kwargs)
+        if kwargs.get('filename', False):
+            self.path = kwargs.get('filename')
+        elif len(args) > 0:
+            if os.path.exists(args[0]):
+                self.path = args[0]
+            else:
+                raise OFXError("\n Can't locate file {}.".format(self.path))
+        else:
+            self.path = None
+
+    def open(self):
+        if not self.path:
+            fd, self.path = tempfile.mkstemp(suffix=".dat")
+            os.close(fd)
+            self.SaveData(self.path)
+        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE,
+                            'Software\\Orcina\\OrcaFlex\\Installation Directory',
+                            0, winreg.KEY_READ | winreg.KEY_WOW64_32KEY) as key:
+            installation_directory = winreg.QueryValueEx(key, 'Normal')[0]
+        if _is64bit:
+            cmd_line = ['OrcaFlex64.exe', self.path]
+        else:
+            cmd_line = ['OrcaFlex.exe', self.path]
+        try:
+            assert os.path.isdir(installation_directory)
+        except AssertionError as error:
+            raise OFXError(
+                "{} might not be a directory".format(installation_directory))
+        os.chdir(installation_directory)
+        try:
+            print("{} has been opened in the OrcaFlex GUI.".format(self.path))
+            p = check_output(cmd_line, universal_newlines=True)
+            print("{} has been closed.".format(self.path))
+        except CalledProcessError as cpe:
+            raise OFXError(
+                "Error opening {} in OrcaFlex:\n{}".format(self.path, cpe.output))
+
+    def _new_state(self):
+        # counts the times the model could have reached a new static state, so results
+        # cached against the static state (see get_modes_batch) know when to recalculate
+        self._state_count = getattr(self, '_state_count', 0) + 1
+
+    def CalculateStatics(self, *args, **kwargs):
+        self._new_state()
+        super(Model, self).CalculateStatics(*args, **kwargs)
+
+    def SaveData(self, filename):
+        super(Model, self).SaveData(filename)
+        self.path = filename
+
+    def LoadData(self, filename):
+        self._new_state()
+        super(Model, self).LoadData(filename)
+        self.path = filename
+
+    def LoadSimulation(self, filename):
+        self._new_state()
+        super(Model, self).LoadSimulation(filename)
+        self.path = filename
+
+    def SaveSimulation(self, filename):
+        super(Model, self).SaveSimulation(filename)
+        self.path = filename
+
+    @property
+    def model_name(self):
+        return os.path.splitext(os.path.split(self.path)[1])[0]
+
+    def objects_of_type(self, type_name, test=None):
+        """list of all objects in model with `typeName` equal to `type_name`
+
+        option to add a test function to further filter the list
+        """
+        typed_objects = [o for o in self.objects if (o.typeName == type_name)]
+        if isinstance(test, str):
+            return [o for o in typed_objects if test in o.Name]
+        elif inspect.isfunction(test):
+            return list(filter(test, typed_objects))
+        elif test is None:
+            return typed_objects
+        else:
+            raise OFXError(
+                ("The test must be for a string in the object name or a filter function. ",
+                 "Was passed an {}".format(type(test))))
+
+    @property
+    def lines(self):
+        """ all the objects of type otLine """
+
+        return self.objects_of_type('Line')
+
+    @property
+    def vessels(self):
+        """ all the objects of type otLine """
+
+        return self.objects_of_type('Vessel')
+
+    @property
+    def six_d_buoys(self):
+        """ all the objects of type ot6DBuoy """
+
+        return self.objects_of_type('6D Buoy')
+
+
+class Models(object):
+    r"""a generator which yields OrcaFlex files in directories.
+
+    Suppose we have saved some simulations in C:\Users\User\Project\OrcaFlex, to iterate over all
+    those simulations we can use:
+
+    >>> for model in Models(r"C:\Users\User\Project\OrcaFlex"):
+    ...    print model
+    <pyofx.Model object at 0x00000000031B6DD8>
+    <pyofx.Model object at 0x00000000031B6E80>
+
+    Note that in the above example the generator yields Model objects of the .dat files. To return
+    the path to the file rather than the Model object we can pass return_model=False and to return
+    .sim file filetype="sim"
+
+
+    There are various other options as detailed in the api_docs_:
+
+    .. autofunction:: pyofx.Models.__init__
+
+
+    """
+
+    def __init__(self, directories, filetype="dat",
+                 subdirectories=False, return_model=True,
+                 filter_function=None, failed_function=None,
+                 virtual_logging=False):
+        """
+        create a generator for Model objects.
+
+        Requires a directory as a string or a list of directories as strings. Other arguments are:
+
+        filetype         str    "dat", "yml" or "sim" to yield data files or simulations (default="dat")
+        subdirectories   bool   if True then subdirectories will be included (default=False)
+        return_model     bool   if True then yield pyofx.Model objects, if False yield a string
+                                of the full path to the file. (default=True)
+        virtual_logging  bool   if True all returned Model instances will have virtual logging
+                                enabled. Makes post processing of large sim files mmmuch quicker.
+                                (default=False)
+        filter_function  func   function that returns True or False when passed the full filename.
+                                only models that pass the test will be returned.
+        failed_function  func   function to be performed on failed simulation file loads [TODO]
+        """
+        self._dirs = []
+        self.filetype = filetype
+        if self.filetype not in ['sim', 'dat', 'yml']:
+            raise OFXError(
+                "filetype must be 'sim', 'dat' or 'yml' not '{}'".format(self.filetype))
+        self.sub = subdirectories
+        self.return_model = return_model
+        self.virtual_logging = virtual_logging
+        if filter_function is None:
+            self.filter_function = lambda _: True
+        else:
+            self.filter_function = filter_function
+
+        # TODO: Fix so that return_model=False cannot be checked for failed
+        # simulation.
+
+        if return_model and failed_function and filetype == "sim":
+            self.failed_function = failed_function
+        elif failed_function:
+            raise OFXError(
+                "Failed failed_function needs to be called on .sim files")
+
+        if isinstance(directories, str):
+            self._dirs.append(directories)
+        else:
+            for _dir in directories:
+                if not isinstance(_dir, str):
+                    raise OFXError("""Directory arguments need to be strings.
+                     {} is a {}.""".format(_dir, type(_dir)))
+                else:
+                    if os.path.isdir(_dir):
+                        self._dirs.append(_dir)
+                    else:
+                        raise OFXError(r"""{} does not appear to be a vaild directory.
+                         hint:put an 'r' before the string e.g. r'c:\temp'.
+                         """.format(_dir, type(_dir)))
+
+    def paths(self):
+        """generator of the full path of each file, whatever the value of return_model"""
+        extension = ".{}".format(self.filetype)
+        for d in self._dirs:
+            if self.sub:
+                paths = [os.path.join(r, f) for r, _, fs in os.walk(d) for f in fs]
+            else:
+                paths = [os.path.join(d, f) for f in os.listdir(d)]
+            for path in paths:
+                if path.endswith(extension) and self.filter_function(path):
+                    yield path
+
+    def __iter__(self):
+
+        def model_or_path(model_path):
+            if self.return_model:
+                if self.virtual_logging:
+                    _model = Model()
+                    _model.UseVirtualLogging()
+                    if self.filetype == "sim":
+                        _model.LoadSimulation(model_path)
+                    else:
+                        _model.LoadData(model_path)
+                    return _model
+                else:
+                    return Model(model_path)
+            else:
+                return model_path
+
+        for path in self.paths():
+            yield model_or_path(path)
+
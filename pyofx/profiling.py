@@ -0,0 +1,234 @@
+"""
+Profiling
+
+Count and time every call made through pyofx.Model and the objects reached through it
+(LoadSimulation, TimeHistory, RangeGraph, object lookup by name, data access, ...) to
+find where a slow post-processing run spends its time.
+
+    profiled    context manager that records calls to a Profile while it is open
+    Profile     calls, total/mean/max time and a latency histogram for each method (and
+                its arguments), with a report sorted by total time
+
+The methods are only wrapped while a profile is active, so there is no overhead at all
+otherwise. Times are inclusive: a call made inside another (e.g. Model.SaveData calling
+the OrcFxAPI method) counts towards both.
+
+Usage:
+    from pyofx.profiling import profiled
+    with profiled() as profile:
+        process_uls_folder(r"C:\\project", results)
+    print(profile.report(20))
+
+or set the environment variable PYOFX_PROFILE=1 to profile the whole run and print the
+report by method at exit (PYOFX_PROFILE=path\\to\\report.txt writes it to a file).
+
+"""
+
+import atexit
+import math
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from timeit import default_timer
+
+# the profiles recording, the methods are wrapped while there are any
+_active = []
+_originals = []
+_lock = threading.Lock()
+_environment_checked = False
+
+_SIMPLE_TYPES = (str, int, float, bool, type(None))
+
+
+def _describe(args, kwargs):
+    """short text of the arguments, objects are shown by type so calls with the same
+    variable names etc. are grouped together"""
+    def text(value):
+        if isinstance(value, _SIMPLE_TYPES):
+            return repr(value)
+        return type(value).__name__
+    parts = [text(a) for a in args] + ["{}={}".format(k, text(v)) for k, v in
+                                       sorted(kwargs.items())]
+    return ", ".join(parts)
+
+
+class Profile(object):
+
+    """Calls recorded while profiling, keyed by method (and arguments if by_arguments).
+
+    Each entry has the number of calls, total and max time and a histogram of call times
+    in power of two microsecond buckets, from which percentiles are estimated.
+    """
+
+    def __init__(self, by_arguments=True):
+        self.by_arguments = by_arguments
+        self.calls = {}
+
+    def record(self, name, args, kwargs, seconds):
+        key = (name, _describe(args, kwargs) if self.by_arguments else '')
+        bucket = max(0, int(math.log(max(seconds, 1e-6) * 1e6, 2)))
+        with _lock:
+            entry = self.calls.get(key)
+            if entry is None:
+                entry = self.calls[key] = {'calls': 0, 'total': 0.0, 'max': 0.0,
+                                           'histogram': {}}
+            entry['calls'] += 1
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            entry['histogram'][bucket] = entry['histogram'].get(bucket, 0) + 1
+
+    @staticmethod
+    def _percentile(entry, q):
+        """upper bound of the histogram bucket holding the q'th percentile"""
+        target = q / 100.0 * entry['calls']
+        count = 0
+        for bucket in sorted(entry['histogram']):
+            count += entry['histogram'][bucket]
+            if count >= target:
+                return min(2 ** (bucket + 1) * 1e-6, entry['max'])
+        return entry['max']
+
+    def stats(self, by_method=False):
+        """list of a dictionary for each method and arguments (or just each method if
+        by_method) sorted by total time"""
+        entries = {}
+        for (name, arguments), entry in self.calls.items():
+            key = (name, '') if by_method else (name, arguments)
+            merged = entries.setdefault(key, {'calls': 0, 'total': 0.0, 'max': 0.0,
+                                              'histogram': {}})
+            merged['calls'] += entry['calls']
+            merged['total'] += entry['total']
+            merged['max'] = max(merged['max'], entry['max'])
+            for bucket, count in entry['histogram'].items():
+                merged['histogram'][bucket] = merged['histogram'].get(bucket, 0) + count
+        rows = []
+        for (name, arguments), entry in entries.items():
+            rows.append({'method': name, 'arguments': arguments, 'calls': entry['calls'],
+                         'total': entry['total'], 'mean': entry['total'] / entry['calls'],
+                         'p50': self._percentile(entry, 50),
+                         'p95': self._percentile(entry, 95), 'max': entry['max'],
+                         'histogram': entry['histogram']})
+        return sorted(rows, key=lambda row: row['total'], reverse=True)
+
+    def report(self, limit=None, by_method=False):
+        """table of the `limit` (default all) entries with the most total time"""
+        rows = self.stats(by_method)[:limit]
+        lines = ["{:>8} {:>10} {:>10} {:>10} {:>10}  {}".format(
+            "calls", "total s", "mean ms", "p95 ms", "max ms", "method")]
+        for row in rows:
+            method = row['method']
+            if row['arguments']:
+                method += "({})".format(row['arguments'])
+            lines.append("{:>8} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}  {}".format(
+                row['calls'], row['total'], 1e3 * row['mean'], 1e3 * row['p95'],
+                1e3 * row['max'], method))
+        return "\n".join(lines)
+
+    def write(self, path, by_method=False):
+        with open(path, 'w') as f:
+            f.write(self.report(by_method=by_method) + "\n")
+
+
+def _wrap(name, function):
+    def wrapper(*args, **kwargs):
+        start = default_timer()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            seconds = default_timer() - start
+            for profile in _active:
+                profile.record(name, args[1:], kwargs, seconds)
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    wrapper.__wrapped__ = function
+    return wrapper
+
+
+def _classes():
+    """pyofx.Model, the API's Model and all its object classes"""
+    from pyofx import model
+    api = model._api
+    classes = [model.Model, api.Model]
+    base = getattr(api, 'OrcaFlexObject', None)
+    if base is not None:
+        classes += [c for c in vars(api).values()
+                    if isinstance(c, type) and issubclass(c, base)]
+    return classes
+
+
+def _install(classes):
+    for cls in classes:
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith('_') and attr not in ('__init__', '__getitem__',
+                                                     '__getattr__'):
+                continue
+            name = "{}.{}.{}".format(cls.__module__, cls.__name__, attr)
+            if isinstance(value, (staticmethod, classmethod)):
+                continue
+            elif isinstance(value, property) and value.fget is not None:
+                wrapped = property(_wrap(name, value.fget), value.fset, value.fdel,
+                                   value.__doc__)
+            elif callable(value) and not isinstance(value, type):
+                wrapped = _wrap(name, value)
+            else:
+                continue
+            _originals.append((cls, attr, value))
+            setattr(cls, attr, wrapped)
+
+
+def _uninstall():
+    while _originals:
+        cls, attr, value = _originals.pop()
+        setattr(cls, attr, value)
+
+
+def enable(profile=None):
+    """start recording calls to `profile` (a new Profile if None), which is returned"""
+    profile = Profile() if profile is None else profile
+    # outside the lock, as importing pyofx.model can start profiling from the environment
+    classes = _classes()
+    with _lock:
+        if not _active:
+            _install(classes)
+        _active.append(profile)
+    return profile
+
+
+def disable(profile):
+    """stop recording calls to `profile`, the methods are unwrapped after the last one"""
+    with _lock:
+        _active.remove(profile)
+        if not _active:
+            _uninstall()
+
+
+@contextmanager
+def profiled(by_arguments=True):
+    """record the calls made inside the with block to the Profile it returns"""
+    profile = enable(Profile(by_arguments))
+    try:
+        yield profile
+    finally:
+        disable(profile)
+
+
+def enable_from_environment():
+    """profile until exit if PYOFX_PROFILE is set, the report is printed (or written to
+    the file PYOFX_PROFILE names) at exit. Called by pyofx once pyofx.model is loaded,
+    only the first call does anything."""
+    global _environment_checked
+    setting = os.environ.get('PYOFX_PROFILE', '')
+    if _environment_checked or setting in ('', '0'):
+        _environment_checked = True
+        return
+    _environment_checked = True
+    profile = enable()
+
+    def report():
+        if setting == '1':
+            sys.stderr.write(profile.report(by_method=True) + "\n")
+        else:
+            profile.write(setting, by_method=True)
+
+    atexit.register(report)
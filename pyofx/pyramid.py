@@ -0,0 +1,222 @@
+"""
+Pyramid
+
+Min/max decimation pyramids of time histories for plotting, so drawing any window of a
+long history costs about the width of the plot in pixels rather than the number of
+samples.
+
+    HistoryPyramid   the raw samples and levels of block minima and maxima of one history,
+                     fetch(start, end, pixels) gives at most `pixels` min/max pairs
+    PyramidCache     builds the pyramids of the requested results of a sim once and keeps
+                     them in a .npz file beside the sim (or in a cache directory)
+
+Each level takes the min and max of `factor` cells of the level below so peaks are never
+lost however far the plot is zoomed out. Only the levels used are read from the file,
+which is only open while they are read.
+
+Usage:
+    from pyofx.pyramid import PyramidCache
+    cache = PyramidCache()
+    pyramids = cache.get(r"C:\\project\\case_1.sim", [("Line1", "Effective Tension", 0.0)])
+    times, low, high = pyramids[("Line1", "Effective Tension", 0.0)].fetch(0, 10800, 1200)
+
+"""
+
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from pyofx import OFXError
+from pyofx.stats import request_time_histories
+
+
+def _decimate(minimum, maximum, factor):
+    """block min and max of `factor` cells, the last block may be short"""
+    n = int(np.ceil(len(minimum) / float(factor))) * factor
+    pad = n - len(minimum)
+    minimum = np.concatenate((minimum, np.full(pad, minimum[-1]))).reshape(-1, factor)
+    maximum = np.concatenate((maximum, np.full(pad, maximum[-1]))).reshape(-1, factor)
+    return minimum.min(axis=1), maximum.max(axis=1)
+
+
+class HistoryPyramid(object):
+
+    """The pyramid of one time history sampled every `dt` from time `t0`.
+
+    Level 0 is the raw samples, level k holds the minimum and maximum of each block of
+    factor ** k samples, down to a level of no more than `min_size` cells. Build one with
+    from_values, or PyramidCache loads them from file.
+    """
+
+    def __init__(self, t0, dt, factor, levels):
+        self.t0 = t0
+        self.dt = dt
+        self.factor = factor
+        self._levels = levels
+
+    @classmethod
+    def from_values(cls, values, t0=0.0, dt=1.0, factor=4, min_size=512):
+        values = np.asarray(values, dtype=float)
+        levels = [(values, values)]
+        while len(levels[-1][0]) > min_size:
+            levels.append(_decimate(levels[-1][0], levels[-1][1], factor))
+        return cls(t0, dt, factor, levels)
+
+    @property
+    def depth(self):
+        return len(self._levels)
+
+    def level(self, k):
+        """(minimum, maximum) arrays of level k"""
+        level = self._levels[k]
+        if callable(level):
+            level = self._levels[k] = level()
+        return level
+
+    def __len__(self):
+        return len(self.level(0)[0])
+
+    def fetch(self, start=None, end=None, pixels=1000):
+        """(times, minimum, maximum) of the window from `start` to `end` (s, the whole
+        history if None) in at most `pixels` buckets, times are the start of each bucket.
+        Where there are fewer samples than pixels they are the raw samples (minimum and
+        maximum are equal)."""
+        first = 0 if start is None else max(0, int(np.floor((start - self.t0) / self.dt)))
+        last = len(self) if end is None else min(
+            len(self), int(np.ceil((end - self.t0) / self.dt)) + 1)
+        samples = max(last - first, 0)
+        # the coarsest level that still has at least `pixels` cells in the window
+        k = 0
+        while (k + 1 < self.depth and
+               samples / float(self.factor ** (k + 1)) >= pixels):
+            k += 1
+        block = self.factor ** k
+        minimum, maximum = self.level(k)
+        i0, i1 = first // block, -(-last // block)
+        minimum, maximum = minimum[i0:i1], maximum[i0:i1]
+        # group the cells to give no more than `pixels` buckets
+        group = int(np.ceil(len(minimum) / float(pixels))) if pixels else 1
+        if group > 1:
+            minimum, maximum = _decimate(minimum, maximum, group)
+            block *= group
+        times = self.t0 + self.dt * (i0 * self.factor ** k + block * np.arange(len(minimum)))
+        return times, minimum, maximum
+
+
+def _key(request):
+    return "|".join(str(part) for part in request)
+
+
+class PyramidCache(object):
+
+    """Decimation pyramids of the results of sims, kept in a .npz file for each sim.
+
+    The file is `<sim name>.pyramid.npz` beside the sim, or in `cache_dir` if given.
+    Requests are (object name, variable, arc length) as pyofx.stats.sim_stats over
+    stage 1. A pyramid is rebuilt if the sim has changed since it was made and results
+    not in the file yet are added to it.
+    """
+
+    def __init__(self, cache_dir=None, factor=4, min_size=512):
+        self.cache_dir = cache_dir
+        self.factor = factor
+        self.min_size = min_size
+
+    def path(self, sim_path):
+        """the cache file of the sim at `sim_path`"""
+        if self.cache_dir is None:
+            return os.path.splitext(sim_path)[0] + '.pyramid.npz'
+        name = hashlib.sha1(os.path.abspath(sim_path).encode('utf-8')).hexdigest()[:20]
+        return os.path.join(self.cache_dir, name + '.npz')
+
+    def _load(self, sim_path):
+        """(version, t0, dt, array names) of the cache file if it is up to date, the
+        version is the modified time and size of the sim it was made from"""
+        path = self.path(sim_path)
+        if not os.path.isfile(path):
+            return None
+        with np.load(path) as stored:
+            stat = os.stat(sim_path)
+            version = (float(stored['sim_mtime']), int(stored['sim_size']))
+            if (version != (stat.st_mtime, stat.st_size) or
+                    int(stored['factor']) != self.factor):
+                return None
+            return version, float(stored['t0']), float(stored['dt']), set(stored.files)
+
+    def _read(self, sim_path, version, names):
+        """the arrays `names` of the cache file, which is closed again so it can be
+        replaced (on Windows) while pyramids from it are still in use"""
+        path = self.path(sim_path)
+        with np.load(path) as stored:
+            if (float(stored['sim_mtime']), int(stored['sim_size'])) != version:
+                raise OFXError("{} has been rebuilt, get the pyramids again.".format(path))
+            return tuple(stored[name] for name in names)
+
+    def _build(self, sim_path, requests, keep):
+        """write the cache file with the pyramids of `requests`, and the arrays `keep` of
+        the existing file"""
+        from pyofx import Model, Period
+        m = Model(sim_path)
+        period = Period(1)
+        times = m.SampleTimes(period)
+        values = request_time_histories(m, requests, period)
+        stat = os.stat(sim_path)
+        arrays = {'sim_mtime': stat.st_mtime, 'sim_size': stat.st_size,
+                  'factor': self.factor, 't0': times[0],
+                  'dt': times[1] - times[0] if len(times) > 1 else 1.0}
+        path = self.path(sim_path)
+        if keep:
+            with np.load(path) as stored:
+                arrays.update((name, stored[name]) for name in keep)
+        for request, column in zip(requests, values.T):
+            pyramid = HistoryPyramid.from_values(column, factor=self.factor,
+                                                 min_size=self.min_size)
+            for k in range(pyramid.depth):
+                minimum, maximum = pyramid.level(k)
+                arrays["{}/{}/min".format(_key(request), k)] = minimum
+                if k:
+                    arrays["{}/{}/max".format(_key(request), k)] = maximum
+        if self.cache_dir is not None and not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        # unique so builders of the same sim in parallel don't write over each other
+        handle, temp_path = tempfile.mkstemp('.tmp.npz', dir=os.path.dirname(path) or None)
+        os.close(handle)
+        try:
+            np.savez(temp_path, **arrays)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def get(self, sim_path, requests):
+        """dictionary of request: HistoryPyramid for each of `requests` in the sim"""
+        requests = [tuple(request) for request in requests]
+        loaded = self._load(sim_path)
+        missing = [r for r in requests if loaded is None or
+                   "{}/0/min".format(_key(r)) not in loaded[3]]
+        if missing:
+            keep = [] if loaded is None else [name for name in loaded[3] if '/' in name]
+            self._build(sim_path, missing, keep)
+            loaded = self._load(sim_path)
+        version, t0, dt, names = loaded
+
+        def reader(*names):
+            return lambda: self._read(sim_path, version, names)
+
+        pyramids = {}
+        for request in requests:
+            key = _key(request)
+            depth = len([name for name in names
+                         if name.startswith(key + '/') and name.endswith('/min')])
+            raw = reader("{}/0/min".format(key))
+            levels = [lambda raw=raw: raw() * 2]
+            levels += [reader("{}/{}/min".format(key, k), "{}/{}/max".format(key, k))
+                       for k in range(1, depth)]
+            pyramids[request] = HistoryPyramid(t0, dt, self.factor, levels)
+        return pyramids
+
+    def fetch(self, sim_path, request, start=None, end=None, pixels=1000):
+        """(times, minimum, maximum) of one result, see HistoryPyramid.fetch"""
+        return self.get(sim_path, [request])[tuple(request)].fetch(start, end, pixels)
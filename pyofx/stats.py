@@ -0,0 +1,335 @@
+"""
+Stats
+
+Streaming summary statistics for OrcaFlex results, for summarising whole campaigns in
+constant memory.
+
+    RunningStats     count, mean, standard deviation, extrema (with the time and source of
+                     occurrence) and percentiles of everything it has been fed
+    QuantileSketch   mergeable relative-accuracy percentile sketch used by RunningStats
+    Envelope         running max/min/mean range graph along a line and the source that
+                     governs each arc length
+
+All are fed with `update` and combined with `merge`, so partial results from worker
+processes can be merged in the parent.
+
+Usage:
+    from pyofx.stats import summarise_models
+    stats = summarise_models(Models(r"C:\\project", filetype="sim"),
+                             [("Line1", "Effective Tension", 0.0)])
+    stats[("Line1", "Effective Tension", 0.0)].percentile(99)
+
+"""
+
+import math
+
+import numpy as np
+
+
+class QuantileSketch(object):
+
+    """A mergeable percentile sketch with bounded relative error (as DDSketch).
+
+    Values are counted in logarithmic buckets so any percentile is returned to within
+    `relative_accuracy` of the true value, values smaller in magnitude than `min_value`
+    count as zero. Memory grows with the log of the range of values not their number.
+    """
+
+    def __init__(self, relative_accuracy=0.01, min_value=1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+
+    def _add_buckets(self, store, values):
+        keys, counts = np.unique(np.ceil(np.log(values) / self._log_gamma).astype(int),
+                                 return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            store[key] = store.get(key, 0) + count
+
+    def update(self, values):
+        """add an array of values"""
+        values = np.asarray(values, dtype=float).ravel()
+        small = np.abs(values) < self.min_value
+        self.zero += int(small.sum())
+        self._add_buckets(self.positive, values[(values > 0) & ~small])
+        self._add_buckets(self.negative, -values[(values < 0) & ~small])
+        self.count += len(values)
+
+    def merge(self, other):
+        """add the counts of another sketch with the same relative_accuracy"""
+        if other.gamma != self.gamma:
+            raise ValueError("Can only merge sketches with the same relative accuracy.")
+        for store, other_store in [(self.positive, other.positive),
+                                   (self.negative, other.negative)]:
+            for key, count in other_store.items():
+                store[key] = store.get(key, 0) + count
+        self.zero += other.zero
+        self.count += other.count
+
+    def percentile(self, q):
+        """the value below which q percent of the values fall"""
+        if self.count == 0:
+            raise ValueError("No values have been added.")
+        rank = q / 100.0 * (self.count - 1)
+        buckets = ([(-1, key, self.negative[key])
+                    for key in sorted(self.negative, reverse=True)] +
+                   [(0, 0, self.zero)] +
+                   [(1, key, self.positive[key]) for key in sorted(self.positive)])
+        seen = 0
+        for sign, key, count in buckets:
+            seen += count
+            if seen > rank:
+                break
+        return sign * 2 * self.gamma ** key / (self.gamma + 1)
+
+
+class RunningStats(object):
+
+    """Summary statistics of a variable fed one chunk at a time.
+
+    count, mean, variance and std are exact (Welford/Chan updates), minimum and maximum
+    are kept with the time and source (e.g. the sim path) they occurred at and
+    percentiles come from a QuantileSketch.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.time_of_minimum = None
+        self.time_of_maximum = None
+        self.source_of_minimum = None
+        self.source_of_maximum = None
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def update(self, values, times=None, source=None):
+        """add a chunk of values with their sample times (sample numbers if None) and an
+        optional label for where they came from"""
+        values = np.asarray(values, dtype=float).ravel()
+        if len(values) == 0:
+            return
+        if times is None:
+            times = np.arange(self.count, self.count + len(values))
+        i_min, i_max = values.argmin(), values.argmax()
+        if self.minimum is None or values[i_min] < self.minimum:
+            self.minimum = float(values[i_min])
+            self.time_of_minimum = float(times[i_min])
+            self.source_of_minimum = source
+        if self.maximum is None or values[i_max] > self.maximum:
+            self.maximum = float(values[i_max])
+            self.time_of_maximum = float(times[i_max])
+            self.source_of_maximum = source
+        mean = values.mean()
+        self._combine(len(values), mean, ((values - mean) ** 2).sum())
+        self.sketch.update(values)
+
+    def _combine(self, count, mean, m2):
+        n = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / n
+        self.m2 += m2 + delta ** 2 * self.count * count / n
+        self.count = n
+
+    def merge(self, other):
+        """add the statistics of another RunningStats"""
+        if other.count == 0:
+            return
+        if self.minimum is None or other.minimum < self.minimum:
+            self.minimum = other.minimum
+            self.time_of_minimum = other.time_of_minimum
+            self.source_of_minimum = other.source_of_minimum
+        if self.maximum is None or other.maximum > self.maximum:
+            self.maximum = other.maximum
+            self.time_of_maximum = other.time_of_maximum
+            self.source_of_maximum = other.source_of_maximum
+        self._combine(other.count, other.mean, other.m2)
+        self.sketch.merge(other.sketch)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def percentile(self, q):
+        """the value below which q percent of the values fall (to the sketch accuracy)"""
+        if q <= 0:
+            return self.minimum
+        if q >= 100:
+            return self.maximum
+        return min(max(self.sketch.percentile(q), self.minimum), self.maximum)
+
+    def __str__(self):
+        return ("count {} mean {:g} std {:g} min {:g} ({} at {:g}s) max {:g} ({} at {:g}s)"
+                .format(self.count, self.mean, self.std, self.minimum, self.source_of_minimum,
+                        self.time_of_minimum, self.maximum, self.source_of_maximum,
+                        self.time_of_maximum))
+
+
+def request_time_histories(model, requests, period):
+    """(samples, requests) array of the time history of each (object name, variable, arc
+    length) in `requests`, fetched in a single batch"""
+    from pyofx import GetMultipleTimeHistories, TimeHistorySpecification, oeArcLength
+    specifications = []
+    for request in requests:
+        arc_length = request[2] if len(request) > 2 else None
+        extra = None if arc_length is None else oeArcLength(arc_length)
+        specifications.append(TimeHistorySpecification(model[request[0]], request[1], extra))
+    return np.asarray(GetMultipleTimeHistories(specifications, period))
+
+
+def sim_stats(path, requests, relative_accuracy=0.01):
+    """list of RunningStats for each (object name, variable, arc length) in `requests`
+    over stage 1 of the simulation at `path`; the arc length is optional or None for
+    objects other than lines. Raises OFXError if the simulation is not complete."""
+    from pyofx import complete_sim, Period
+    m = complete_sim(path)
+    period = Period(1)
+    values = request_time_histories(m, requests, period)
+    times = m.SampleTimes(period)
+    stats = []
+    for column in range(len(requests)):
+        s = RunningStats(relative_accuracy)
+        s.update(values[:, column], times, path)
+        stats.append(s)
+    return stats
+
+
+def summarise_models(models, requests, processes=1, relative_accuracy=0.01):
+    """dictionary of request: RunningStats over every sim in `models` (a `Models` of .sim
+    files or a list of paths), see sim_stats for the form of the requests.
+
+    Only one sim is in memory at a time (per worker process with processes > 1). Sims that
+    are not complete or fail to load are reported and skipped.
+    """
+    from pyofx import process_sims
+    paths = models.paths() if hasattr(models, 'paths') else models
+    jobs = ((path, requests, relative_accuracy) for path in paths)
+    summary = dict((tuple(r), RunningStats(relative_accuracy)) for r in requests)
+    for _, stats, error in process_sims(sim_stats, jobs, processes):
+        if error:
+            print(error)
+            continue
+        for request, s in zip(requests, stats):
+            summary[tuple(request)].merge(s)
+    return summary
+
+
+class Envelope(object):
+
+    """Design envelope of range graphs along a line.
+
+    The arc lengths of the first range graph added (or `arc_lengths`) set the mesh, range
+    graphs on a different mesh are linearly interpolated onto it. maximum, minimum and mean
+    are arrays along the mesh and governing_maximum/governing_minimum give the source
+    (e.g. the sim path) that governs each arc length.
+    """
+
+    def __init__(self, arc_lengths=None):
+        self.arc_lengths = None if arc_lengths is None else np.asarray(arc_lengths, float)
+        self.count = 0
+        self.maximum = None
+        self.minimum = None
+        self.mean = None
+        self.sources = []
+        self._max_source = None
+        self._min_source = None
+
+    def _on_mesh(self, arc_lengths, values):
+        values = np.asarray(values, dtype=float)
+        if (len(arc_lengths) == len(self.arc_lengths) and
+                np.array_equal(arc_lengths, self.arc_lengths)):
+            return values
+        return np.interp(self.arc_lengths, arc_lengths, values)
+
+    def update(self, arc_lengths, maximum, minimum, mean=None, source=None):
+        """add one range graph (e.g. RangeGraph.X, .Max, .Min, .Mean)"""
+        self._add(arc_lengths, maximum, minimum, mean, 1,
+                  np.zeros(0, dtype=int), np.zeros(0, dtype=int), [source])
+
+    def merge(self, other):
+        """add the range graphs of another Envelope"""
+        if other.count:
+            self._add(other.arc_lengths, other.maximum, other.minimum, other.mean,
+                      other.count, other._max_source, other._min_source, other.sources)
+
+    def _add(self, arc_lengths, maximum, minimum, mean, count, max_source, min_source,
+             sources):
+        arc_lengths = np.asarray(arc_lengths, dtype=float)
+        if self.arc_lengths is None:
+            self.arc_lengths = arc_lengths
+        maximum = self._on_mesh(arc_lengths, maximum)
+        minimum = self._on_mesh(arc_lengths, minimum)
+        offset = len(self.sources)
+        self.sources.extend(sources)
+        if len(max_source) == 0:
+            max_source = min_source = np.zeros(len(self.arc_lengths), dtype=int)
+        else:
+            nearest = self._on_mesh(arc_lengths, np.arange(len(arc_lengths)))
+            nearest = nearest.round().astype(int)
+            max_source, min_source = max_source[nearest], min_source[nearest]
+        if self.count == 0:
+            self.maximum, self.minimum = maximum, minimum
+            self._max_source, self._min_source = max_source + offset, min_source + offset
+        else:
+            higher = maximum > self.maximum
+            lower = minimum < self.minimum
+            self.maximum = np.where(higher, maximum, self.maximum)
+            self.minimum = np.where(lower, minimum, self.minimum)
+            self._max_source = np.where(higher, max_source + offset, self._max_source)
+            self._min_source = np.where(lower, min_source + offset, self._min_source)
+        if mean is not None:
+            mean = self._on_mesh(arc_lengths, mean)
+            if self.mean is None:
+                self.mean = mean
+            else:
+                self.mean = self.mean + (mean - self.mean) * count / (self.count + count)
+        self.count += count
+
+    @property
+    def governing_maximum(self):
+        """the source of the maximum at each arc length"""
+        return [self.sources[i] for i in self._max_source]
+
+    @property
+    def governing_minimum(self):
+        """the source of the minimum at each arc length"""
+        return [self.sources[i] for i in self._min_source]
+
+
+def sim_range_graph(path, line_name, variable):
+    """(X, Max, Min, Mean) of the stage 1 range graph of `variable` along `line_name` in
+    the simulation at `path`, raises OFXError if the simulation is not complete."""
+    from pyofx import complete_sim, Period
+    rg = complete_sim(path)[line_name].RangeGraph(variable, Period(1))
+    return (np.asarray(rg.X), np.asarray(rg.Max), np.asarray(rg.Min),
+            np.asarray(rg.Mean))
+
+
+def envelope_models(models, line_name, variable, processes=1, arc_lengths=None):
+    """Envelope of the range graph of `variable` along `line_name` over every sim in
+    `models` (a `Models` of .sim files or a list of paths), the governing sources are the
+    sim paths.
+
+    With processes > 1 the range graphs are fetched in worker processes and added in the
+    serial order. Sims that are not complete or fail to load are reported and skipped.
+    """
+    from pyofx import process_sims
+    paths = models.paths() if hasattr(models, 'paths') else models
+    jobs = ((path, line_name, variable) for path in paths)
+    envelope = Envelope(arc_lengths)
+    for job, range_graph, error in process_sims(sim_range_graph, jobs, processes):
+        if error:
+            print(error)
+            continue
+        envelope.update(*range_graph, source=job[0])
+    return envelope
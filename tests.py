@@ -1,11 +1,85 @@
 import unittest
+from unittest import mock
 from pyofx import *
 import tempfile
 import random
+import io
+import json
+import os
+import time
 from os import path
 import shutil
+import subprocess
 import sys
 from itertools import product
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import ULS
+import FLS
+from pyofx.stats import RunningStats, Envelope, summarise_models, envelope_models
+from pyofx import fake, geom, process_sims
+from pyofx.profiling import profiled
+from pyofx.cases import CaseGenerator, parameter_grid
+from pyofx.compare import compare_models
+from pyofx.pyramid import HistoryPyramid, PyramidCache
+from pyofx.cluster import ClusterBackend, ClusterWorker, _request
+from pyofx.jobs import (LocalBackend, JobCache, JobMonitor, run_async, Pipeline,
+                        JobTelemetry, referenced_files)
+import asyncio
+
+
+# cold start budget for `import pyofx` in a fresh interpreter, in seconds
+IMPORT_TIME_TARGET = 0.1
+
+
+def _fresh_python(code):
+    """run `code` in a new interpreter that cannot import OrcFxAPI, return its stdout"""
+    code = "import sys\nsys.modules['OrcFxAPI'] = None\n" + code
+    env = dict(os.environ)
+    env.pop("PYOFX_API", None)
+    return subprocess.check_output([sys.executable, "-c", code], env=env,
+                                   cwd=path.dirname(path.abspath(__file__)),
+                                   universal_newlines=True)
+
+
+def write_test_sim(directory, name, duration, wave_hs=None):
+    """run a model of one line, "TEST LINE", for `duration` s and save it to
+    `directory`/`name`.sim, returns the model"""
+    m = Model()
+    m.CreateObject(otLine, name="TEST LINE")
+    m.general.StageDuration = [1, duration]
+    if wave_hs is not None:
+        m.environment.WaveHs = wave_hs
+    m.RunSimulation()
+    m.SaveSimulation(path.join(directory, name + ".sim"))
+    return m
+
+
+class TestImport(unittest.TestCase):
+
+    def test_import_is_fast_and_lazy(self):
+        out = _fresh_python(
+            "import time\n"
+            "t = time.perf_counter()\n"
+            "import pyofx\n"
+            "print(time.perf_counter() - t)\n"
+            "print(' '.join(m for m in ['numpy', 'tkinter', 'ctypes', 'subprocess', 'csv']"
+            " if m in sys.modules))\n")
+        seconds, loaded = (out.splitlines() + [""])[:2]
+        self.assertLess(float(seconds), IMPORT_TIME_TARGET)
+        self.assertEqual(loaded, "")
+
+    def test_pure_parts_without_orcfxapi(self):
+        out = _fresh_python(
+            "from pyofx import gamma_dnv, OFXError\n"
+            "from pyofx import geom\n"
+            "import pyofx.stats, pyofx.jobs\n"
+            "print(gamma_dnv(4.0, 20.0))\n"
+            "try:\n"
+            "    from pyofx import Model\n"
+            "except ImportError:\n"
+            "    print('no Model')\n")
+        self.assertEqual(out.splitlines(), ["1.0", "no Model"])
 
 
 class TestModelAttributes(unittest.TestCase):
@@ -142,6 +216,44 @@ class TestModels(unittest.TestCase):
                 m.RunSimulation()
 
 
+class TestModes(unittest.TestCase):
+
+    def setUp(self):
+        self.m = Model()
+        self.line = self.m.CreateObject(otLine, name="TEST LINE")
+
+    def test_get_modes_batch(self):
+        modes = get_modes_batch(self.m, to_mode=10)
+        numbers, periods, frequencies = modes["TEST LINE"]
+        expected = get_modes(self.m, self.line, to_mode=10)
+        self.assertListEqual(list(numbers), [n for n, _, _ in expected])
+        self.assertListEqual(list(periods), [p for _, p, _ in expected])
+        for f, p in zip(frequencies, periods):
+            self.assertAlmostEqual(f * p, 1.0)
+
+    def test_get_modes_batch_cached(self):
+        first = get_modes_batch(self.m, ["TEST LINE"])
+        with mock.patch.object(type(self.m), "SaveDataMem", side_effect=AssertionError):
+            self.assertIs(get_modes_batch(self.m, ["TEST LINE"])["TEST LINE"],
+                          first["TEST LINE"])
+        self.m.general.StageDuration = [1, 1]
+        self.assertIsNot(get_modes_batch(self.m, ["TEST LINE"])["TEST LINE"],
+                         first["TEST LINE"])
+
+    def test_get_modes_batch_edited_in_static_state(self):
+        bare = fake.Model()
+        bare.CreateObject(otLine, name="TEST LINE")
+        for m in [self.m, bare]:
+            line = m["TEST LINE"]
+            before = get_modes_batch(m, ["TEST LINE"], to_mode=2)["TEST LINE"][1]
+            line.Length = [2 * length for length in line.Length]
+            m.CalculateStatics()
+            after = get_modes_batch(m, ["TEST LINE"], to_mode=2)["TEST LINE"][1]
+            np.testing.assert_allclose(after, 2 * before)
+            self.assertListEqual(list(after), [p for _, p, _ in
+                                               get_modes(m, line, to_mode=2)])
+
+
 class TestDrawings(unittest.TestCase):
 
     def setUp(self):
@@ -170,6 +282,844 @@ class TestDrawings(unittest.TestCase):
         self.assertListEqual(list(self.sd.VertexY), _y)
         self.assertListEqual(list(self.sd.VertexZ), _z)
 
+    def test_bulk_drawings_headless(self):
+        buoys = [self.sd, self.m.CreateObject(ot6DBuoy)]
+        out = io.StringIO()
+        drawings = buoy_drawing(np.array([2.0, 4.0]), ofx_object=buoys, output=out)
+        self.assertEqual(drawings.shape, (2, 8, 3))
+        self.assertListEqual(list(buoys[1].VertexX), [2.0, -2.0, -2.0, 2.0] * 2)
+        tables = out.getvalue().split("\n\n")
+        self.assertEqual(len(tables), 2)
+        self.assertEqual(tables[0].splitlines()[0], "1.0\t1.0\t1.0")
+        out = io.StringIO()
+        vessels = vessel_drawing([100, 80], 16, [16, 12], output=out)
+        self.assertListEqual(vessels[1, :, 0].tolist(),
+                             [40.0, 36.0, -40.0, -40.0, 36.0, 38.0, 36.0, -40.0, -40.0, 36.0])
+        self.assertEqual(len(out.getvalue().splitlines()), 21)
+        vertices, edges = hull_vertices(100, 10, 20, stations=11, points=5)
+        self.assertEqual(vertices.shape, (11 * 9, 3))
+        self.assertEqual(edges.max(), len(vertices))
+        self.assertAlmostEqual(np.abs(vertices[:, 1]).max(), 10.0)
+
+
+class TestGeom(unittest.TestCase):
+
+    def test_best_fit_frames(self):
+        rng = np.random.RandomState(0)
+        angles = np.column_stack((rng.uniform(-80, 80, 200), rng.uniform(-80, 80, 200),
+                                  rng.uniform(-170, 170, 200)))
+        rotations = np.array([geom.rotate(a, "xyz") for a in angles])
+        reference = np.array([[0.0, 0, 0], [10, 0, 0], [0, 5, 0]])
+        offsets = rng.normal(0, 10, (200, 3))
+        points = np.einsum("tij,nj->tni", rotations, reference) + offsets[:, None, :]
+        fitted, t = geom.best_fit_frames(reference, points, sequence="xyz")
+        self.assertTrue(np.allclose(fitted, angles))
+        self.assertTrue(np.allclose(t, offsets))
+        R, _ = geom.best_fit_frames(reference, points + rng.normal(0, 1e-3, points.shape),
+                                    weights=[1, 2, 2])
+        self.assertTrue(np.allclose(R, rotations, atol=1e-3))
+        self.assertTrue(np.allclose(np.linalg.det(R), 1.0))
+        self.assertTrue(np.allclose(geom.euler_angles_batch(rotations[:5], "zyz"),
+                                    [geom.euler_angles(r, "zyz") for r in rotations[:5]]))
+
+
+class TestULS(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        t = np.arange(0, 3600, 0.5)
+        w = np.linspace(0.4, 1.2, 50)
+        self.histories = [np.cos(np.outer(t, w) + rng.uniform(0, 6.3, 50)).sum(1)
+                          for _ in range(5)]
+
+    def test_peaks_of_sine(self):
+        x = -2 * np.cos(np.linspace(0, 20 * np.pi, 2001))
+        self.assertEqual(len(ULS.peaks(x)), 9)
+        self.assertTrue(np.allclose(ULS.peaks(x), 2.0))
+        self.assertTrue(np.allclose(ULS.peaks(x, 'Min'), -2.0))
+
+    def test_extreme_stats_min_mirrors_max(self):
+        for distribution in ['weibull', 'gumbel']:
+            r_max = ULS.ULSResult('Line1', 'Curvature', 'Max', distribution=distribution)
+            r_min = ULS.ULSResult('Line1', 'Curvature', 'Min', distribution=distribution)
+            r_max.time_history = self.histories
+            r_min.time_history = [-th for th in self.histories]
+            r_max.sample_interval = r_min.sample_interval = 0.5
+            r_max.extreme_stats()
+            r_min.extreme_stats()
+            self.assertAlmostEqual(r_max.maximum_most_probable_level,
+                                   -r_min.maximum_most_probable_level)
+            self.assertGreater(r_max.maximum_most_probable_level,
+                               r_max.exeecdence_threshold)
+
+    def test_bounded_peaks_match_all_peaks(self):
+        results = []
+        for max_peaks in [100000, 200]:
+            r = ULS.ULSResult('Line1', 'Curvature', 'Max', max_peaks=max_peaks)
+            for th in self.histories:
+                r.add(th, 0.5)
+            results.append(r.extreme_stats().maximum_most_probable_level)
+        self.assertEqual(results[0], results[1])
+        r = ULS.ULSResult('Line1', 'Curvature', 'Max', max_peaks=5)
+        for th in self.histories:
+            r.add(th, 0.5)
+        with self.assertRaises(OFXError):
+            r.extreme_stats()
+
+    def test_plan_extraction_shares_time_histories(self):
+        m = Model()
+        line = m.CreateObject(otLine, name="TEST LINE")
+        m.general.StageDuration = [1, 2]
+        m.RunSimulation()
+        results = [ULS.ULSResult("TEST LINE", "Effective Tension", "Max", node=2),
+                   ULS.ULSResult("TEST LINE", "Effective Tension", "Min", node=2),
+                   ULS.ULSResult("TEST LINE", "Curvature", "Max", arc_length=10.0)]
+        specifications, columns = ULS.plan_extraction(m, results)
+        self.assertEqual(len(specifications), 2)
+        self.assertListEqual(columns, [0, 0, 1])
+        tension = ULS.extract(m, results)[0]
+        self.assertListEqual(list(tension), list(line.TimeHistory(
+            "Effective Tension", Period(1), oeNodeNum(2))))
+
+    def test_process_uls_folder_parallel_matches_serial(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        for seed in range(3):
+            write_test_sim(temp_dir, "seed_{}".format(seed), 600, wave_hs=2.0 + seed)
+        levels = []
+        for processes in [1, 2]:
+            results = [ULS.ULSResult("TEST LINE", "Effective Tension", "Max", arc_length=0.0)]
+            ULS.process_uls_folder(temp_dir, results, processes=processes)
+            self.assertEqual(results[0].accumulator.sims, 3)
+            levels.append(results[0].maximum_most_probable_level)
+        self.assertEqual(levels[0], levels[1])
+
+    def test_summarise_sim_reports_failures(self):
+        temp_dir = tempfile.mkdtemp()
+        dat, sim = dat_sim_paths(temp_dir, "not run")
+        Model().SaveData(dat)
+        results = [ULS.ULSResult("Line1", "Curvature").extraction]
+        (_, not_complete, error), = process_sims(ULS.summarise_sim, [(dat, results)])
+        self.assertIsNone(not_complete)
+        self.assertTrue(error.startswith("NOT COMPLETE"))
+        (_, failed, error), = process_sims(ULS.summarise_sim, [(sim, results)])
+        self.assertIsNone(failed)
+        self.assertTrue(error.startswith("FAILED"))
+        shutil.rmtree(temp_dir)
+
+    def test_spectral_extremes_of_sine(self):
+        t = np.arange(0, 3600, 0.25)
+        x = np.column_stack([3 * np.sin(2 * np.pi * t / 8.0), np.sin(2 * np.pi * t / 8.0)])
+        stats = ULS.spectral_extremes(x, 0.25, segment_length=1024)
+        self.assertTrue(np.allclose(stats.std, [3 / np.sqrt(2), 1 / np.sqrt(2)], rtol=0.01))
+        self.assertTrue(np.allclose(stats.tz, 8.0, rtol=0.05))
+        self.assertAlmostEqual(stats.mpm[0], 3 * stats.mpm[1])
+        low = ULS.spectral_extremes(x[:, 0], 0.25, extreme='Min', segment_length=1024)
+        self.assertAlmostEqual(low.mpm, -stats.mpm[0], places=3)
+
+    def test_spectral_extremes_broadband(self):
+        rng = np.random.RandomState(0)
+        estimates, maxima = [], []
+        for _ in range(10):
+            # moving average of white noise, bandwidth about 0.89
+            x = np.convolve(rng.randn(21602), np.ones(3) / np.sqrt(3), "valid")
+            stats = ULS.spectral_extremes(x, 0.5)
+            estimates.append(stats.mpm)
+            maxima.append(x.max())
+        self.assertGreater(stats.bandwidth, 0.85)
+        self.assertLess(abs(np.mean(estimates) - np.mean(maxima)), 0.1)
+        upcrossings = 10800.0 / stats.tz
+        self.assertGreater(stats.mpm, stats.mean + stats.std * np.sqrt(2 * np.log(upcrossings)))
+
+    def test_bad_extreme(self):
+        with self.assertRaises(OFXError):
+            ULS.ULSResult('Line1', 'Curvature', 'Mean')
+
+
+class TestFLS(unittest.TestCase):
+
+    def test_rainflow_astm_example(self):
+        ranges, counts = FLS.rainflow([-2, 1, -3, 5, -1, 3, -4, 4, -2])
+        cycles = {}
+        for r, c in zip(ranges, counts):
+            cycles[r] = cycles.get(r, 0) + c
+        self.assertDictEqual(cycles, {3: 0.5, 4: 1.5, 6: 0.5, 8: 1.0, 9: 0.5})
+
+    def test_turning_points(self):
+        self.assertListEqual(list(FLS.turning_points([0, 1, 2, 2, 1, 0, 0, 3])),
+                             [0, 2, 0, 3])
+
+    def test_bilinear_sn_curve(self):
+        sn = FLS.SNCurve(12.164, 3, 15.606, 5)
+        self.assertAlmostEqual(sn.cycles([sn.switch_stress])[0], 1e7, delta=1e4)
+        self.assertAlmostEqual(sn.damage([100.0], [10 ** 12.164 / 100 ** 3]), 1.0)
+        stress = np.column_stack([np.sin(np.linspace(0, 20 * np.pi, 401))] * 2 +
+                                 [np.zeros(401), np.ones(401)])
+        damage = FLS.fatigue_damage(stress, sn, scf=100.0)
+        self.assertEqual(damage.shape, (4,))
+        self.assertEqual(damage[0], damage[1])
+        self.assertListEqual(list(damage[2:]), [0.0, 0.0])
+        self.assertListEqual(list(FLS.turning_points([1, 1, 1])), [1.0])
+
+    def test_rainflow_matches_stack_method(self):
+        def stack_rainflow(x):
+            full, stack = [], []
+            for point in FLS.turning_points(x).tolist():
+                stack.append(point)
+                while len(stack) >= 4 and abs(stack[-3] - stack[-2]) <= min(
+                        abs(stack[-4] - stack[-3]), abs(stack[-2] - stack[-1])):
+                    full.append(abs(stack[-3] - stack[-2]))
+                    del stack[-3:-1]
+            return sorted(full), sorted(np.abs(np.diff(stack)))
+
+        rng = np.random.RandomState(3)
+        for x in [rng.randn(5000), rng.randint(-3, 4, 500), np.cumsum(rng.randn(5000))]:
+            ranges, counts = FLS.rainflow(x)
+            full, residue = stack_rainflow(x)
+            self.assertListEqual(sorted(ranges[counts == 1.0]), full)
+            self.assertListEqual(sorted(ranges[counts == 0.5]), residue)
+
+    def test_process_fls_folder_skips_incomplete(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        for name in ["a", "b"]:
+            write_test_sim(temp_dir, name, 100)
+        Model().SaveSimulation(path.join(temp_dir, "not run.sim"))
+        sn = FLS.SNCurve(12.164, 3, 15.606, 5)
+        done, arc_lengths, damage = FLS.process_fls_folder(temp_dir, "TEST LINE", sn,
+                                                           processes=2)
+        self.assertListEqual([path.basename(p) for p in done], ["a.sim", "b.sim"])
+        self.assertEqual(damage.shape, (2, len(arc_lengths)))
+
+
+class TestStats(unittest.TestCase):
+
+    def test_running_stats_merge(self):
+        x = np.random.RandomState(2).normal(3.0, 5.0, 100000)
+        first, second = RunningStats(), RunningStats()
+        first.update(x[:30000], source="first")
+        second.update(x[30000:], np.arange(30000, 100000) * 0.1, source="second")
+        first.merge(second)
+        self.assertEqual(first.count, len(x))
+        self.assertAlmostEqual(first.mean, x.mean())
+        self.assertAlmostEqual(first.std, x.std(ddof=1))
+        self.assertEqual(first.maximum, x.max())
+        self.assertEqual(first.minimum, x.min())
+        source = "first" if x.argmax() < 30000 else "second"
+        self.assertEqual(first.source_of_maximum, source)
+        for q in [1, 25, 50, 75, 99]:
+            self.assertAlmostEqual(first.percentile(q), np.percentile(x, q),
+                                   delta=0.02 * abs(np.percentile(x, q)) + 0.1)
+
+    def test_envelope_merge_different_meshes(self):
+        coarse, fine = np.linspace(0, 100, 11), np.linspace(0, 100, 21)
+        first, second = Envelope(), Envelope()
+        first.update(coarse, coarse, -coarse, np.zeros(11), source="up")
+        first.update(coarse, coarse[::-1], -coarse[::-1], np.ones(11), source="down")
+        second.update(fine, np.full(21, 55.0), np.full(21, -55.0), np.full(21, 4.0),
+                      source="flat")
+        first.merge(second)
+        self.assertListEqual(list(first.maximum), [100, 90, 80, 70, 60, 55, 60, 70, 80, 90, 100])
+        self.assertListEqual(first.governing_maximum,
+                             ["down"] * 5 + ["flat"] + ["up"] * 5)
+        self.assertListEqual(first.governing_minimum, first.governing_maximum)
+        self.assertTrue(np.allclose(first.mean, 5.0 / 3))
+        self.assertEqual(first.count, 3)
+
+    def test_summarise_models(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        paths = [write_test_sim(temp_dir, name, 50, wave_hs=wave_hs).path
+                 for name, wave_hs in [("a", 2.0), ("b", 4.0)]]
+        request = ("TEST LINE", "Effective Tension", 0.0)
+        expected = np.concatenate([Model(p)["TEST LINE"].TimeHistory(
+            "Effective Tension", Period(1), oeArcLength(0.0)) for p in paths])
+        summary = summarise_models(paths + [path.join(temp_dir, "missing.sim")], [request],
+                                   processes=2)[request]
+        self.assertEqual(summary.count, len(expected))
+        self.assertAlmostEqual(summary.mean, expected.mean())
+        self.assertEqual(summary.maximum, expected.max())
+        envelope = envelope_models(paths, "TEST LINE", "Effective Tension", processes=2)
+        self.assertEqual(envelope.count, 2)
+        rg = Model(paths[1])["TEST LINE"].RangeGraph("Effective Tension", Period(1))
+        self.assertTrue(np.all(envelope.maximum >= rg.Max))
+
+
+class TestFakeAPI(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self.m = fake.Model()
+        self.line = self.m.CreateObject(fake.otLine)
+        self.m.RunSimulation()
+
+    def tearDown(self):
+        fake.configure(latency=0.0)
+        shutil.rmtree(self._temp_dir)
+
+    def test_results_survive_save_and_load(self):
+        sim = path.join(self._temp_dir, "case.sim")
+        self.m.SaveSimulation(sim)
+        loaded = fake.Model(sim)
+        self.assertTrue(loaded.simulationComplete)
+        self.assertEqual(loaded["Line1"].typeName, "Line")
+        self.assertTrue(np.array_equal(
+            loaded["Line1"].TimeHistory("Effective Tension", fake.Period(1)),
+            self.line.TimeHistory("Effective Tension", fake.Period(1))))
+        loaded.environment.WaveHs = 3.0
+        self.assertFalse(loaded.simulationComplete)
+        loaded.RunSimulation()
+        self.assertFalse(np.array_equal(loaded["Line1"].TimeHistory("Effective Tension"),
+                                        self.line.TimeHistory("Effective Tension")))
+
+    def test_multiple_time_histories(self):
+        extras = [fake.oeArcLength(a) for a in self.line.NodeArclengths]
+        many = fake.GetMultipleTimeHistories(
+            [fake.TimeHistorySpecification(self.line, "Curvature", e) for e in extras],
+            fake.Period(1))
+        self.assertEqual(many.shape, (len(self.m.SampleTimes(fake.Period(1))), 11))
+        self.assertTrue(np.array_equal(
+            many[:, 3], self.line.TimeHistory("Curvature", fake.Period(1), extras[3])))
+
+    def test_latency_and_errors(self):
+        dat = path.join(self._temp_dir, "case.dat")
+        self.m.SaveData(dat)
+        fake.configure(latency={"LoadData": 0.05})
+        start = time.time()
+        fake.Model(dat)
+        self.assertGreaterEqual(time.time() - start, 0.05)
+        with self.assertRaises(fake.DLLError):
+            fake.Model(dat)["Line1"].TimeHistory("Curvature")
+        virtual = fake.Model()
+        virtual.UseVirtualLogging()
+        with self.assertRaises(fake.DLLError):
+            virtual.RunSimulation()
+
+
+class TestProfiling(unittest.TestCase):
+
+    def test_profiled_counts_calls(self):
+        m = Model()
+        line = m.CreateObject(otLine, name="TEST LINE")
+        m.RunSimulation()
+        with profiled() as profile:
+            for _ in range(3):
+                m["TEST LINE"]
+            line.TimeHistory("Effective Tension", Period(1))
+        self.assertFalse(hasattr(Model.SaveData, "__wrapped__"))
+        m["TEST LINE"]
+        lookups = [row for row in profile.stats() if
+                   row["method"].endswith("__getitem__") and row["arguments"] == "'TEST LINE'"]
+        self.assertEqual(lookups[0]["calls"], 3)
+        self.assertEqual(sum(lookups[0]["histogram"].values()), 3)
+        th = [row for row in profile.stats() if row["method"].endswith("TimeHistory")]
+        self.assertEqual(th[0]["arguments"], "'Effective Tension', {}".format(
+            type(Period(1)).__name__))
+        self.assertIn("TimeHistory", profile.report(5))
+
+    def test_profile_from_environment(self):
+        report = path.join(tempfile.mkdtemp(), "profile.txt")
+        env = dict(os.environ, PYOFX_API="pyofx.fake", PYOFX_PROFILE=report)
+        subprocess.check_call([sys.executable, "-c", "import pyofx; pyofx.Model()"],
+                              env=env, cwd=path.dirname(path.abspath(__file__)))
+        with open(report) as f:
+            self.assertIn("pyofx.model.Model.__init__", f.read())
+        shutil.rmtree(path.dirname(report))
+
+    def test_profiled_before_model_import(self):
+        env = dict(os.environ, PYOFX_API="pyofx.fake", PYOFX_PROFILE="1")
+        code = ("from pyofx.profiling import profiled\nimport pyofx\n"
+                "with profiled() as profile:\n    pyofx.Model()\n"
+                "print(profile.stats(by_method=True)[0]['calls'])")
+        output = subprocess.check_output([sys.executable, "-c", code], env=env, timeout=60,
+                                         stderr=subprocess.DEVNULL, universal_newlines=True,
+                                         cwd=path.dirname(path.abspath(__file__)))
+        self.assertEqual(output.strip(), "1")
+
+
+BASE_YML = """General:
+  StageDuration: [8, 100]
+Environment:
+  WaveTrains:
+    - Name: Wave1
+      WaveDirection: 180
+      WaveHs: 7
+      WaveTp: 8
+      WaveGamma: 3.3
+Vessels:
+  - Name: Vessel1
+    InitialPosition: [0, 0, 0]
+  - Name: Vessel2
+    InitialPosition: [0, 0, 0]
+"""
+
+
+class TestCases(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def test_patch_yml_cases(self):
+        base = path.join(self._temp_dir, "base.yml")
+        with open(base, "w") as f:
+            f.write(BASE_YML)
+        generator = CaseGenerator(
+            base, {"Hs": "WaveHs", "Tp": "WaveTp", "gamma": "WaveGamma",
+                   "offset": ("Vessel2", "InitialPosition[0]")},
+            name="Hs={Hs}_Tp={Tp}_x={offset}")
+        cases = parameter_grid(Hs=[2.0, 3.0], Tp=[6.0, 12.0], offset=[-10, 10])
+        directory = path.join(self._temp_dir, "cases")
+        manifest = generator.generate(directory, cases, processes=2)
+        self.assertEqual(len(manifest), 8)
+        self.assertEqual(len(generator.written), 8)
+        entry = manifest["Hs=3.0_Tp=6.0_x=10"]
+        self.assertAlmostEqual(entry["parameters"]["gamma"], gamma_dnv(3.0, 6.0))
+        with open(entry["path"]) as f:
+            text = f.read()
+        self.assertIn("      WaveHs: 3.0\n      WaveTp: 6.0\n", text)
+        self.assertIn("WaveGamma: {!r}\n".format(gamma_dnv(3.0, 6.0)), text)
+        self.assertIn("Name: Vessel1\n    InitialPosition: [0, 0, 0]", text)
+        self.assertIn("Name: Vessel2\n    InitialPosition: [10, 0, 0]", text)
+        with open(path.join(directory, "manifest.json")) as f:
+            self.assertEqual(list(json.load(f)), list(manifest))
+        generator.generate(directory, cases, processes=1)
+        self.assertEqual(len(generator.unchanged), 8)
+
+    def test_edit_model_cases(self):
+        base = path.join(self._temp_dir, "base.dat")
+        Model().SaveData(base)
+
+        def stage(model, duration):
+            model.general.StageDuration = [8.0, duration]
+
+        generator = CaseGenerator(base, {"duration": stage})
+        manifest = generator.generate(self._temp_dir, parameter_grid(duration=[50.0, 60.0]),
+                                      processes=1, manifest=None)
+        self.assertListEqual(list(manifest), ["case_0000", "case_0001"])
+        m = Model(manifest["case_0001"]["path"])
+        self.assertEqual(m.general.StageDuration[1], 60.0)
+        self.assertFalse(path.exists(path.join(self._temp_dir, "manifest.json")))
+        self.assertEqual(len(generator.written), 2)
+        generator.generate(self._temp_dir, parameter_grid(duration=[50.0, 70.0]),
+                           processes=1, manifest=None)
+        self.assertListEqual(generator.unchanged, [manifest["case_0000"]["path"]])
+        self.assertListEqual(generator.written, [manifest["case_0001"]["path"]])
+        self.assertListEqual(sorted(os.listdir(self._temp_dir)),
+                             ["base.dat", "case_0000.dat", "case_0001.dat"])
+
+    def test_gamma_needs_wave_parameters(self):
+        base = path.join(self._temp_dir, "base.yml")
+        with open(base, "w") as f:
+            f.write(BASE_YML)
+        overrides = {"gamma": "WaveGamma", "offset": ("Vessel2", "InitialPosition[0]")}
+        generator = CaseGenerator(base, overrides)
+        self.assertDictEqual(dict(generator.parameters({"offset": 5})), {"offset": 5})
+        generator = CaseGenerator(base, dict(overrides, height="WaveHs", period="WaveTp"),
+                                  wave=("height", "period"))
+        self.assertAlmostEqual(generator.parameters({"height": 3.0, "period": 6.0})["gamma"],
+                               gamma_dnv(3.0, 6.0))
+
+
+class TestCompare(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self.trees = [path.join(self._temp_dir, tree) for tree in ["a", "b"]]
+        for tree, cases in zip(self.trees, [["1", "2", "3"], ["1", "2", "3", "4"]]):
+            os.makedirs(path.join(tree, "sub"))
+            for case in cases:
+                wave_hs = 3.0 if case == "2" and tree.endswith("b") else None
+                write_test_sim(path.join(tree, "sub"), "case_{}".format(case), 5, wave_hs)
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def test_compare_trees(self):
+        requests = [("TEST LINE", "Effective Tension", 0.0), ("TEST LINE", "Curvature", 50.0)]
+        comparison = compare_models(self.trees[0], self.trees[1], requests, processes=2)
+        self.assertDictEqual(comparison.summary(), {
+            "cases": 3, "results": 6, "failed cases": 1, "failed results": 2, "errors": 0,
+            "only in a": 0, "only in b": 1})
+        worst = comparison.rows[0]
+        self.assertEqual(worst["case"], path.join("sub", "case_2.sim"))
+        self.assertFalse(worst["passed"])
+        self.assertEqual(comparison.rows[-1]["max_abs"], 0.0)
+        report = path.join(self._temp_dir, "report.csv")
+        comparison.write_report(report, limit=3)
+        with open(report) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].startswith("1," + worst["case"]))
+
+
+class TestPyramid(unittest.TestCase):
+
+    def test_fetch_preserves_peaks(self):
+        values = np.sin(np.linspace(0, 200, 100001))
+        values[12345] = 5.0
+        pyramid = HistoryPyramid.from_values(values, dt=0.1, factor=4, min_size=256)
+        self.assertEqual(len(pyramid.level(pyramid.depth - 1)[0]), 98)
+        times, low, high = pyramid.fetch(pixels=800)
+        self.assertLessEqual(len(times), 800)
+        self.assertEqual(high.max(), 5.0)
+        self.assertEqual(low.min(), values.min())
+        times, low, high = pyramid.fetch(1230.0, 1240.0, pixels=300)
+        self.assertLessEqual(len(times), 300)
+        self.assertEqual(high.max(), 5.0)
+        self.assertLessEqual(times[0], 1230.0)
+        times, low, high = pyramid.fetch(1234.0, 1235.0, pixels=300)
+        np.testing.assert_array_equal(low, values[12340:12351])
+        np.testing.assert_array_equal(low, high)
+        np.testing.assert_allclose(times, 0.1 * np.arange(12340, 12351))
+
+    def test_cache(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        m = write_test_sim(temp_dir, "case", 200)
+        sim_path = m.path
+        request = ("TEST LINE", "Effective Tension", 0.0)
+        expected = m["TEST LINE"].TimeHistory("Effective Tension", Period(1),
+                                              oeArcLength(0.0))
+        cache = PyramidCache(min_size=16)
+        times, low, high = cache.fetch(sim_path, request, pixels=50)
+        cache_path = path.join(temp_dir, "case.pyramid.npz")
+        self.assertTrue(path.isfile(cache_path))
+        self.assertLessEqual(len(times), 50)
+        self.assertAlmostEqual(high.max(), expected.max())
+        self.assertAlmostEqual(low.min(), expected.min())
+        built = os.stat(cache_path).st_mtime_ns
+        time.sleep(0.01)
+        cache.fetch(sim_path, request, pixels=50)
+        self.assertEqual(os.stat(cache_path).st_mtime_ns, built)
+        pyramids = cache.get(sim_path, [request, ("TEST LINE", "Curvature", 50.0)])
+        self.assertEqual(len(pyramids), 2)
+        np.testing.assert_allclose(pyramids[request].level(0)[0], expected)
+        for _ in range(5):
+            cache.get(sim_path, [request])[request].fetch(pixels=10)
+        if path.isdir("/proc/self/fd"):
+            self.assertNotIn(cache_path, [os.path.realpath(path.join("/proc/self/fd", fd))
+                                          for fd in os.listdir("/proc/self/fd")])
+        old = cache.get(sim_path, [request])[request]
+        m.SaveSimulation(sim_path)
+        os.utime(sim_path, (0, 0))
+        cache.fetch(sim_path, request, pixels=50)
+        with self.assertRaises(OFXError):
+            old.fetch(pixels=10)
+        other = PyramidCache(cache_dir=path.join(temp_dir, "cache"))
+        other.get(sim_path, [request])
+        self.assertEqual(os.listdir(path.join(temp_dir, "cache")),
+                         [path.basename(other.path(sim_path))])
+        # builders of the same sim at once each write their own temporary file
+        os.remove(cache_path)
+        with ThreadPoolExecutor(4) as executor:
+            built = list(executor.map(lambda _: cache.fetch(sim_path, request, pixels=50),
+                                      range(4)))
+        self.assertAlmostEqual(built[-1][2].max(), high.max())
+        self.assertListEqual(sorted(os.listdir(temp_dir)),
+                             ["cache", "case.pyramid.npz", "case.sim"])
+
+
+def _stub_runner(filepath, statics=False):
+    """pretend to run a simulation without OrcaFlex"""
+    if "fail" in filepath:
+        raise RuntimeError("stub failure")
+    with open(path.splitext(filepath)[0] + ".sim", "w") as f:
+        f.write("statics" if statics else "dynamics")
+
+
+def _stub_post_process(sim_path):
+    with open(sim_path) as f, open(sim_path + ".txt", "w") as out:
+        out.write(f.read())
+
+
+class TestLocalJobs(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self.dats = []
+        for name in ["case_1", "case_2", "fail_3"]:
+            dat, _ = dat_sim_paths(self._temp_dir, name)
+            open(dat, "w").close()
+            self.dats.append(dat)
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def test_run_local_jobs(self):
+        j = Jobs(backend=LocalBackend(_stub_runner, processes=2))
+        for dat in self.dats:
+            j.add_file(dat)
+        j.run(wait=True, statics=True)
+        self.assertDictEqual(j.status(), {self.dats[0]: "Completed",
+                                          self.dats[1]: "Completed",
+                                          self.dats[2]: "Failed"})
+        with open(path.splitext(self.dats[0])[0] + ".sim") as f:
+            self.assertEqual(f.read(), "statics")
+        failed = [job for job in j.list() if job["Status"] == "Failed"][0]
+        self.assertEqual(failed["Status string"], "stub failure")
+
+    def test_telemetry_of_rerun_file(self):
+        telemetry = JobTelemetry()
+        for _ in range(2):
+            j = Jobs(backend=LocalBackend(_stub_runner, processes=1), verbose=False,
+                     telemetry=telemetry)
+            j.add_file(self.dats[0])
+            j.run(wait=True)
+        # a backend that still lists the first run
+        backend = LocalBackend(_stub_runner, processes=1)
+        backend.run(self.dats[:1], wait=True)
+        time.sleep(0.02)
+        for _ in range(2):
+            j = Jobs(backend=backend, verbose=False, telemetry=telemetry)
+            j.add_file(self.dats[0])
+            j.run(wait=True)
+        self.assertListEqual([r["id"] for r in telemetry.records()], ["1", "1", "2", "3"])
+        summary = telemetry.summary()
+        self.assertEqual(summary["jobs"], 4)
+        self.assertGreaterEqual(summary["run_time"]["min"], 0.0)
+        self.assertGreaterEqual(summary["queue_latency"]["min"], 0.0)
+
+    def test_last_job_of_rerun_file(self):
+        backend = LocalBackend(_stub_runner, processes=1)
+        backend.run(self.dats[:2])
+        backend.run(self.dats[:1])
+        self.assertEqual(backend.last_job(self.dats[0])["ID"], "3")
+        self.assertEqual(backend.last_job(self.dats[1])["ID"], "2")
+        self.assertIsNone(backend.future(self.dats[0]).exception())
+        backend.wait()
+        with self.assertRaises(OFXError):
+            backend.last_job(self.dats[2])
+
+    def test_cache_skips_unchanged_jobs(self):
+        cache_path = path.join(self._temp_dir, "cache.json")
+
+        def run():
+            j = Jobs(backend=LocalBackend(_stub_runner, processes=2),
+                     cache=JobCache(cache_path, version="test"))
+            for dat in self.dats[:2]:
+                j.add_file(dat)
+            j.run(wait=True)
+            return j
+
+        self.assertListEqual(run().submitted, self.dats[:2])
+        self.assertListEqual(run().skipped, self.dats[:2])
+        with open(self.dats[1], "w") as f:
+            f.write("changed")
+        j = run()
+        self.assertListEqual(j.submitted, self.dats[1:2])
+        self.assertListEqual(j.skipped, self.dats[:1])
+
+    def test_referenced_files(self):
+        waves = path.join(self._temp_dir, "wave train.txt")
+        open(waves, "w").close()
+        with open(self.dats[0], "w") as f:
+            f.write("Vessel:\n  Description: {}\n  WaveFile: wave train.txt\n"
+                    "  Other: missing.csv\n".format("x" * 50000))
+        start = time.time()
+        self.assertListEqual(referenced_files(self.dats[0]), [waves])
+        self.assertLess(time.time() - start, 1.0)
+
+    def test_run_async(self):
+        j = Jobs(backend=LocalBackend(_stub_runner, processes=2))
+        for dat in self.dats:
+            j.add_file(dat)
+
+        async def finished():
+            done = []
+            for future in asyncio.as_completed(run_async(j)):
+                try:
+                    done.append((await future)["File"])
+                except OFXError:
+                    done.append("failed")
+            return done
+
+        done = asyncio.new_event_loop().run_until_complete(finished())
+        j.backend.wait()
+        self.assertListEqual(sorted(done), sorted(self.dats[:2] + ["failed"]))
+
+
+    def test_pipeline_resumes(self):
+        state_path = path.join(self._temp_dir, "state.json")
+
+        def pipeline():
+            p = Pipeline(state_path, _stub_post_process,
+                         LocalBackend(_stub_runner, 2), LocalBackend(_stub_runner, 2),
+                         limits={"statics": 2, "dynamics": 1, "post": 1})
+            for dat in self.dats:
+                p.add_file(dat)
+            return p
+
+        summary = pipeline().run()
+        self.assertDictEqual(dict(summary), {"post": 2, "failed statics": 1})
+        result = path.splitext(self.dats[0])[0] + ".sim.txt"
+        with open(result) as f:
+            self.assertEqual(f.read(), "dynamics")
+        os.remove(result)
+        self.assertDictEqual(dict(pipeline().run()), dict(summary))
+        self.assertFalse(path.exists(result))
+
+    def test_cluster_requeues_expired_lease(self):
+        backend = ClusterBackend(lease_time=0.5)
+        j = Jobs(backend=backend)
+        for dat in self.dats:
+            j.add_file(dat)
+        j.run()
+        self.assertEqual(backend.address[0], "127.0.0.1")
+        # a node that takes a job and dies without a heartbeat
+        crashed = _request(backend.address, {"op": "lease", "worker": "crashed"})
+        # requeued by the server without anything asking the backend
+        time.sleep(1.0)
+        self.assertEqual(backend.jobs[crashed["job"]["id"]]["Status"], "Pending")
+        workers = [ClusterWorker(backend.address, _stub_runner, "node{}".format(n), 0.05)
+                   for n in range(2)]
+        for worker in workers:
+            worker.start()
+        try:
+            backend.wait()
+        finally:
+            for worker in workers:
+                worker.stop()
+            backend.stop()
+        self.assertDictEqual(j.status(), {self.dats[0]: "Completed",
+                                          self.dats[1]: "Completed",
+                                          self.dats[2]: "Failed"})
+        requeued = backend.jobs[crashed["job"]["id"]]
+        self.assertEqual(requeued["Attempts"], 2)
+        self.assertIn(requeued["Name of machine"], ["node0", "node1"])
+        self.assertEqual(sum(worker.completed for worker in workers), 3)
+
+    def test_add_files(self):
+        j = Jobs(backend=LocalBackend(_stub_runner))
+        j.add_files(self.dats + [self.dats[0]], variables=[1, 2, 3, 4])
+        j.add_file(self.dats[1])
+        self.assertListEqual(list(j), list(zip(self.dats, [1, 2, 3])))
+        with self.assertRaises(OFXError):
+            j.add_files([path.join(self._temp_dir, "missing.dat"), self.dats[0]])
+        self.assertEqual(len(j.jobs), 3)
+
+    def test_missing_file(self):
+        j = Jobs(backend=LocalBackend(_stub_runner))
+        with self.assertRaises(OFXError):
+            j.add_file(path.join(self._temp_dir, "missing.dat"))
+
+
+class TestJobMonitor(unittest.TestCase):
+
+    def listing(self, *statuses):
+        return "\n\n".join(
+            "{0},\\\\server\\case_{0}.dat,user,{1},,,node{0},,,,".format(n, status)
+            for n, status in enumerate(statuses, 1))
+
+    def test_parse_job_list(self):
+        jobs = list(parse_job_list(self.listing("Running", "Completed")))
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(jobs[0]["File"], r"\\server\case_1.dat")
+        self.assertEqual(jobs[1]["Status"], "Completed")
+        self.assertEqual(jobs[1]["Name of machine"], "node2")
+
+    def test_only_changes_reported(self):
+        monitor = JobMonitor()
+        events = []
+        monitor.on_change(lambda job, old: events.append((job["ID"], old, job["Status"])))
+        monitor.update(self.listing("Pending", "Running"))
+        monitor.update(self.listing("Running", "Running"))
+        monitor.update(self.listing("Completed", "Running"))
+        self.assertListEqual(events, [("1", None, "Pending"), ("2", None, "Running"),
+                                      ("1", "Pending", "Running"),
+                                      ("1", "Running", "Completed")])
+        self.assertEqual(monitor.counts["Running"], 1)
+        self.assertFalse(monitor.done)
+        monitor.update(self.listing("Completed"))
+        self.assertTrue(monitor.done)
+        self.assertListEqual(list(monitor.table), ["1"])
+
+    def test_telemetry(self):
+        telemetry = JobTelemetry()
+        telemetry.submitted(["a.dat", "b.dat", "c.dat"], at=0.0)
+        start = "2026-01-01 00:00:{:02d}"
+        t0 = time.mktime((2026, 1, 1, 0, 0, 0, 0, 0, -1))
+        telemetry.update([
+            {"ID": "1", "File": "a.dat", "Status": "Completed", "Start Time": start.format(10),
+             "Completed Time": start.format(40), "Name of machine": "node1"},
+            {"ID": "2", "File": "b.dat", "Status": "Completed", "Start Time": start.format(20),
+             "Completed Time": start.format(30), "Name of machine": "node2"},
+            {"ID": "3", "File": "c.dat", "Status": "Pending"}])
+        summary = telemetry.summary()
+        self.assertEqual(summary["statuses"], {"Completed": 2, "Pending": 1})
+        self.assertEqual(summary["run_time"]["max"], 30)
+        self.assertAlmostEqual(summary["queue_latency"]["min"], t0 + 10)
+        self.assertEqual(summary["machines"]["node2"]["jobs_per_hour"], 360)
+        prometheus = path.join(tempfile.mkdtemp(), "jobs.prom")
+        telemetry.write_prometheus(prometheus)
+        with open(prometheus) as f:
+            text = f.read()
+        self.assertIn('pyofx_jobs_per_hour{machine="node1"} 120.0', text)
+        self.assertIn('pyofx_job_run_seconds_count{machine="node2"} 1', text)
+        shutil.rmtree(path.dirname(prometheus))
+
+
+class _PolledBackend(object):
+    """a backend without futures whose jobs finish one per listing"""
+
+    def __init__(self):
+        self.listings = 0
+        self.files = []
+
+    def check_file(self, filepath):
+        return filepath
+
+    def add(self, filepath):
+        pass
+
+    def run(self, filepaths, wait=False, statics=False):
+        self.files = filepaths
+
+    def list(self):
+        self.listings += 1
+        yield {"ID": "0", "File": "a.dat", "Status": "Completed"}
+        for n, filepath in enumerate(self.files, 1):
+            status = "Completed" if n < self.listings else "Running"
+            yield {"ID": str(n), "File": filepath, "Status": status}
+
+
+class _BrokenBackend(_PolledBackend):
+    """a backend whose server goes down after the jobs are submitted"""
+
+    def list(self):
+        self.listings += 1
+        if self.listings > 1:
+            raise OFXError("server down")
+        return iter([])
+
+
+class TestAsyncPolledJobs(unittest.TestCase):
+
+    def test_run_async_polls(self):
+        j = Jobs(backend=_PolledBackend())
+        for name in ["a.dat", "b.dat"]:
+            j.add_file(name)
+
+        async def finished():
+            futures = run_async(j, interval=0.01)
+            self.assertFalse(any(f.done() for f in futures))
+            return [job["ID"] for job in await asyncio.gather(*futures)]
+
+        self.assertListEqual(asyncio.new_event_loop().run_until_complete(finished()),
+                             ["1", "2"])
+
+    def test_run_async_polling_fails(self):
+        j = Jobs(backend=_BrokenBackend())
+        j.add_file("a.dat")
+
+        async def finished():
+            return await asyncio.wait_for(run_async(j, interval=0.01)[0], 10)
+
+        with self.assertRaisesRegex(OFXError, "server down"):
+            asyncio.new_event_loop().run_until_complete(finished())
+
 
 if __name__ == '__main__':
     if check_licence: